@@ -117,11 +117,39 @@ String read_zone_status() {
   return status_message;
 }
 
+// A framed client that sends nothing for CLIENT_IDLE_TIMEOUT milliseconds is closed, so idle
+// pooled connections cannot hold every socket of the shield.  Longer than the services' 30 seconds.
+const unsigned long CLIENT_IDLE_TIMEOUT = 60000;
+unsigned long client_last_used[MAX_SOCK_NUM];
+
+void close_idle_clients() {
+  unsigned long now = millis();
+  for (uint8_t sock = 0; sock < MAX_SOCK_NUM; sock++) {
+    EthernetClient idle_client(sock);
+    if (!idle_client.connected()) {
+      // A new connection is timed from when it was first seen
+      client_last_used[sock] = now;
+    }
+    else if (now - client_last_used[sock] > CLIENT_IDLE_TIMEOUT) {
+      idle_client.stop();
+    }
+  }
+}
+
+// True when the client ended its request with a newline and keeps the connection open
+boolean keep_alive = false;
+
 String read_message(EthernetClient& client) {
   String incoming_message = "";
+  keep_alive = false;
 
   char nextChar = client.read();
   while (nextChar != -1) {
+    if (nextChar == '\n') {
+      // Framed request.  Leave any pipelined requests in the buffer.
+      keep_alive = true;
+      break;
+    }
     incoming_message += nextChar;
     nextChar = client.read();
   }
@@ -145,6 +173,7 @@ void loop()
   if (client == true) {
     // Turn on on-board LED
     digitalWrite(13, HIGH);
+    client_last_used[client.getSocketNumber()] = millis();
     
     // Received message, restart counter
     reset_timeout = server_reset_timeout;
@@ -188,11 +217,20 @@ void loop()
     else if (message == "status") {
       client.println(read_zone_status());
     }
-    
-    client.stop();
+    else if (keep_alive) {
+      // Framed clients wait for a reply
+      client.println("unknown");
+    }
+
+    // One-shot clients expect the connection to close after the reply
+    if (!keep_alive) {
+      client.stop();
+    }
     // Turn off on-board LED
     digitalWrite(13, LOW);
   }
+
+  close_idle_clients();
   
   monitor_running_cycle();
   
@@ -0,0 +1,68 @@
+"""
+__main__.py
+Run the benchmarks and write a JSON report
+
+    python -m benchmarks --output report.json
+    python -m benchmarks --suite controllers --compare last_release.json
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from benchmarks.runner import write_report, compare, report
+import argparse
+import importlib
+import json
+import sys
+
+
+SUITES = ["controllers", "database", "history", "rest", "schedule"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="House service benchmarks")
+    parser.add_argument("--suite", action="append", choices=SUITES,
+                        help="Suite to run.  Repeat for several.  Default: all")
+    parser.add_argument("--iterations", type=int, help="Calls per thread")
+    parser.add_argument("--output", default="bench_report.json", help="JSON report path")
+    parser.add_argument("--label", help="Release or commit the report belongs to")
+    parser.add_argument("--compare", help="Earlier report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed p50 growth")
+    args = parser.parse_args()
+
+    results = list()
+    for suite in args.suite or SUITES:
+        module = importlib.import_module("benchmarks.bench_%s" % suite)
+        kwargs = {"iterations": args.iterations} if args.iterations else {}
+        for result in module.run(**kwargs):
+            print "%-48s c=%-3s rows=%-7s p50=%8s ms  p99=%8s ms  %8s/s  errors=%s" % (
+                result["name"][:48], result["concurrency"], result.get("rows", "-"), result["p50_ms"],
+                result["p99_ms"], result["throughput"], result["errors"])
+            results.append(result)
+
+    write_report(results, args.output, args.label)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(baseline, report(results), threshold=args.threshold)
+        for name, before, after, change in regressions:
+            print "REGRESSION %s: %s ms -> %s ms (%+.0f%%)" % (name, before, after, 100 * change)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
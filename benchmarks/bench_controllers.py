@@ -0,0 +1,64 @@
+"""
+bench_controllers.py
+Controller round trip benchmarks
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from benchmarks.runner import measure
+from house.alarm import zones
+from house.irrigation import sprinkler
+from house.controllers.transport import close_pools
+from house.simulator.alarm import AlarmSimulator
+from house.simulator.sprinkler import SprinklerSimulator
+
+
+# Measure the service, not the Ethernet shield's socket limit
+BENCH_SOCKETS = 64
+
+
+def start_controllers():
+    """
+    Start the simulated alarm and irrigation controllers
+    """
+    alarm = AlarmSimulator(sockets=BENCH_SOCKETS)
+    alarm.set_zone(3, 1)
+    alarm.set_zone(9, 1)
+    return alarm.start(), SprinklerSimulator(sockets=BENCH_SOCKETS).start()
+
+
+def run(iterations=200, concurrency=(1, 4)):
+    """
+    Measure get_zone_status, sprinkler_state and sprinkler_control against the simulated controllers
+    """
+    alarm, irrigation = start_controllers()
+    results = list()
+    try:
+        for threads in concurrency:
+            results.append(measure("zones.get_zone_status", lambda: zones.get_zone_status(alarm.host, alarm.port),
+                                   iterations=iterations, concurrency=threads))
+            results.append(measure("sprinkler.sprinkler_state",
+                                   lambda: sprinkler.sprinkler_state(irrigation.host, irrigation.port),
+                                   iterations=iterations, concurrency=threads))
+            results.append(measure("sprinkler.sprinkler_control",
+                                   lambda: sprinkler.sprinkler_control(1, "on", irrigation.host, irrigation.port),
+                                   iterations=iterations, concurrency=threads))
+    finally:
+        close_pools()
+        alarm.stop()
+        irrigation.stop()
+
+    return results
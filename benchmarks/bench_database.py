@@ -0,0 +1,81 @@
+"""
+bench_database.py
+Per call latency of the service_data queries
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from benchmarks.runner import measure
+from benchmarks.bench_history import prepare_schema, sample, seed, HISTORY_COLUMNS
+from house.data import service_data
+from datetime import datetime
+import os
+import shutil
+import tempfile
+
+
+# Samples per transaction with the history writer
+BATCH = 32
+
+
+def history_sample():
+    """
+    update_history() data for one sample
+    """
+    return dict(zip(HISTORY_COLUMNS, sample(datetime.now())))
+
+
+def calls():
+    """
+    (name, function) of each query.  Readers first, then writers.
+    """
+    now = datetime.now()
+    return [("service_data.get_status", service_data.get_status),
+            ("service_data.get_cycle_durations", lambda: service_data.get_cycle_durations(1)),
+            ("service_data.check_schedule", lambda: service_data.check_schedule(now)),
+            ("service_data.get_schedule", service_data.get_schedule),
+            ("service_data.retrieve_history", service_data.retrieve_history),
+            ("service_data.update_status", lambda: service_data.update_status("Running Cycle")),
+            ("service_data.add_cycle", lambda: service_data.add_cycle(1, now, "[30, 30, 0, 0]")),
+            ("service_data.update_history", lambda: service_data.update_history(history_sample())),
+            ("service_data.write_history 1 sample", lambda: service_data.write_history([history_sample()])),
+            ("service_data.write_history %s samples" % BATCH,
+             lambda: service_data.write_history([history_sample() for _unused in range(BATCH)]))]
+
+
+def run(iterations=200, concurrency=(1, 4), rows=96):
+    """
+    Measure every service_data query in a scratch database holding a day of history.
+    Writers running on several threads show lock contention as errors.
+    """
+    results = list()
+    working_directory = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="house_bench_")
+    try:
+        os.chdir(directory)
+        with service_data.DATABASE.using(os.path.join(directory, "house.db")):
+            prepare_schema()
+            seed(rows)
+            service_data.update_status("Finished Cycle")
+            for name, function in calls():
+                for threads in concurrency:
+                    results.append(measure(name, function, iterations=iterations, concurrency=threads, rows=rows))
+            service_data.flush_history()
+    finally:
+        os.chdir(working_directory)
+        shutil.rmtree(directory)
+
+    return results
@@ -0,0 +1,133 @@
+"""
+bench_history.py
+History query benchmarks
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from benchmarks.runner import measure
+from house.data import service_data
+from house.data.convert_history import to_segments
+from house.data.segments import SegmentStore
+from datetime import datetime, timedelta
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+
+
+# One sample every 15 minutes: a week, a year and three years
+TABLE_SIZES = (96 * 7, 96 * 365, 96 * 365 * 3)
+
+# Ranges asked of retrieve_history_range and the points a chart wants
+RANGE_DAYS = (7, 365)
+RANGE_POINTS = 500
+
+HISTORY_COLUMNS = ["entryDate", "fan_state", "cool_state", "heat_state",
+                   "irrigation_zone1", "irrigation_zone2", "irrigation_zone3", "irrigation_zone4",
+                   "alarm_zone1", "alarm_zone2", "alarm_zone3", "alarm_zone4", "alarm_zone5",
+                   "alarm_zone6", "alarm_zone7", "alarm_zone8", "alarm_zone9",
+                   "inside_temp", "inside_humidity", "outside_temp", "outside_humidity",
+                   "rainfall", "wind_speed"]
+
+
+def sample(entry_date):
+    """
+    A plausible history row
+    """
+    return [entry_date, random.randint(0, 1), random.randint(0, 1), random.randint(0, 1),
+            0, 0, 0, 0, 1, 1, 0, 1, 0, 0, 0, 0, 1,
+            round(random.uniform(65, 75), 1), random.randint(20, 50),
+            round(random.uniform(20, 95), 1), random.randint(10, 90),
+            0.0, round(random.uniform(0, 20), 1)]
+
+
+def seed(rows):
+    """
+    Fill history with rows samples ending now
+    """
+    conn = sqlite3.connect("house.db")
+    now = datetime.now()
+    insert = "INSERT INTO history (%s) VALUES (%s)" % (", ".join(HISTORY_COLUMNS),
+                                                        ", ".join("?" for _unused in HISTORY_COLUMNS))
+    conn.executemany(insert, (sample(now - timedelta(minutes=15 * index)) for index in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def prepare_schema():
+    """
+    Create the tables
+    """
+    service_data.create_database()
+
+
+def first_chunk():
+    """
+    Time to the first rows of a stream over all of history
+    """
+    _unused, chunks = service_data.history_stream()
+    next(chunks, None)
+    chunks.close()
+
+
+def run(iterations=20, concurrency=(1, 4), sizes=TABLE_SIZES):
+    """
+    Measure retrieve_history against tables of realistic sizes
+    """
+    results = list()
+    working_directory = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="house_bench_")
+    try:
+        os.chdir(directory)
+        with service_data.DATABASE.using(os.path.join(directory, "house.db")):
+            prepare_schema()
+            seeded = 0
+            for rows in sizes:
+                seed(rows - seeded)
+                seeded = rows
+                returned = len(service_data.retrieve_history() or [])
+                for threads in concurrency:
+                    results.append(measure("service_data.retrieve_history", service_data.retrieve_history,
+                                           iterations=iterations, concurrency=threads, rows=rows,
+                                           returned=returned))
+                service_data.rebuild_history_rollups()
+                for days in RANGE_DAYS:
+                    end = datetime.now()
+                    start = end - timedelta(days=days)
+                    returned = len(service_data.retrieve_history_range(start, end, RANGE_POINTS)["rows"])
+                    for threads in concurrency:
+                        results.append(measure("service_data.retrieve_history_range %s days" % days,
+                                               lambda: service_data.retrieve_history_range(start, end, RANGE_POINTS),
+                                               iterations=iterations, concurrency=threads, rows=rows,
+                                               returned=returned))
+                results.append(measure("service_data.history_stream first chunk", first_chunk,
+                                       iterations=iterations, concurrency=1, rows=rows))
+                store = SegmentStore(os.path.join(directory, "segments_%s" % rows), service_data.HISTORY_FIELDS)
+                to_segments(store)
+                for days in RANGE_DAYS:
+                    end = datetime.now()
+                    start = end - timedelta(days=days)
+                    results.append(measure("SegmentStore.rows %s days" % days,
+                                           lambda: sum(1 for _unused in store.rows(start, end)),
+                                           iterations=iterations, concurrency=1, rows=rows,
+                                           returned=store.count(start, end)))
+    finally:
+        os.chdir(working_directory)
+        shutil.rmtree(directory)
+
+    return results
@@ -0,0 +1,169 @@
+"""
+bench_rest.py
+REST route benchmarks
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from benchmarks.runner import measure
+from benchmarks.bench_controllers import start_controllers
+from benchmarks.bench_history import prepare_schema, seed
+from house.controllers.transport import close_pools
+import os
+import shutil
+import tempfile
+import time
+
+
+# (method, path) of every route.  /api/events is a stream and is measured through /api/events/poll.
+ROUTES = [("GET", "/api/status"),
+          ("GET", "/api/controllers/status"),
+          ("GET", "/api/database/status"),
+          ("GET", "/api/alarm/status"),
+          ("GET", "/api/alarm/status/cache"),
+          ("GET", "/api/alarm/events?since=0"),
+          ("GET", "/api/alarm/events/last?zone=zone9&state=open"),
+          ("GET", "/api/events/poll?since=0&timeout=0"),
+          ("GET", "/api/irrigation/state"),
+          ("GET", "/api/irrigation/status"),
+          ("PUT", "/api/irrigation/zone/1/on"),
+          ("PUT", "/api/irrigation/cycle/60000"),
+          ("DELETE", "/api/irrigation/cycle/0"),
+          ("GET", "/api/irrigation/cycle/status"),
+          ("GET", "/api/history"),
+          ("PUT", "/api/history"),
+          ("PUT", "/api/message"),
+          ("PUT", "/api/light"),
+          ("DELETE", "/api/light"),
+          ("GET", "/api/light"),
+          ("PUT", "/api/light/color/01/FF/80/00"),
+          ("GET", "/api/environment/inside"),
+          ("GET", "/api/environment/inside/TempHumidity"),
+          ("GET", "/api/environment/inside/status"),
+          ("GET", "/api/environment/inside/running"),
+          ("GET", "/api/environment/inside/fan"),
+          ("PUT", "/api/environment/inside/fan/auto"),
+          ("GET", "/api/environment/inside/away"),
+          ("PUT", "/api/environment/inside/away/false"),
+          ("GET", "/api/environment/outside"),
+          ("GET", "/api/environment/outside/KCOS"),
+          ("GET", "/api/environment/outside/TempHumidity"),
+          ("GET", "/api/environment/outside/wind"),
+          ("GET", "/api/environment/outside/rain")]
+
+WEATHER = {"dt": 0, "main": {"temp": 293.15, "humidity": 40}, "wind": {"speed": 3.5}, "rain": {"3h": 0}}
+
+
+class FakeNest(object):
+    """
+    Stand-in for the Nest cloud so only the service code is measured
+    """
+
+    status = {"shared": {"serial": {"current_temperature": 21.0}},
+              "device": {"serial": {"current_humidity": 35}}}
+
+    def __init__(self, username=None, password=None):
+        pass
+
+    def login(self):
+        pass
+
+    def read_status(self):
+        pass
+
+    def heat_cool_states(self):
+        return {"heat": False, "cool": False}
+
+    def fan(self):
+        return "auto"
+
+    def set_fan(self, state):
+        pass
+
+    def away(self):
+        return False
+
+    def set_away(self, state):
+        pass
+
+    def history_states(self):
+        return {"fan_state": 0, "cool_state": 0, "heat_state": 0, "inside_temp": 70.0, "inside_humidity": 35}
+
+
+def configure(rest_service, alarm, irrigation):
+    """
+    Point the service at the simulated controllers and replace the cloud and hardware services
+    """
+    settings = rest_service.SETTINGS
+    for section, values in (("alarm", {"alarm_host": alarm.host, "alarm_port": str(alarm.port)}),
+                            ("irrigation", {"irrigation_host": irrigation.host,
+                                            "irrigation_port": str(irrigation.port)}),
+                            ("nest", {"user": "bench", "pwd": "bench"}),
+                            ("weather", {"station": "0", "api_key": "bench"}),
+                            ("messaging", {"destination": "", "source_user": "", "source_pwd": "",
+                                           "source_server": "", "source_port": "0"})):
+        if not settings.has_section(section):
+            settings.add_section(section)
+        for option, value in values.items():
+            settings.set(section, option, value)
+
+    weather = dict(WEATHER, dt=time.time())
+    rest_service.Nest = FakeNest
+    rest_service.external.read_weather = lambda *args, **kwargs: weather
+    rest_service.external.read_weather_station = lambda *args, **kwargs: weather
+    # PUT /api/history reads through the names the recorder imported
+    from house.data import recorder
+    recorder.Nest = FakeNest
+    recorder.read_weather = rest_service.external.read_weather
+    rest_service.send_smtp_message = lambda **kwargs: None
+    for name in ("light_on", "light_off", "light_color"):
+        setattr(rest_service, name, lambda *args: None)
+    rest_service.light_toggle = lambda mode: not mode
+
+
+def run(iterations=50, concurrency=(1, 8), routes=ROUTES, history_rows=96 * 7):
+    """
+    Measure every route through the web.py application
+    """
+    from house.services import rest_service
+
+    alarm, irrigation = start_controllers()
+    working_directory = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="house_bench_")
+    results = list()
+    try:
+        os.chdir(directory)
+        prepare_schema()
+        seed(history_rows)
+        configure(rest_service, alarm, irrigation)
+
+        for method, path in routes:
+            def request(method=method, path=path):
+                response = rest_service.app.request(path, method=method, data="bench")
+                if not response.status.startswith("2"):
+                    raise Exception(response.status)
+
+            for threads in concurrency:
+                results.append(measure("%s %s" % (method, path.split("?")[0]), request,
+                                       iterations=iterations, concurrency=threads))
+    finally:
+        os.chdir(working_directory)
+        shutil.rmtree(directory)
+        close_pools()
+        alarm.stop()
+        irrigation.stop()
+
+    return results
@@ -0,0 +1,53 @@
+"""
+bench_schedule.py
+Irrigation schedule benchmarks on a virtual clock
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from benchmarks.runner import summarize
+from house.simulator.fast_forward import fast_forward
+from datetime import datetime
+
+
+# (controllers, max_valves, zone_minutes): the default schedule, then every zone of three controllers
+LAYOUTS = ((1, 1, None), (3, 1, 20), (3, 3, 20))
+
+# Fixed so every run sees the same weekdays and weather
+START = datetime(2016, 5, 1)
+SEED = 1
+
+
+def run(iterations=3, days=30, layouts=LAYOUTS):
+    """
+    Fast-forward the irrigation service through days of schedules.
+    p50_ms is the wall clock milliseconds per simulated day.
+    """
+    results = list()
+    for controllers, max_valves, zone_minutes in layouts:
+        latencies = list()
+        elapsed = 0.0
+        for _unused in range(iterations):
+            result = fast_forward(days, START, controllers, max_valves, zone_minutes, SEED)
+            latencies.append(result["seconds"] / days)
+            elapsed += result["seconds"]
+        summary = summarize("irrigation_service.service %s controllers %s valves" % (controllers, max_valves),
+                            latencies, 0, elapsed, 1, days=days, cycles=result["cycles"],
+                            controller_requests=result["controller_requests"])
+        summary["throughput"] = round(days * iterations / elapsed, 2) if elapsed > 0 else None
+        summary["days_per_second"] = summary["throughput"]
+        results.append(summary)
+    return results
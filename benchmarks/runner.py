@@ -0,0 +1,140 @@
+"""
+runner.py
+Latency and throughput measurement for the benchmarks
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from threading import Thread, Lock
+import json
+import math
+import platform
+import sys
+import time
+
+
+def percentile(ordered, fraction):
+    """
+    Nearest rank percentile of a sorted list
+    """
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(math.ceil(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(name, latencies, errors, elapsed, concurrency, **extra):
+    """
+    Reduce the raw latencies to the report entry.  Times are in milliseconds.
+    """
+    ordered = sorted(latencies)
+    count = len(ordered)
+    result = {"name": name,
+              "concurrency": concurrency,
+              "requests": count,
+              "errors": errors,
+              "seconds": round(elapsed, 4),
+              "throughput": round(count / elapsed, 2) if elapsed > 0 else None,
+              "mean_ms": round(1000 * sum(ordered) / count, 3) if count else None,
+              "min_ms": round(1000 * ordered[0], 3) if count else None,
+              "max_ms": round(1000 * ordered[-1], 3) if count else None}
+    for label, fraction in (("p50_ms", .5), ("p90_ms", .9), ("p99_ms", .99)):
+        value = percentile(ordered, fraction)
+        result[label] = round(1000 * value, 3) if value is not None else None
+    result.update(extra)
+    return result
+
+
+def measure(name, function, iterations=200, concurrency=1, warmup=5, **extra):
+    """
+    Call function iterations times on each of concurrency threads and summarize the latencies
+    """
+    for _unused in range(warmup):
+        try:
+            function()
+        except Exception:
+            pass
+
+    latencies = list()
+    errors = [0]
+    lock = Lock()
+
+    def worker():
+        local = list()
+        failed = 0
+        for _unused in range(iterations):
+            started = time.time()
+            try:
+                function()
+            except Exception:
+                failed += 1
+                continue
+            local.append(time.time() - started)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [Thread(group=None, target=worker, name="bench_%s" % index) for index in range(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    return summarize(name, latencies, errors[0], elapsed, concurrency, **extra)
+
+
+def report(results, label=None):
+    """
+    Machine readable report
+    """
+    return {"label": label,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "results": results}
+
+
+def write_report(results, path, label=None):
+    """
+    Write the report as JSON
+    """
+    with open(path, "w") as report_file:
+        json.dump(report(results, label), report_file, indent=2, sort_keys=True)
+
+
+def result_key(result):
+    """
+    Identify a benchmark across reports
+    """
+    return result["name"], result["concurrency"], result.get("rows")
+
+
+def compare(baseline, current, metric="p50_ms", threshold=0.10):
+    """
+    Return (name, baseline, current, change) for each benchmark whose metric grew more than threshold
+    """
+    before = dict((result_key(result), result) for result in baseline["results"])
+    regressions = list()
+    for result in current["results"]:
+        previous = before.get(result_key(result))
+        if previous is None or not previous.get(metric) or result.get(metric) is None:
+            continue
+        change = (result[metric] - previous[metric]) / float(previous[metric])
+        if change > threshold:
+            regressions.append((result["name"], previous[metric], result[metric], change))
+    return regressions
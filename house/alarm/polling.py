@@ -0,0 +1,94 @@
+"""
+polling.py
+Adaptive poll interval and zone debouncing for the alarm monitor
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.controllers.state import iter_bits
+
+
+class AdaptiveInterval(object):
+    """
+    AdaptiveInterval backs off the poll interval while nothing changes
+    and drops back to the minimum right after a transition.
+    """
+
+    def __init__(self, min_interval=.2, max_interval=1.0, backoff=1.5):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = backoff
+        self.interval = min_interval
+
+    def next(self, active):
+        """
+        Return the time until the next poll
+        """
+        if active:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        return self.interval
+
+
+class ZoneDebouncer(object):
+    """
+    ZoneDebouncer reports a zone change once the zone has held its new state for the zone's window.
+    A zone that goes back before its window ends was chattering and is not reported.
+    """
+
+    def __init__(self, keys, windows=None, default_window=0.0):
+        windows = windows or dict()
+        self.windows = [windows.get(key, default_window) for key in keys]
+        self.reported = None
+        self.pending = 0
+        self.since = [0.0 for _unused in keys]
+
+    def update(self, bits, now):
+        """
+        Take a reading.  Return the mask of zones whose change should be reported now.
+        """
+        # The first reading is the baseline
+        if self.reported is None:
+            self.reported = bits
+            return 0
+
+        changed = bits ^ self.reported
+        if not changed and not self.pending:
+            return 0
+
+        # Zones that went back are chatter
+        self.pending &= changed
+        for index in iter_bits(changed & ~self.pending):
+            self.since[index] = now
+        self.pending |= changed
+
+        report = 0
+        for index in iter_bits(self.pending):
+            if now - self.since[index] >= self.windows[index]:
+                report |= 1 << index
+
+        self.pending &= ~report
+        self.reported ^= report
+        return report
+
+    def deadline(self):
+        """
+        Time the next pending zone settles, or None
+        """
+        if not self.pending:
+            return None
+        return min(self.since[index] + self.windows[index] for index in iter_bits(self.pending))
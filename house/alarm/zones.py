@@ -18,7 +18,8 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from socket import socket, AF_INET, SOCK_STREAM
+from house.controllers.transport import send_request
+from house.controllers.state import ZoneState
 
 # Setup of the house sensors
 ZONES = ["zone%s" % zone_number for zone_number in range(1, 10)]
@@ -39,31 +40,48 @@ def get_zone_state(alarm_host, alarm_port):
     Read the alarm data from the arduino
     """
 
-    s = socket(AF_INET, SOCK_STREAM)
-    s.connect((alarm_host, alarm_port))
-    s.sendall("status")
-
-    data_buffer = ""
-
-    # Receive the response
-    while True:
-        data = s.recv(2048)
-        if not data:
-            break
-        data_buffer += data
-
-    s.close()
+    data_buffer = send_request("status", alarm_host, alarm_port)
 
     # Data from the arduino is returned in this format "0:0:1:0:0:0:0:1"
-    # Create a dictionary with the zone names as the key
-    return dict(zip(ZONES, data_buffer.strip().split(":")))
+    # Pack it into a bitmask with one bit per zone
+    return ZoneState.parse(ZONES, data_buffer.strip())
 
 
 def get_zone_status(alarm_host, alarm_port):
     """
     Returns current status of the alarm system
     """
-    return [{"zone": zone_key,
-             "description": ZONE_DEFINITIONS.get(zone_key, "unknown"),
-             "status": ZONE_STATE_TEXT[zone_key][int(status)]}
-            for zone_key, status in get_zone_state(alarm_host, alarm_port).items()]
\ No newline at end of file
+    return get_zone_state(alarm_host, alarm_port).status(ZONE_DEFINITIONS, ZONE_STATE_TEXT)
+
+def alarm_controllers(settings):
+    """
+    Return the (host, port) of each alarm controller.
+    [alarm] controllers = host:port, host:port  or  alarm_host and alarm_port
+    """
+    if settings.has_option("alarm", "controllers"):
+        return [tuple(controller.strip().split(":"))
+                for controller in settings.get("alarm", "controllers").split(",")]
+    return [(settings.get("alarm", "alarm_host"), settings.get("alarm", "alarm_port"))]
+
+
+def controllers_state(controllers, read_state=get_zone_state):
+    """
+    Zone values of every controller numbered in order: controller 1 has zone1-zone9, controller 2 has
+    zone10-zone18...  Each controller is read once.
+    """
+    states = dict()
+    for index, (host, port) in enumerate(controllers):
+        for position, (_key, value) in enumerate(read_state(host, port).items()):
+            states["zone%s" % (index * len(ZONES) + position + 1)] = value
+    return states
+
+
+def controllers_status(controllers, read_status=get_zone_status):
+    """
+    Status of every zone of every controller, numbered as controllers_state does
+    """
+    status = list()
+    for index, (host, port) in enumerate(controllers):
+        for position, zone in enumerate(read_status(host, port)):
+            status.append(dict(zone, zone="zone%s" % (index * len(ZONES) + position + 1)))
+    return status
@@ -0,0 +1,3 @@
+"""
+house.controllers
+"""
\ No newline at end of file
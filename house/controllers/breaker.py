@@ -0,0 +1,237 @@
+"""
+breaker.py
+Retry with backoff and a circuit breaker per controller
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.services.settings import get_setting
+from socket import error as socket_error
+from threading import Lock
+import logging
+import random
+import time
+
+
+# [retry] sets the retry policy of every controller.  A [retry host:port] section overrides it for one.
+RETRY_OPTIONS = ("attempts", "base_delay", "max_delay", "jitter", "budget")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Errors that count against a controller.  socket.timeout is a socket.error.
+# Anything else is raised without a retry and leaves the breaker as it was.
+CONTROLLER_ERRORS = (socket_error,)
+
+
+class ControllerUnavailable(Exception):
+    """
+    The controller is known to be down.  Raised without contacting it.
+    """
+    pass
+
+
+class RetryPolicy(object):
+    """
+    attempts: calls before giving up
+    base_delay: seconds before the first retry.  Doubles for each retry up to max_delay.
+    jitter: fraction of the delay added or removed at random
+    budget: seconds a call may spend retrying in total
+    """
+
+    def __init__(self, attempts=3, base_delay=0.2, max_delay=2.0, jitter=0.5, budget=3.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.budget = budget
+
+    def delay(self, retry):
+        """
+        Seconds to wait before retry number retry (1 based)
+        """
+        delay = min(self.max_delay, self.base_delay * (2 ** (retry - 1)))
+        return max(0.0, delay * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
+class CircuitBreaker(object):
+    """
+    Opens after failure_threshold consecutive failures.  While open, calls fail with
+    ControllerUnavailable.  After reset_timeout seconds one trial call is let through
+    (half open).  It closes the breaker if it succeeds and reopens it if it fails.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0, clock=time.time):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.lock = Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.last_failure = None
+        self.last_error = None
+        self.rejected = 0
+
+    def allow(self):
+        """
+        Raise ControllerUnavailable unless a call may go to the controller now
+        """
+        with self.lock:
+            if self.state == OPEN and self.clock() - self.opened >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.trial = False
+            if self.state == HALF_OPEN and not self.trial:
+                self.trial = True
+                return
+            if self.state != CLOSED:
+                self.rejected += 1
+                raise ControllerUnavailable("%s is unavailable: %s" % (self.name, self.last_error))
+
+    def success(self):
+        """
+        Record a successful call
+        """
+        with self.lock:
+            if self.state != CLOSED:
+                logging.info("Controller %s is available again", self.name)
+            self.state = CLOSED
+            self.failures = 0
+            self.trial = False
+
+    def failure(self, error):
+        """
+        Record a failed call
+        """
+        with self.lock:
+            self.failures += 1
+            self.last_failure = self.clock()
+            self.last_error = str(error) or error.__class__.__name__
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logging.warning("Controller %s is unavailable: %s", self.name, self.last_error)
+                self.state = OPEN
+                self.opened = self.clock()
+                self.trial = False
+
+    def abandon(self):
+        """
+        A call ended without telling if the controller works.  Let another trial call through.
+        """
+        with self.lock:
+            self.trial = False
+
+    def is_open(self):
+        return self.state == OPEN
+
+    def status(self):
+        """
+        Breaker state for the status endpoint
+        """
+        with self.lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = round(max(0.0, self.opened + self.reset_timeout - self.clock()), 1)
+            return {"controller": self.name,
+                    "state": self.state,
+                    "failures": self.failures,
+                    "rejected": self.rejected,
+                    "last_failure": self.last_failure,
+                    "last_error": self.last_error,
+                    "retry_in": retry_in}
+
+    def call(self, policy, function, *args):
+        """
+        Call function(*args) through the breaker, retrying CONTROLLER_ERRORS with backoff
+        """
+        started = self.clock()
+        retry = 0
+        while True:
+            self.allow()
+            try:
+                result = function(*args)
+            except CONTROLLER_ERRORS, ex:
+                self.failure(ex)
+                retry += 1
+                if retry >= policy.attempts or self.is_open():
+                    raise
+                delay = policy.delay(retry)
+                if self.clock() + delay - started > policy.budget:
+                    raise
+                logging.debug("Retrying %s in %.2f s: %s", self.name, delay, ex)
+                time.sleep(delay)
+            except Exception:
+                self.abandon()
+                raise
+            else:
+                self.success()
+                return result
+
+
+_BREAKERS = dict()
+_BREAKERS_LOCK = Lock()
+
+
+def get_breaker(host, port):
+    """
+    Return the shared circuit breaker for a controller
+    """
+    key = (host, int(port))
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(key)
+        if breaker is None:
+            breaker = _BREAKERS[key] = CircuitBreaker("%s:%s" % key)
+        return breaker
+
+
+_POLICIES = dict()
+_POLICIES_LOCK = Lock()
+
+
+def configured_policy(host, port, default):
+    """
+    Retry policy of a controller from the settings.  Options left out keep the values of default.
+    """
+    options = dict()
+    for option in RETRY_OPTIONS:
+        value = get_setting("retry", option, getattr(default, option))
+        options[option] = get_setting("retry %s:%s" % (host, port), option, value)
+    return RetryPolicy(**options)
+
+
+def get_retry_policy(host, port, default=None):
+    """
+    Return the shared retry policy for a controller.  It is read from the settings the first time,
+    with default, or RetryPolicy(), for the options they leave out.
+    """
+    key = (host, int(port))
+    with _POLICIES_LOCK:
+        policy = _POLICIES.get(key)
+        if policy is None:
+            policy = _POLICIES[key] = configured_policy(host, port, default or RetryPolicy())
+        return policy
+
+
+def breaker_status():
+    """
+    State of every controller breaker
+    """
+    with _BREAKERS_LOCK:
+        breakers = sorted(_BREAKERS.values(), key=lambda breaker: breaker.name)
+    return [breaker.status() for breaker in breakers]
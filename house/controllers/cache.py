@@ -0,0 +1,108 @@
+"""
+cache.py
+Short lived cache for controller reads
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from threading import Event, Lock
+import sys
+import time
+
+
+class Flight(object):
+    """
+    A controller read in progress that other callers can wait on
+    """
+
+    def __init__(self):
+        self.finished = Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlightCache(object):
+    """
+    SingleFlightCache holds the last value read for each set of arguments for ttl seconds.
+    Callers that arrive while a read is in progress wait for that read instead of starting another.
+    """
+
+    def __init__(self, loader, ttl=0.5, clock=time.time):
+        self.loader = loader
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = Lock()
+        self.entries = dict()
+        self.flights = dict()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, *args):
+        """
+        Return the cached value or read it
+        """
+        with self.lock:
+            entry = self.entries.get(args)
+            if entry is not None and entry[0] > self.clock():
+                self.hits += 1
+                return entry[1]
+
+            flight = self.flights.get(args)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                flight = self.flights[args] = Flight()
+                leader = True
+
+        if not leader:
+            flight.finished.wait()
+            if flight.error is not None:
+                raise flight.error[0], flight.error[1], flight.error[2]
+            return flight.value
+
+        try:
+            flight.value = self.loader(*args)
+        except Exception:
+            flight.error = sys.exc_info()
+            raise
+        finally:
+            with self.lock:
+                del self.flights[args]
+                if flight.error is None:
+                    self.entries[args] = (self.clock() + self.ttl, flight.value)
+            flight.finished.set()
+
+        return flight.value
+
+    def clear(self):
+        """
+        Drop the cached values
+        """
+        with self.lock:
+            self.entries = dict()
+
+    def stats(self):
+        """
+        Return the hit/miss counters
+        """
+        with self.lock:
+            return {"ttl": self.ttl,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "coalesced": self.coalesced}
@@ -0,0 +1,323 @@
+"""
+client.py
+Non-blocking client for every house controller.  Calls return futures so one
+caller can talk to several devices at once and wait only for the slowest.
+Each call runs the controller module's own function, so the protocol is written once.
+
+    client = ControllerClient()
+    alarm = client.zone_state(alarm_host, alarm_port)
+    irrigation = client.sprinkler_state(irrigation_host, irrigation_port)
+    weather = client.read_weather(station, api_key)
+    alarm_state, irrigation_state, weather_data = gather([alarm, irrigation, weather], timeout=5)
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.controllers.workers import WorkerPool, TaskTimeout
+from house.controllers.transport import DEFAULT_TIMEOUT, send_request, send_requests
+from house.alarm import zones
+from house.irrigation import sprinkler
+from house.services import light
+from house.environment import external
+from threading import Event, Lock
+import sys
+import time
+
+
+class CancelledError(Exception):
+    """
+    The call was cancelled before it finished
+    """
+
+
+class Future(object):
+    """
+    The outcome of a call that has not finished yet.
+    Same interface as a worker Task: done(), cancel() and result(timeout).
+    """
+
+    def __init__(self, on_cancel=None):
+        self.finished = Event()
+        self.lock = Lock()
+        self.value = None
+        self.error = None
+        self.cancelled = False
+        self.on_cancel = on_cancel
+        self.callbacks = list()
+
+    def set_result(self, value):
+        self._finish(value, None)
+
+    def set_error(self, error):
+        """
+        error is an exception instance or sys.exc_info()
+        """
+        if not isinstance(error, tuple):
+            error = (error.__class__, error, None)
+        self._finish(None, error)
+
+    def _finish(self, value, error):
+        with self.lock:
+            if self.finished.is_set():
+                return
+            self.value, self.error = value, error
+            self.finished.set()
+            callbacks, self.callbacks = self.callbacks, list()
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """
+        Call callback(future) when the future finishes.  Runs now if it already has.
+        """
+        with self.lock:
+            if not self.finished.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self):
+        """
+        Abandon the call.  Returns False if it already finished.
+        """
+        if self.done():
+            return False
+        self.cancelled = True
+        if self.on_cancel is not None:
+            self.on_cancel()
+        self.set_error(CancelledError("Call was cancelled"))
+        return True
+
+    def done(self):
+        return self.finished.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the call and return its value or raise its error
+        """
+        if not self.finished.wait(timeout):
+            raise TaskTimeout("Call did not finish in %s seconds" % timeout)
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.value
+
+
+def then(future, function):
+    """
+    Future of function(result) once future finishes.  Errors pass through.
+    """
+    chained = Future(on_cancel=future.cancel)
+
+    def finished(source):
+        if source.error is not None:
+            chained.set_error(source.error)
+            return
+        try:
+            chained.set_result(function(source.value))
+        except Exception:
+            chained.set_error(sys.exc_info())
+
+    future.add_done_callback(finished)
+    return chained
+
+
+def then_all(futures):
+    """
+    Future of the list of results of futures.  The first error fails it and cancels the others.
+    """
+    def cancel():
+        for future in futures:
+            future.cancel()
+
+    combined = Future(on_cancel=cancel)
+    remaining = [len(futures)]
+    lock = Lock()
+
+    def finished(source):
+        if source.error is not None:
+            combined.set_error(source.error)
+            cancel()
+            return
+        with lock:
+            remaining[0] -= 1
+            complete = remaining[0] == 0
+        if complete:
+            combined.set_result([future.value for future in futures])
+
+    if not futures:
+        combined.set_result([])
+    for future in futures:
+        future.add_done_callback(finished)
+    return combined
+
+
+def gather(futures, timeout=None):
+    """
+    Wait for every future and return their results in order.
+    On an error or timeout the unfinished futures are cancelled and the error is raised.
+    """
+    deadline = time.time() + timeout if timeout is not None else None
+    try:
+        results = list()
+        for future in futures:
+            remaining = max(0.0, deadline - time.time()) if deadline is not None else None
+            results.append(future.result(remaining))
+        return results
+    except Exception:
+        for future in futures:
+            if not future.done():
+                future.cancel()
+        raise
+
+
+class ControllerClient(object):
+    """
+    Calls run the blocking controller functions on a small worker pool, so calls to
+    different devices overlap.  Controller messages go through the shared keep-alive
+    pools of house.controllers.transport, and the sprinkler's through its breaker and retries.
+    """
+
+    def __init__(self, workers=4, request_timeout=DEFAULT_TIMEOUT, check_interval=0.1):
+        self.request_timeout = request_timeout
+        self.pool = WorkerPool(workers=workers, name="client", check_interval=check_interval)
+
+    def close(self):
+        """
+        Stop the workers
+        """
+        self.pool.close()
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Future of function(*args) run on a worker.  timeout abandons a call that hangs.
+        Cancelling the future before the call starts keeps it from running.
+        """
+        task = self.pool.submit(function, *args, timeout=kwargs.get("timeout") or self.request_timeout)
+        future = Future(on_cancel=task.cancel)
+        task.add_done_callback(lambda source: future._finish(source.value, source.error))
+        return future
+
+    def request(self, host, port, message, timeout=None):
+        """
+        Future of the controller's reply to message
+        """
+        return self.submit(send_request, message, host, port, timeout=timeout)
+
+    def request_many(self, host, port, messages, timeout=None):
+        """
+        Future of the replies to messages.  They are sent in order on one connection,
+        and the first failure fails the call without waiting for the rest.
+        """
+        return self.submit(send_requests, messages, host, port, timeout=timeout)
+
+    # Alarm (house.alarm.zones)
+
+    def zone_state(self, alarm_host, alarm_port, timeout=None):
+        """
+        Future of get_zone_state()
+        """
+        return self.submit(zones.get_zone_state, alarm_host, alarm_port, timeout=timeout)
+
+    def zone_status(self, alarm_host, alarm_port, timeout=None):
+        """
+        Future of get_zone_status()
+        """
+        return self.submit(zones.get_zone_status, alarm_host, alarm_port, timeout=timeout)
+
+    # Irrigation (house.irrigation.sprinkler)
+
+    def sprinkler_state(self, host, port, timeout=None):
+        """
+        Future of sprinkler_state()
+        """
+        return self.submit(sprinkler.sprinkler_state, host, port, timeout=timeout)
+
+    def sprinkler_zone_state(self, host, port, timeout=None):
+        """
+        Future of sprinkler_zone_state()
+        """
+        return self.submit(sprinkler.sprinkler_zone_state, host, port, timeout=timeout)
+
+    def sprinkler_status(self, host, port, timeout=None):
+        """
+        Future of sprinkler_status()
+        """
+        return self.submit(sprinkler.sprinkler_status, host, port, timeout=timeout)
+
+    def sprinkler_control(self, zone, state, host, port, timeout=None):
+        """
+        Future of sprinkler_control()
+        """
+        return self.submit(sprinkler.sprinkler_control, zone, state, host, port, timeout=timeout)
+
+    def sprinkler_start_cycle(self, milliseconds, host, port, timeout=None):
+        """
+        Future of sprinkler_start_cycle()
+        """
+        return self.submit(sprinkler.sprinkler_start_cycle, milliseconds, host, port, timeout=timeout)
+
+    def sprinkler_start_zone(self, zone, milliseconds, host, port, timeout=None):
+        """
+        Future of sprinkler_start_zone().  The commands are pipelined on one connection, so
+        the controller never opens the valve without first starting the shutoff timer.
+        """
+        return self.submit(sprinkler.sprinkler_start_zone, zone, milliseconds, host, port, timeout=timeout)
+
+    def sprinkler_end_cycle(self, host, port, timeout=None):
+        """
+        Future of sprinkler_end_cycle()
+        """
+        return self.submit(sprinkler.sprinkler_end_cycle, host, port, timeout=timeout)
+
+    # Lights (house.services.light)
+
+    def light_on(self, timeout=None):
+        """
+        Future of light_on()
+        """
+        return self.submit(light.light_on, timeout=timeout)
+
+    def light_off(self, timeout=None):
+        """
+        Future of light_off()
+        """
+        return self.submit(light.light_off, timeout=timeout)
+
+    def light_toggle(self, light_mode, timeout=None):
+        """
+        Future of light_toggle()
+        """
+        return self.submit(light.light_toggle, light_mode, timeout=timeout)
+
+    def light_color(self, zone, red, green, blue, timeout=None):
+        """
+        Future of light_color()
+        """
+        return self.submit(light.light_color, zone, red, green, blue, timeout=timeout)
+
+    # Weather (house.environment.external)
+
+    def read_weather(self, station_number, api_key, timeout=None):
+        """
+        Future of read_weather()
+        """
+        return self.submit(external.read_weather, station_number, api_key, timeout=timeout)
+
+    def read_weather_station(self, station_number, api_key, timeout=None):
+        """
+        Future of read_weather_station()
+        """
+        return self.submit(external.read_weather_station, station_number, api_key, timeout=timeout)
@@ -0,0 +1,453 @@
+"""
+reactor.py
+select() based event loop for controller requests
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from socket import socket, socketpair, error as socket_error, timeout as socket_timeout
+from socket import AF_INET, SOCK_STREAM, IPPROTO_TCP, TCP_NODELAY, SOL_SOCKET, SO_ERROR, SO_KEEPALIVE
+from errno import EINPROGRESS, EWOULDBLOCK, EAGAIN, EINTR
+from collections import deque
+from threading import Lock
+from select import select, error as select_error
+from house.controllers.transport import ReplyFramer, TERMINATOR, DEFAULT_TIMEOUT, DEFAULT_IDLE_TIMEOUT
+import heapq
+import logging
+import os
+import time
+
+
+class Timer(object):
+    """
+    A callback scheduled on the reactor
+    """
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Do not run the callback
+        """
+        self.cancelled = True
+
+
+class ControllerRequest(object):
+    """
+    A message waiting for its reply.
+    callback(reply, error) is called on the reactor thread.
+    """
+
+    def __init__(self, message, callback, timeout):
+        self.message = message
+        self.callback = callback
+        self.deadline = time.time() + timeout
+        self.cancelled = False
+        self.done = False
+
+    def cancel(self):
+        """
+        Drop the request.  The callback will not be called.
+        """
+        self.cancelled = True
+
+    def finish(self, reply, error=None):
+        """
+        Call the callback once
+        """
+        if self.done:
+            return
+        self.done = True
+        if self.cancelled:
+            return
+        try:
+            self.callback(reply, error)
+        except Exception, ex:
+            logging.exception(ex)
+
+
+class Channel(object):
+    """
+    Non-blocking keep-alive connection to one controller.  Requests are sent one at a time.
+    Replies are split by the pooled transport's ReplyFramer, with the same one-shot fallback.
+    """
+
+    def __init__(self, host, port, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.host = host
+        self.port = int(port)
+        self.idle_timeout = idle_timeout
+        self.socket = None
+        self.connecting = False
+        self.one_shot = False
+        self.uses = 0
+        self.last_used = 0
+        self.queue = deque()
+        self.current = None
+        self.out_buffer = ""
+        self.framer = ReplyFramer()
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def submit(self, request):
+        """
+        Queue a request
+        """
+        self.queue.append(request)
+        if self.current is None:
+            self.next()
+
+    def next(self):
+        """
+        Start the next queued request
+        """
+        self.current = None
+        while self.queue:
+            request = self.queue.popleft()
+            if not request.cancelled:
+                self.current = request
+                break
+
+        if self.current is None:
+            return
+
+        if self.socket is not None and time.time() - self.last_used > self.idle_timeout:
+            self.close()
+
+        self.framer.clear()
+        if self.one_shot:
+            self.out_buffer = self.current.message
+        else:
+            self.out_buffer = self.current.message + TERMINATOR
+
+        if self.socket is None:
+            self.connect()
+
+    def connect(self):
+        """
+        Start a non-blocking connect
+        """
+        self.socket = socket(AF_INET, SOCK_STREAM)
+        self.socket.setblocking(0)
+        self.socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        self.socket.setsockopt(SOL_SOCKET, SO_KEEPALIVE, 1)
+        self.uses = 0
+        self.connecting = True
+        result = self.socket.connect_ex((self.host, self.port))
+        if result not in (0, EINPROGRESS, EWOULDBLOCK, EAGAIN):
+            self.fail(socket_error(result, os.strerror(result)))
+
+    def wants_read(self):
+        # Idle connections are watched so a close by the controller is noticed
+        return self.socket is not None and not self.connecting and not self.out_buffer
+
+    def wants_write(self):
+        return self.socket is not None and (self.connecting or bool(self.out_buffer))
+
+    def on_writable(self):
+        """
+        Finish connecting and send the request
+        """
+        if self.connecting:
+            error = self.socket.getsockopt(SOL_SOCKET, SO_ERROR)
+            if error:
+                self.fail(socket_error(error, os.strerror(error)))
+                return
+            self.connecting = False
+
+        try:
+            sent = self.socket.send(self.out_buffer)
+        except socket_error, ex:
+            self.retry_or_fail(ex)
+            return
+        self.out_buffer = self.out_buffer[sent:]
+
+    def on_readable(self):
+        """
+        Read the reply
+        """
+        try:
+            data = self.socket.recv(2048)
+        except socket_error, ex:
+            if ex.args[0] in (EWOULDBLOCK, EAGAIN, EINTR):
+                return
+            self.retry_or_fail(ex)
+            return
+
+        if self.current is None:
+            # Idle connection was closed by the controller
+            self.close()
+            return
+
+        if data:
+            self.framer.feed(data)
+            if not self.one_shot:
+                reply = self.framer.next_reply()
+                if reply is not None:
+                    self.complete(reply)
+            return
+
+        # The controller hung up
+        reply = self.framer.hang_up()
+        self.close()
+        if self.one_shot:
+            self.complete(reply or "")
+        elif reply:
+            self.use_one_shot()
+            self.complete(reply)
+        elif self.uses > 0:
+            # Stale keep-alive connection.  Send again on a new one.
+            self.resend()
+        else:
+            self.use_one_shot()
+            self.resend()
+
+    def use_one_shot(self):
+        """
+        This firmware closes after every reply
+        """
+        if not self.one_shot:
+            logging.info("Controller %s:%s closes after each reply. Using one-shot requests.",
+                         self.host, self.port)
+        self.one_shot = True
+
+    def resend(self):
+        """
+        Send the current request again on a new connection
+        """
+        self.queue.appendleft(self.current)
+        self.next()
+
+    def retry_or_fail(self, error):
+        """
+        Errors on a reused keep-alive connection are retried once on a new connection
+        """
+        reused = self.uses > 0
+        self.close()
+        if reused and not self.one_shot:
+            self.resend()
+        else:
+            self.fail(error)
+
+    def complete(self, reply):
+        """
+        Hand the reply to the request
+        """
+        request = self.current
+        self.uses += 1
+        self.last_used = time.time()
+        if self.one_shot:
+            self.close()
+        self.next()
+        request.finish(reply)
+
+    def fail(self, error):
+        """
+        Fail the current request and move on
+        """
+        request = self.current
+        self.close()
+        self.next()
+        if request is not None:
+            request.finish(None, error)
+
+    def check_timeout(self, now):
+        """
+        Fail the current request if the controller did not answer in time
+        """
+        if self.current is not None and (self.current.cancelled or now > self.current.deadline):
+            if self.current.cancelled:
+                self.close()
+                self.next()
+            else:
+                self.fail(socket_timeout("timed out"))
+
+    def close(self):
+        """
+        Close the connection
+        """
+        if self.socket is not None:
+            self.socket.close()
+        self.socket = None
+        self.connecting = False
+        self.out_buffer = ""
+        self.framer.clear()
+
+
+class Reactor(object):
+    """
+    Drives many controller requests from one thread without blocking.
+    Replies are handed to their callbacks as soon as they arrive.
+    """
+
+    def __init__(self, select_timeout=1.0):
+        self.select_timeout = select_timeout
+        self.channels = dict()
+        self.timers = list()
+        self.sequence = 0
+        self.stopping = False
+        self.pending = deque()
+        self.pending_lock = Lock()
+        self.wake_reader, self.wake_writer = socketpair()
+        self.wake_reader.setblocking(0)
+
+    def channel(self, host, port):
+        """
+        Return the channel for a controller
+        """
+        key = (host, int(port))
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = Channel(host, port)
+        return channel
+
+    def request(self, host, port, message, callback, timeout=DEFAULT_TIMEOUT):
+        """
+        Send a message to a controller.  Must be called on the reactor thread.
+        """
+        request = ControllerRequest(message, callback, timeout)
+        self.channel(host, port).submit(request)
+        return request
+
+    def call_later(self, delay, callback, *args):
+        """
+        Run a callback on the reactor thread after a delay.  Must be called on the reactor thread.
+        """
+        timer = Timer(time.time() + delay, callback, args)
+        self.sequence += 1
+        heapq.heappush(self.timers, (timer.when, self.sequence, timer))
+        return timer
+
+    def call_soon_threadsafe(self, callback, *args):
+        """
+        Run a callback on the reactor thread.  Safe to call from any thread.
+        """
+        with self.pending_lock:
+            self.pending.append((callback, args))
+        self.wake()
+
+    def wake(self):
+        """
+        Interrupt select()
+        """
+        try:
+            self.wake_writer.send("x")
+        except socket_error:
+            pass
+
+    def stop(self):
+        """
+        Stop run(), or the next run() if it has not started yet.  Safe to call from any thread.
+        """
+        self.stopping = True
+        self.wake()
+
+    def run(self):
+        """
+        Process events until stop() is called
+        """
+        try:
+            while not self.stopping:
+                self.run_once()
+        finally:
+            self.stopping = False
+
+    def run_once(self):
+        """
+        Wait for one round of socket events and timers
+        """
+        self.run_pending()
+
+        timeout = self.select_timeout
+        if self.timers:
+            timeout = max(0, min(timeout, self.timers[0][0] - time.time()))
+        for channel in self.channels.values():
+            if channel.current is not None:
+                timeout = max(0, min(timeout, channel.current.deadline - time.time()))
+
+        readers = [self.wake_reader] + [channel for channel in self.channels.values() if channel.wants_read()]
+        writers = [channel for channel in self.channels.values() if channel.wants_write()]
+
+        try:
+            readable, writable, _unused = select(readers, writers, [], timeout)
+        except select_error, ex:
+            if ex.args[0] == EINTR:
+                return
+            raise
+
+        for channel in writable:
+            if channel.socket is not None:
+                channel.on_writable()
+
+        for channel in readable:
+            if channel is self.wake_reader:
+                self.drain_wake()
+            elif channel.socket is not None and channel.wants_read():
+                channel.on_readable()
+
+        now = time.time()
+        for channel in self.channels.values():
+            channel.check_timeout(now)
+
+        self.run_timers(now)
+
+    def run_pending(self):
+        """
+        Run callbacks queued from other threads
+        """
+        with self.pending_lock:
+            pending, self.pending = self.pending, deque()
+        for callback, args in pending:
+            try:
+                callback(*args)
+            except Exception, ex:
+                logging.exception(ex)
+
+    def run_timers(self, now):
+        """
+        Run the timers that are due
+        """
+        while self.timers and self.timers[0][0] <= now:
+            _unused, _unused, timer = heapq.heappop(self.timers)
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception, ex:
+                logging.exception(ex)
+
+    def drain_wake(self):
+        """
+        Empty the wake up socket
+        """
+        try:
+            while self.wake_reader.recv(1024):
+                pass
+        except socket_error:
+            pass
+
+    def close(self):
+        """
+        Close every connection
+        """
+        for channel in self.channels.values():
+            channel.close()
+        self.wake_reader.close()
+        self.wake_writer.close()
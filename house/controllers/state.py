@@ -0,0 +1,160 @@
+"""
+state.py
+Compact zone state read from a controller
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+class ProtocolError(ValueError):
+    """
+    A controller reply that is not a list of zone states
+    """
+
+
+def parse_fields(message, count):
+    """
+    Values of the first count fields of a controller message "0:1:0:0...".
+    A reply may hold fewer fields than count, or more, such as the sprinkler's cycle milliseconds.
+    """
+    message = message.strip() if message else ""
+    if not message:
+        raise ProtocolError("Controller sent an empty reply")
+    try:
+        return [int(field) for field in message.split(":")[:count]]
+    except ValueError:
+        raise ProtocolError("Controller reply is not zone states: %r" % message)
+
+
+def pack_bits(values):
+    """
+    Pack zone values into an integer.  Bit n is set when value n is not zero.
+    """
+    bits = 0
+    for index, value in enumerate(values):
+        if value:
+            bits |= 1 << index
+    return bits
+
+
+def parse_bits(message, count):
+    """
+    Pack the first count fields of a controller message "0:1:0:0..." into an integer.
+    Bit n holds field n.
+    """
+    return pack_bits(parse_fields(message, count))
+
+
+def iter_bits(mask):
+    """
+    Yield the index of each set bit
+    """
+    index = 0
+    while mask:
+        if mask & 1:
+            yield index
+        mask >>= 1
+        index += 1
+
+
+class ZoneState(object):
+    """
+    ZoneState holds one on/off reading per zone in an integer bitmask.
+    Bit n is the state of keys[n].  Changed zones are found with XOR.
+    """
+
+    __slots__ = ("keys", "bits")
+
+    def __init__(self, keys, bits=0):
+        self.keys = keys
+        self.bits = bits
+
+    @classmethod
+    def parse(cls, keys, message):
+        """
+        Create the state from a controller message.  Only the zones the controller
+        sent are kept, so an 8 zone reply has 8 keys.
+        """
+        values = parse_fields(message, len(keys))
+        return cls(keys[:len(values)], pack_bits(values))
+
+    @classmethod
+    def from_mapping(cls, keys, mapping):
+        """
+        Create the state from a dictionary of zone values
+        """
+        return cls(keys, pack_bits(int(mapping[key]) for key in keys))
+
+    def value(self, index):
+        """
+        State of the zone at index
+        """
+        return (self.bits >> index) & 1
+
+    def changed(self, other):
+        """
+        Mask of the zones that differ from the other state
+        """
+        return self.bits ^ other.bits
+
+    def changed_keys(self, other):
+        """
+        Keys of the zones that differ from the other state
+        """
+        return [self.keys[index] for index in iter_bits(self.changed(other))]
+
+    def describe(self, index, definitions, state_text):
+        """
+        Expand one zone into its description and state text
+        """
+        key = self.keys[index]
+        value = self.value(index)
+        return {"zone": key,
+                "description": definitions.get(key, "unknown"),
+                "status": state_text[key][value]}
+
+    def status(self, definitions, state_text):
+        """
+        Expand every zone
+        """
+        return [self.describe(index, definitions, state_text) for index in range(len(self.keys))]
+
+    def items(self):
+        return [(key, self.value(index)) for index, key in enumerate(self.keys)]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __getitem__(self, key):
+        return self.value(self.keys.index(key))
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __eq__(self, other):
+        return isinstance(other, ZoneState) and self.bits == other.bits and self.keys == other.keys
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "ZoneState(%s)" % ":".join(str(value) for _unused, value in self.items())
@@ -0,0 +1,409 @@
+"""
+transport.py
+Pooled TCP transport for the Arduino controllers
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from socket import socket, error as socket_error, AF_INET, SOCK_STREAM
+from socket import IPPROTO_TCP, TCP_NODELAY, SOL_SOCKET, SO_KEEPALIVE
+from threading import Lock, BoundedSemaphore, Thread
+from select import select
+import logging
+import time
+
+
+# Requests are terminated with a newline.  The firmware replies with println() so
+# every reply ends with "\r\n".  A request without the terminator is the original
+# one-shot protocol: the controller replies and closes the connection.
+TERMINATOR = "\n"
+
+# Seconds to wait for a connect or a reply
+DEFAULT_TIMEOUT = 5.0
+
+# The Ethernet shield only has 4 sockets.  Leave some for other clients.
+DEFAULT_MAX_CONNECTIONS = 2
+
+# Seconds an unused connection is kept open
+DEFAULT_IDLE_TIMEOUT = 30.0
+
+# Seconds between closing the idle connections of the shared pools that have expired.
+# Each open connection holds one of the shield's sockets.
+REAP_INTERVAL = 5.0
+
+
+def open_socket(host, port, timeout, connect_timeout=None):
+    """
+    Connect to a controller.  timeout applies to reads and to the connect unless connect_timeout is set.
+    """
+    s = socket(AF_INET, SOCK_STREAM)
+    s.settimeout(connect_timeout or timeout)
+    s.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+    try:
+        s.connect((host, int(port)))
+    except Exception:
+        s.close()
+        raise
+    s.settimeout(timeout)
+    return s
+
+
+class ReplyFramer(object):
+    """
+    Splits what is read from a controller into replies.  Used by the blocking
+    connections here and by the reactor's non-blocking channels.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, data):
+        """
+        Add data read from the socket
+        """
+        self.buffer += data
+
+    def next_reply(self):
+        """
+        The next framed reply, or None until all of it has arrived
+        """
+        if TERMINATOR not in self.buffer:
+            return None
+        reply, self.buffer = self.buffer.split(TERMINATOR, 1)
+        return reply.strip()
+
+    def hang_up(self):
+        """
+        The controller closed the connection.  Whatever it sent is the reply.
+        Returns None if it sent nothing.
+        """
+        reply, self.buffer = self.buffer.strip(), ""
+        return reply or None
+
+    def clear(self):
+        self.buffer = ""
+
+
+def one_shot_request(message, host, port, timeout=DEFAULT_TIMEOUT, connect_timeout=None):
+    """
+    Send a message on a new connection and read until the controller closes it
+    """
+    s = open_socket(host, port, timeout, connect_timeout)
+    framer = ReplyFramer()
+    try:
+        s.sendall(message)
+
+        while True:
+            data = s.recv(2048)
+            if not data:
+                break
+            framer.feed(data)
+    finally:
+        s.close()
+
+    return framer.hang_up() or ""
+
+
+class ControllerConnection(object):
+    """
+    A keep-alive connection to a controller
+    """
+
+    def __init__(self, host, port, timeout, connect_timeout=None):
+        self.socket = open_socket(host, port, timeout, connect_timeout)
+        self.socket.setsockopt(SOL_SOCKET, SO_KEEPALIVE, 1)
+        self.framer = ReplyFramer()
+        self.uses = 0
+        self.closed = False
+        self.last_used = time.time()
+
+    def exchange(self, message):
+        """
+        Send a framed request and return the reply.
+        Returns None if the controller closed the connection without replying.
+        """
+        replies = list()
+        self.exchange_many([message], replies)
+        return replies[0] if replies else None
+
+    def exchange_many(self, messages, replies):
+        """
+        Send framed requests back to back and append each reply to replies in order.
+        Stops early if the controller closes the connection.
+        """
+        self.uses += 1
+        self.socket.sendall("".join(message + TERMINATOR for message in messages))
+        for _unused in messages:
+            reply = self.read_reply()
+            if reply is None:
+                break
+            replies.append(reply)
+            if self.closed:
+                break
+        self.last_used = time.time()
+
+    def read_reply(self):
+        """
+        Read one framed reply
+        """
+        reply = self.framer.next_reply()
+        while reply is None:
+            data = self.socket.recv(2048)
+            if not data:
+                self.closed = True
+                return self.framer.hang_up()
+            self.framer.feed(data)
+            reply = self.framer.next_reply()
+        return reply
+
+    def peer_closed(self):
+        """
+        Return if the controller has closed its end of the connection
+        """
+        if self.closed:
+            return True
+        readable, _unused, _unused = select([self.socket], [], [], 0)
+        if readable:
+            # An idle connection is only readable when it is closing
+            # or the controller sent something we did not ask for.
+            self.closed = True
+        return self.closed
+
+    def close(self):
+        """
+        Close the connection
+        """
+        self.closed = True
+        self.socket.close()
+
+
+class ControllerPool(object):
+    """
+    Keep-alive connections to one controller.
+    Falls back to a connection per request for firmware that closes after each reply.
+    """
+
+    def __init__(self, host, port, timeout=DEFAULT_TIMEOUT, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, connect_timeout=None):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.idle_timeout = idle_timeout
+        self.max_connections = max_connections
+        self.one_shot = False
+        self.idle = list()
+        self.lock = Lock()
+        self.slots = BoundedSemaphore(max_connections)
+        # Options given by get_pool, fixed once set
+        self.options = None
+
+    def configure(self, **options):
+        """
+        Set the options of a pool created without any.  Requests already running keep
+        the connection limit they started with.
+        """
+        for option, value in options.items():
+            setattr(self, option, value)
+        if "max_connections" in options:
+            self.slots = BoundedSemaphore(self.max_connections)
+        self.options = options
+
+    def request(self, message):
+        """
+        Send a message to the controller and return the reply
+        """
+        return self.request_many([message])[0]
+
+    def request_many(self, messages):
+        """
+        Send several messages over one connection and return the replies in order.
+        The messages are pipelined: all are written before the first reply is read.
+        """
+        with self.slots:
+            if self.one_shot:
+                return [one_shot_request(message, self.host, self.port, self.timeout, self.connect_timeout)
+                        for message in messages]
+            return self._pooled_request(messages)
+
+    def _pooled_request(self, messages):
+        """
+        Send the messages on a pooled connection.  A pooled connection may have been
+        dropped by the controller since it was last used.  Those are retried on a new one.
+        """
+        replies = list()
+        while True:
+            connection = self._checkout()
+            reused = connection.uses > 0
+            answered = len(replies)
+            try:
+                connection.exchange_many(messages[answered:], replies)
+            except socket_error:
+                connection.close()
+                if reused and len(replies) == answered:
+                    continue
+                raise
+
+            if len(replies) == answered and reused:
+                connection.close()
+                continue
+
+            if connection.closed:
+                # This firmware closes after every reply
+                connection.close()
+                self._fallback()
+                return replies + [one_shot_request(message, self.host, self.port, self.timeout, self.connect_timeout)
+                                  for message in messages[len(replies):]]
+
+            self._checkin(connection)
+            return replies
+
+    def _fallback(self):
+        """
+        Switch to one connection per request
+        """
+        if not self.one_shot:
+            logging.info("Controller %s:%s closes after each reply. Using one-shot requests.",
+                         self.host, self.port)
+        self.one_shot = True
+        self.close()
+
+    def _checkout(self):
+        """
+        Take an idle connection or open a new one
+        """
+        now = time.time()
+        with self.lock:
+            while self.idle:
+                connection = self.idle.pop()
+                if now - connection.last_used < self.idle_timeout and not connection.peer_closed():
+                    return connection
+                connection.close()
+
+        return ControllerConnection(self.host, self.port, self.timeout, self.connect_timeout)
+
+    def _checkin(self, connection):
+        """
+        Return a connection to the pool
+        """
+        with self.lock:
+            self.idle.append(connection)
+
+    def reap(self, now=None):
+        """
+        Close the idle connections unused for idle_timeout seconds.  Returns the number closed.
+        """
+        now = now or time.time()
+        with self.lock:
+            expired = [connection for connection in self.idle if now - connection.last_used >= self.idle_timeout]
+            self.idle = [connection for connection in self.idle if now - connection.last_used < self.idle_timeout]
+        for connection in expired:
+            connection.close()
+        return len(expired)
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self.lock:
+            for connection in self.idle:
+                connection.close()
+            self.idle = list()
+
+
+_POOLS = dict()
+_POOLS_LOCK = Lock()
+_REAPER = None
+
+
+def _reap_loop(interval):
+    """
+    Close the shared pools' expired idle connections every interval seconds
+    """
+    while True:
+        time.sleep(interval)
+        try:
+            reap_pools()
+        except Exception, ex:
+            logging.exception(ex)
+
+
+def _start_reaper():
+    """
+    Start the reaper thread once.  Must hold _POOLS_LOCK.
+    """
+    global _REAPER
+    if _REAPER is None:
+        _REAPER = Thread(group=None, target=_reap_loop, name="pool_reaper", args=(REAP_INTERVAL,))
+        _REAPER.daemon = True
+        _REAPER.start()
+
+
+def get_pool(host, port, **options):
+    """
+    Return the shared connection pool for a controller.  The first options given for a
+    controller are kept, whether the pool was created with them or by a lookup without any.
+    Later lookups without options reuse the pool.  Raises ValueError if options differ
+    from the ones kept.
+    """
+    key = (host, int(port))
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = _POOLS[key] = ControllerPool(host, port)
+            _start_reaper()
+        if not options:
+            return pool
+        if pool.options is None:
+            pool.configure(**options)
+            return pool
+    conflicts = ["%s=%s" % (option, getattr(pool, option)) for option, value in sorted(options.items())
+                 if getattr(pool, option) != value]
+    if conflicts:
+        raise ValueError("Pool for %s:%s already has %s" % (host, port, ", ".join(conflicts)))
+    return pool
+
+
+def send_request(message, host, port):
+    """
+    Send a message to a controller using the shared pool and return the reply
+    """
+    return get_pool(host, port).request(message)
+
+
+def send_requests(messages, host, port):
+    """
+    Send several messages to a controller over one pooled connection and return the replies
+    """
+    return get_pool(host, port).request_many(messages)
+
+
+def reap_pools(now=None):
+    """
+    Close the expired idle connections of every pool.  Returns the number closed.
+    """
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    return sum(pool.reap(now) for pool in pools)
+
+
+def close_pools():
+    """
+    Close the idle connections of every pool
+    """
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.close()
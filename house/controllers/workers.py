@@ -0,0 +1,240 @@
+"""
+workers.py
+Bounded thread pool for callbacks and blocking calls
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from threading import Thread, Event, Lock
+from Queue import Queue, Empty, Full
+import logging
+import sys
+import time
+
+
+class TaskTimeout(Exception):
+    """
+    The task did not finish in time
+    """
+
+
+class Task(object):
+    """
+    A call waiting for or running on a worker
+    """
+
+    def __init__(self, function, args, timeout=None):
+        self.function = function
+        self.args = args
+        self.timeout = timeout
+        self.started = None
+        self.finished = Event()
+        self.value = None
+        self.error = None
+        self.cancelled = False
+        self.timed_out = False
+        self.lock = Lock()
+        self.callbacks = list()
+
+    def run(self):
+        """
+        Call the function and keep the outcome
+        """
+        if self.cancelled:
+            self._finish(None, None)
+            return
+        self.started = time.time()
+        value, error = None, None
+        try:
+            value = self.function(*self.args)
+        except Exception:
+            error = sys.exc_info()
+
+        # An abandoned task already reported its timeout
+        self._finish(value, error)
+
+    def expire(self):
+        """
+        Give up on a running task.  Returns False if it finished first.
+        """
+        error = TaskTimeout("Task exceeded %s seconds" % self.timeout)
+        return self._finish(None, (TaskTimeout, error, None), timed_out=True)
+
+    def _finish(self, value, error, timed_out=False):
+        """
+        Keep the first outcome and call the done callbacks.  Returns False if the task had already finished.
+        """
+        with self.lock:
+            if self.finished.is_set():
+                return False
+            self.value, self.error, self.timed_out = value, error, timed_out
+            self.finished.set()
+            callbacks, self.callbacks = self.callbacks, list()
+        for callback in callbacks:
+            callback(self)
+        return True
+
+    def add_done_callback(self, callback):
+        """
+        Call callback(task) when the task finishes.  Runs now if it already has.
+        """
+        with self.lock:
+            if not self.finished.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self):
+        """
+        Do not run the task if it has not started
+        """
+        self.cancelled = True
+        return self.started is None
+
+    def done(self):
+        return self.finished.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the task and return its value or raise its error
+        """
+        if not self.finished.wait(timeout):
+            raise TaskTimeout("Task did not finish in %s seconds" % timeout)
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.value
+
+
+class WorkerPool(object):
+    """
+    WorkerPool runs tasks on a fixed number of threads.
+    The queue is bounded.  submit() waits while it is full.
+    A task that runs past its timeout is abandoned and its worker replaced
+    so the pool keeps its capacity.
+    """
+
+    def __init__(self, workers=4, queue_size=64, name="worker", check_interval=1.0, log_errors=True):
+        self.name = name
+        self.log_errors = log_errors
+        self.tasks = Queue(maxsize=queue_size)
+        self.lock = Lock()
+        self.running = set()
+        self.count = 0
+        self.timeouts = 0
+        self.closed = False
+        self.check_interval = check_interval
+        for _unused in range(workers):
+            self._start_worker()
+
+        self.watchdog = Thread(group=None, target=self._watch, name="%s_watchdog" % name, args=(check_interval,))
+        self.watchdog.daemon = True
+        self.watchdog.start()
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Queue a call.  Keyword arguments:
+        timeout: seconds the call may run before it is abandoned
+        block, wait: how long to wait for room in the queue.  Raises Queue.Full.
+        """
+        task = Task(function, args, kwargs.get("timeout"))
+        self.tasks.put(task, kwargs.get("block", True), kwargs.get("wait"))
+        return task
+
+    def try_submit(self, function, *args, **kwargs):
+        """
+        Queue a call if there is room.  Returns None if the queue is full.
+        """
+        kwargs["block"] = False
+        try:
+            return self.submit(function, *args, **kwargs)
+        except Full:
+            return None
+
+    def backlog(self):
+        """
+        Number of queued tasks
+        """
+        return self.tasks.qsize()
+
+    def _start_worker(self):
+        with self.lock:
+            self.count += 1
+            worker = Thread(group=None, target=self._work, name="%s_%s" % (self.name, self.count))
+        worker.daemon = True
+        worker.start()
+
+    def _work(self):
+        """
+        Worker thread loop
+        """
+        while True:
+            try:
+                task = self.tasks.get(True, self.check_interval)
+            except Empty:
+                if self.closed:
+                    break
+                continue
+            if task is None:
+                break
+
+            with self.lock:
+                self.running.add(task)
+            task.run()
+            with self.lock:
+                self.running.discard(task)
+
+            if task.timed_out:
+                # A replacement worker has already been started
+                break
+
+            if self.log_errors and task.error is not None:
+                logging.error("%s task %s failed", self.name, getattr(task.function, "__name__", task.function),
+                              exc_info=task.error)
+
+    def _watch(self, check_interval):
+        """
+        Abandon tasks that run past their timeout
+        """
+        while not self.closed:
+            time.sleep(check_interval)
+            now = time.time()
+            with self.lock:
+                overdue = [task for task in self.running
+                           if task.timeout is not None and task.started is not None and not task.timed_out
+                           and now - task.started > task.timeout]
+            # A task that finished meanwhile keeps its outcome
+            expired = [task for task in overdue if task.expire()]
+            with self.lock:
+                self.timeouts += len(expired)
+
+            for task in expired:
+                logging.warning("%s task %s exceeded %s seconds", self.name,
+                                getattr(task.function, "__name__", task.function), task.timeout)
+                self._start_worker()
+
+    def close(self):
+        """
+        Stop the workers after the queued tasks have run.  Does not wait: a full queue
+        has no room to wake the workers, so they also stop once they find it empty.
+        """
+        self.closed = True
+        with self.lock:
+            workers = self.count - self.timeouts
+        for _unused in range(workers):
+            try:
+                self.tasks.put_nowait(None)
+            except Full:
+                break
@@ -0,0 +1,109 @@
+"""
+columns.py
+Query results held as one array per column
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from array import array
+from collections import OrderedDict
+from itertools import izip
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Rows copied out of SQLite at a time
+FETCH_ROWS = 1024
+
+NAN = float("nan")
+
+INTEGER_TYPES = (int, long, bool)
+
+
+def is_integer(values):
+    """
+    Return if every value fits an integer column
+    """
+    return all(type(value) in INTEGER_TYPES for value in values)
+
+
+class ColumnBuilder(object):
+    """
+    Values of one column packed in an array.  The column is integers ('l') until a
+    float or NULL arrives, then doubles ('d') with NULL stored as NaN.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self):
+        self.values = array("l")
+
+    def extend(self, values):
+        if self.values.typecode == "l":
+            if is_integer(values):
+                length = len(self.values)
+                try:
+                    self.values.extend(values)
+                    return
+                except OverflowError:
+                    # Too big for a C long.  Drop the part of the chunk that was added.
+                    del self.values[length:]
+            self.values = array("d", self.values)
+        self.values.extend(NAN if value is None else value for value in values)
+
+    def result(self):
+        if numpy is None:
+            return self.values
+        # Shares the array's memory
+        kind = "i" if self.values.typecode == "l" else "f"
+        return numpy.frombuffer(self.values, dtype=numpy.dtype("%s%s" % (kind, self.values.itemsize)))
+
+
+def fetch_columns(cursor, rows=FETCH_ROWS):
+    """
+    Read the rest of the cursor's result into {column: values}, in column order.
+    Every column must be numeric.  Values are NumPy arrays when NumPy is installed, array.array otherwise.
+    """
+    names = [description[0] for description in cursor.description]
+    builders = [ColumnBuilder() for _unused in names]
+    while True:
+        chunk = cursor.fetchmany(rows)
+        if not chunk:
+            break
+        for builder, values in izip(builders, izip(*chunk)):
+            builder.extend(values)
+    return OrderedDict((name, builder.result()) for name, builder in izip(names, builders))
+
+
+def column_list(values):
+    """
+    Plain list of a column for JSON.  NaN becomes None.
+    """
+    floats = values.typecode == "d" if isinstance(values, array) else values.dtype.kind == "f"
+    values = values.tolist()
+    if floats:
+        return [None if value != value else value for value in values]
+    return values
+
+
+def column_lists(columns):
+    """
+    {column: [values]} ready for json.dumps
+    """
+    return OrderedDict((name, column_list(values)) for name, values in columns.items())
@@ -0,0 +1,114 @@
+"""
+convert_history.py
+Copy history between the history table and a segment store
+
+    python -m house.data.convert_history to-segments --segments history
+    python -m house.data.convert_history to-table --segments history
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.data import service_data
+from house.data.segments import SegmentStore
+from datetime import datetime
+import argparse
+
+
+# Samples read and written at a time
+BATCH = 4096
+
+
+def to_segments(store, start=None, end=None, batch=BATCH):
+    """
+    Append the history table's samples from start to end to store.  Returns the number copied.
+    """
+    fields = [field for field in store.fields if field in service_data.HISTORY_FIELDS]
+    conditions = list()
+    if start is not None:
+        conditions.append("entryDate >= :start")
+    if end is not None:
+        conditions.append("entryDate < :end")
+    sql = "SELECT entryDate, %s FROM history%s ORDER BY entryDate ASC" % (
+        ", ".join(fields), " WHERE " + " AND ".join(conditions) if conditions else "")
+
+    copied = 0
+    cursor = service_data.DATABASE.connection().cursor()
+    try:
+        cursor.execute(sql, {"start": start, "end": end})
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                return copied
+            samples = list()
+            for row in rows:
+                sample = dict(zip(fields, row[1:]))
+                sample["entryDate"] = parse_entry_date(row[0])
+                samples.append(sample)
+            store.append(samples)
+            copied += len(samples)
+    finally:
+        cursor.close()
+
+
+def parse_entry_date(value):
+    """
+    datetime of an entryDate column value
+    """
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f" if "." in value else "%Y-%m-%d %H:%M:%S")
+
+
+def to_table(store, start=None, end=None, batch=BATCH):
+    """
+    Insert store's samples from start to end into the history table and its rollups.
+    Returns the number copied.
+    """
+    names = ["dt"] + store.fields
+    copied = 0
+    samples = list()
+    for row in store.rows(start, end):
+        sample = dict(zip(names, row))
+        sample["entryDate"] = datetime.utcfromtimestamp(sample.pop("dt"))
+        samples.append(sample)
+        if len(samples) >= batch:
+            service_data.write_history_table(samples)
+            copied += len(samples)
+            samples = list()
+    if samples:
+        service_data.write_history_table(samples)
+    return copied + len(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy history between house.db and a segment store")
+    parser.add_argument("direction", choices=["to-segments", "to-table"])
+    parser.add_argument("--segments", default="history", help="Segment store directory")
+    parser.add_argument("--start", help="First day YYYY-MM-DD")
+    parser.add_argument("--end", help="Day after the last YYYY-MM-DD")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, "%Y-%m-%d") if args.start else None
+    end = datetime.strptime(args.end, "%Y-%m-%d") if args.end else None
+    store = SegmentStore(args.segments, service_data.HISTORY_FIELDS)
+    if args.direction == "to-segments":
+        print "%s samples copied to %s" % (to_segments(store, start, end), args.segments)
+    else:
+        print "%s samples copied to the history table" % to_table(store, start, end)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+database.py
+Long lived SQLite connections, one per thread
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.data.migrations import migrate
+from house.services.settings import get_setting
+from contextlib import contextmanager
+from threading import Lock, local
+import os
+import sqlite3
+import time
+
+
+# WAL lets the REST service read while the irrigation service writes.
+# NORMAL only syncs at checkpoints in WAL mode, which spares the SD card.
+PRAGMAS = [("journal_mode", "WAL"),
+           ("synchronous", "NORMAL"),
+           ("temp_store", "MEMORY"),
+           ("cache_size", -2000)]
+
+# Seconds a writer waits for another before "database is locked"
+BUSY_TIMEOUT = 5.0
+
+# Prepared statements kept by each connection
+STATEMENT_CACHE = 64
+
+
+class QueryTimings(object):
+    """
+    Count, average and worst time of each named query since the last snapshot
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.queries = dict()
+
+    def record(self, name, seconds):
+        with self.lock:
+            count, total, worst = self.queries.get(name, (0, 0.0, 0.0))
+            self.queries[name] = (count + 1, total + seconds, max(worst, seconds))
+
+    @contextmanager
+    def timed(self, name):
+        """
+        Time the block as one run of the query name
+        """
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, time.time() - started)
+
+    def status(self, reset=False):
+        """
+        {name: {"queries", "average_ms", "max_ms"}}.  reset starts the next snapshot.
+        """
+        with self.lock:
+            queries = self.queries
+            if reset:
+                self.queries = dict()
+        return dict((name, {"queries": count,
+                            "average_ms": round(total * 1000.0 / count, 3),
+                            "max_ms": round(worst * 1000.0, 3)})
+                    for name, (count, total, worst) in queries.items())
+
+
+class Database(object):
+    """
+    One connection per thread, opened on first use and kept.  The statement cache of a
+    long lived connection means each query is only prepared once.
+    setup(conn) runs on each new connection, before it is used.
+    A relative path is relative to the working directory when the connection is opened.
+    """
+
+    def __init__(self, path, pragmas=PRAGMAS, timeout=BUSY_TIMEOUT, statements=STATEMENT_CACHE, setup=None):
+        self.path = path
+        self.pragmas = pragmas
+        self.timeout = timeout
+        self.statements = statements
+        self.setup = setup
+        self.local = local()
+        self.lock = Lock()
+        self.connections = list()
+        self.timings = QueryTimings()
+
+    def connect(self, path):
+        # Only this thread uses the connection.  close() may come from another one.
+        conn = sqlite3.connect(path, timeout=self.timeout, cached_statements=self.statements,
+                               check_same_thread=False)
+        for pragma, value in self.pragmas:
+            conn.execute("PRAGMA %s = %s" % (pragma, value))
+        if self.setup is not None:
+            try:
+                self.setup(conn)
+            except Exception:
+                conn.close()
+                raise
+        with self.lock:
+            self.connections.append(conn)
+        return conn
+
+    def connection(self):
+        """
+        This thread's connection
+        """
+        path = os.path.abspath(self.path)
+        if getattr(self.local, "path", None) != path:
+            if getattr(self.local, "conn", None) is not None:
+                self.release(self.local.conn)
+            self.local.conn = self.connect(path)
+            self.local.path = path
+            self.local.ready = set()
+        return self.local.conn
+
+    def once(self, name, setup):
+        """
+        Run setup(conn) the first time name is asked for on this thread's connection
+        """
+        conn = self.connection()
+        if name not in self.local.ready:
+            setup(conn)
+            self.local.ready.add(name)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Cursor that commits when the block ends and rolls back if it raises
+        """
+        conn = self.connection()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def timed(self, name):
+        """
+        Context manager timing the block as the query name
+        """
+        return self.timings.timed(name)
+
+    @contextmanager
+    def using(self, path):
+        """
+        Point at another database file inside the block.  For scratch databases.
+        """
+        previous, self.path = self.path, path
+        try:
+            yield self
+        finally:
+            self.path = previous
+            self.close()
+
+    def release(self, conn):
+        with self.lock:
+            if conn in self.connections:
+                self.connections.remove(conn)
+        conn.close()
+
+    def close(self):
+        """
+        Close every thread's connection.  Threads reconnect on their next query.
+        """
+        with self.lock:
+            connections, self.connections = self.connections, list()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # Closed by a thread that has gone
+                pass
+        self.local = local()
+
+
+DATABASE_PATH = get_setting("database", "path", "house.db")
+
+# Every connection brings the schema up to date first
+DATABASE = Database(DATABASE_PATH, setup=migrate)
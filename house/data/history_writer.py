@@ -0,0 +1,158 @@
+"""
+history_writer.py
+Buffers history samples and writes them in batches
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from threading import Condition, Lock, Thread
+import atexit
+import logging
+import signal
+import sys
+import time
+
+
+class HistoryWriter(object):
+    """
+    Samples wait in memory until batch_size of them are queued or the oldest has waited
+    max_delay seconds.  write(samples) then stores the batch in one transaction.
+    A failed batch is kept and retried with the next one.  Past max_pending queued samples
+    the oldest are dropped.
+    """
+
+    def __init__(self, write, batch_size=32, max_delay=60.0, max_pending=10000, clock=time.time):
+        self.write = write
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.clock = clock
+        self.condition = Condition()
+        self.write_lock = Lock()
+        self.pending = list()
+        self.oldest = None
+        self.closed = False
+        self.thread = None
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+        self.discarded = 0
+
+    def add(self, sample):
+        """
+        Queue a sample
+        """
+        with self.condition:
+            if self.closed:
+                raise ValueError("History writer is closed")
+            self.pending.append(sample)
+            self.trim()
+            if self.oldest is None:
+                self.oldest = self.clock()
+            if self.thread is None:
+                self.thread = Thread(group=None, target=self.run, name="history_writer")
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify()
+
+    def trim(self):
+        if len(self.pending) > self.max_pending:
+            # Keep the newest samples
+            self.discarded += len(self.pending) - self.max_pending
+            del self.pending[:-self.max_pending]
+
+    def due(self):
+        """
+        Seconds until the pending samples must be written.  None when nothing is queued.
+        """
+        if not self.pending:
+            return None
+        if len(self.pending) >= self.batch_size:
+            return 0.0
+        return max(0.0, self.oldest + self.max_delay - self.clock())
+
+    def run(self):
+        while True:
+            with self.condition:
+                wait = self.due()
+                while not self.closed and wait != 0.0:
+                    self.condition.wait(wait)
+                    wait = self.due()
+                if self.closed:
+                    return
+            try:
+                self.flush()
+            except Exception, ex:
+                logging.exception(ex)
+                # Back off until the retried batch is due again
+                with self.condition:
+                    if not self.closed:
+                        self.condition.wait(self.max_delay)
+
+    def flush(self):
+        """
+        Write every queued sample now.  Returns the number written.
+        """
+        with self.write_lock:
+            with self.condition:
+                batch, self.pending, self.oldest = self.pending, list(), None
+            if not batch:
+                return 0
+
+            try:
+                self.write(batch)
+            except Exception:
+                with self.condition:
+                    self.failures += 1
+                    self.pending[0:0] = batch
+                    self.trim()
+                    self.oldest = self.clock()
+                raise
+
+            self.flushes += 1
+            self.written += len(batch)
+            return len(batch)
+
+    def close(self):
+        """
+        Stop the writer thread and write what is left
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+        return self.flush()
+
+    def status(self):
+        """
+        Counters for monitoring
+        """
+        with self.condition:
+            return {"pending": len(self.pending),
+                    "flushes": self.flushes,
+                    "written": self.written,
+                    "failures": self.failures,
+                    "discarded": self.discarded}
+
+
+def flush_on_exit(writer):
+    """
+    Write the queued samples when the process exits or is terminated.  Call from the main thread.
+    """
+    atexit.register(writer.close)
+    # SIGTERM skips atexit unless it becomes a normal exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
@@ -0,0 +1,151 @@
+"""
+journal.py
+Append-only journal of alarm zone transitions
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from bisect import bisect_right
+from threading import Lock
+import sqlite3
+import time
+
+
+JOURNAL_TABLE_SQL = ["""CREATE TABLE IF NOT EXISTS alarm_events (
+                        'id' INTEGER PRIMARY KEY,
+                        'event_time' REAL,
+                        'controller' VARCHAR(64),
+                        'zone' VARCHAR(16),
+                        'name' VARCHAR(64),
+                        'state' INTEGER,
+                        'state_text' VARCHAR(16))""",
+                     "CREATE INDEX IF NOT EXISTS alarm_events_time ON alarm_events (event_time)",
+                     "CREATE INDEX IF NOT EXISTS alarm_events_zone ON alarm_events (zone, state_text, event_time)"]
+
+ADD_EVENT_SQL = """INSERT INTO alarm_events (event_time, controller, zone, name, state, state_text)
+                   VALUES (:time, :controller, :key, :name, :state, :state_text)"""
+
+EVENTS_SINCE_SQL = """SELECT event_time, controller, zone, name, state, state_text FROM alarm_events
+                      WHERE event_time > :since ORDER BY event_time ASC LIMIT :limit"""
+
+LAST_EVENT_SQL = """SELECT event_time, controller, zone, name, state, state_text FROM alarm_events
+                    WHERE zone = :zone AND state_text = :state_text ORDER BY event_time DESC LIMIT 1"""
+
+EVENT_COLUMNS = ("time", "controller", "zone", "name", "state", "state_text")
+
+
+def create_journal(conn):
+    """
+    Create the journal table and its indexes
+    """
+    cursor = conn.cursor()
+    for sql in JOURNAL_TABLE_SQL:
+        cursor.execute(sql)
+    conn.commit()
+
+
+class EventJournal(object):
+    """
+    EventJournal keeps every zone transition.  Recent events are held in memory in time order
+    so range queries are a binary search.  Every event is also written to the alarm_events table.
+    """
+
+    def __init__(self, database="house.db", capacity=10000):
+        self.database = database
+        self.capacity = capacity
+        self.lock = Lock()
+        self.times = list()
+        self.events = list()
+        self.last = dict()
+        self.ready = False
+
+    def connect(self):
+        conn = sqlite3.connect(self.database)
+        if not self.ready:
+            create_journal(conn)
+            self.ready = True
+        return conn
+
+    def record(self, changed):
+        """
+        Monitor handler.  Add the changed zones to the journal.
+        """
+        events = [dict(zone, time=zone.get("time") or time.time(), controller=zone.get("controller"))
+                  for zone in changed]
+
+        with self.lock:
+            for event in events:
+                entry = (event["time"], event["controller"], event["key"], event["name"],
+                         int(event["state"]), event["state_text"])
+                # Events usually arrive in order.  Keep the buffer sorted if one does not.
+                position = bisect_right(self.times, entry[0])
+                self.times.insert(position, entry[0])
+                self.events.insert(position, entry)
+                last = self.last.get((entry[2], entry[5]))
+                if last is None or last[0] <= entry[0]:
+                    self.last[(entry[2], entry[5])] = entry
+
+            # Trim in blocks so the ring costs O(1) per event
+            if len(self.events) > 2 * self.capacity:
+                del self.times[:-self.capacity]
+                del self.events[:-self.capacity]
+
+        conn = self.connect()
+        try:
+            conn.executemany(ADD_EVENT_SQL, events)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def since(self, since, limit=1000):
+        """
+        Return the events after the since time
+        """
+        with self.lock:
+            if self.times and since >= self.times[0]:
+                position = bisect_right(self.times, since)
+                return [dict(zip(EVENT_COLUMNS, entry)) for entry in self.events[position:position + limit]]
+
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(EVENTS_SINCE_SQL, {"since": since, "limit": limit})
+            return [dict(zip(EVENT_COLUMNS, row)) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def last_event(self, zone, state_text):
+        """
+        Return the last time a zone changed to a state.  e.g. ("zone9", "open")
+        """
+        with self.lock:
+            entry = self.last.get((zone, state_text))
+        if entry is not None:
+            return dict(zip(EVENT_COLUMNS, entry))
+
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(LAST_EVENT_SQL, {"zone": zone, "state_text": state_text})
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+        with self.lock:
+            self.last.setdefault((zone, state_text), row)
+        return dict(zip(EVENT_COLUMNS, row))
@@ -0,0 +1,259 @@
+"""
+migrations.py
+Versioned upgrades of the house.db schema
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.data.journal import create_journal
+from house.data.rollups import create_rollup_tables, rebuild_rollups
+import logging
+
+
+BASE_TABLES_SQL = ["""CREATE TABLE IF NOT EXISTS cycle_status ('status' VARCHAR(128), 'status_date' DATETIME)""",
+                   """CREATE TABLE IF NOT EXISTS schedule (
+                      'id' INTEGER PRIMARY KEY, 'day' INTEGER, 'start' INTEGER, 'end' INTEGER,
+                      'zone1' INTEGER, 'zone2' INTEGER, 'zone3' INTEGER, 'zone4' INTEGER)""",
+                   """CREATE TABLE IF NOT EXISTS cycles (
+                      'id' INTEGER PRIMARY KEY, 'schedule_id' INTEGER,
+                      'cycledate' VARCHAR(10), 'cycletime' DATETIME,
+                      'zone1' INTEGER, 'zone2' INTEGER, 'zone3' INTEGER, 'zone4' INTEGER)""",
+                   """CREATE TABLE IF NOT EXISTS history (
+                      'id' INTEGER PRIMARY KEY,
+                      'entryDate' DATETIME,
+                      'fan_state' INTEGER,
+                      'cool_state' INTEGER,
+                      'heat_state' INTEGER,
+                      'irrigation_zone1' INTEGER,
+                      'irrigation_zone2' INTEGER,
+                      'irrigation_zone3' INTEGER,
+                      'irrigation_zone4' INTEGER,
+                      'alarm_zone1' INTEGER,
+                      'alarm_zone2' INTEGER,
+                      'alarm_zone3' INTEGER,
+                      'alarm_zone4' INTEGER,
+                      'alarm_zone5' INTEGER,
+                      'alarm_zone6' INTEGER,
+                      'alarm_zone7' INTEGER,
+                      'alarm_zone8' INTEGER,
+                      'alarm_zone9' INTEGER,
+                      'inside_temp' DECIMAL,
+                      'inside_humidity' INTEGER,
+                      'outside_temp' DECIMAL,
+                      'outside_humidity' INTEGER,
+                      'rainfall' DECIMAL,
+                      'wind_speed' DECIMAL)"""]
+
+# Day of the week : hour of the day : hour to end the window : zone minutes.
+# One statement that only inserts into an empty table: a service starting at the same time
+# waits for the other's insert and then finds the rows.
+DEFAULT_SCHEDULE_SQL = """INSERT INTO schedule (day, start, end, zone1, zone2, zone3, zone4)
+                          SELECT * FROM (SELECT 6,4,6,30,30,0,0 UNION ALL SELECT 6,21,23,30,30,0,0
+                                         UNION ALL SELECT 2,4,6,30,30,0,0 UNION ALL SELECT 2,21,23,30,30,0,0)
+                          WHERE NOT EXISTS (SELECT 1 FROM schedule)"""
+
+# Columns added to the schedule table after it was first released
+SCHEDULE_COLUMNS = [("start_minute", "INTEGER"), ("end_minute", "INTEGER"),
+                    ("first_date", "VARCHAR(10)"), ("last_date", "VARCHAR(10)")]
+
+SCHEDULE_TABLES_SQL = ["""CREATE TABLE IF NOT EXISTS schedule_zones (
+                          'schedule_id' INTEGER, 'zone' INTEGER, 'minutes' INTEGER,
+                          PRIMARY KEY (schedule_id, zone))""",
+                       """CREATE TABLE IF NOT EXISTS schedule_exclusions (
+                          'schedule_id' INTEGER, 'exclude_date' VARCHAR(10))"""]
+
+# COMPLETED_SQL and the cycles join of SCHEDULE_SQL, the history range queries and
+# the rollup updates, and EXCLUSIONS_SQL
+INDEXES_SQL = ["CREATE INDEX IF NOT EXISTS cycles_date_schedule ON cycles (cycledate, schedule_id)",
+               "CREATE INDEX IF NOT EXISTS history_entry_date ON history (entryDate)",
+               """CREATE INDEX IF NOT EXISTS schedule_exclusions_schedule
+                  ON schedule_exclusions (schedule_id, exclude_date)"""]
+
+QUERY_STATS_SQL = ["""CREATE TABLE IF NOT EXISTS query_stats (
+                      'recorded' DATETIME, 'name' VARCHAR(64), 'queries' INTEGER,
+                      'average_ms' DECIMAL, 'max_ms' DECIMAL, 'history_rows' INTEGER)""",
+                   "CREATE INDEX IF NOT EXISTS query_stats_name ON query_stats (name, recorded)"]
+
+# One row per irrigation zone per sample, for any number of zones.  history keeps zones 1-4 as columns.
+ZONE_HISTORY_SQL = ["""CREATE TABLE IF NOT EXISTS zone_history (
+                       'entryDate' DATETIME, 'zone' INTEGER, 'state' INTEGER)""",
+                    "CREATE INDEX IF NOT EXISTS zone_history_date ON zone_history (entryDate, zone)"]
+
+# One row per alarm zone per sample, for any number of controllers.  history keeps zones 1-9 as columns.
+ALARM_ZONE_HISTORY_SQL = ["""CREATE TABLE IF NOT EXISTS alarm_zone_history (
+                             'entryDate' DATETIME, 'zone' INTEGER, 'state' INTEGER)""",
+                          "CREATE INDEX IF NOT EXISTS alarm_zone_history_date ON alarm_zone_history (entryDate, zone)"]
+
+
+def table_exists(cursor, table):
+    """
+    Return if the table is in the database
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+
+def table_columns(cursor, table):
+    """
+    Column names of a table
+    """
+    cursor.execute("PRAGMA table_info(%s)" % table)
+    return set(row[1] for row in cursor.fetchall())
+
+
+def base_tables(conn):
+    """
+    The tables of the first release, with the default schedule in a new database.
+    A new database frees the pages of deleted rows with incremental_vacuum.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master")
+    if not cursor.fetchone()[0]:
+        # Only takes effect before the first table is created
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    new_schedule = not table_exists(cursor, "schedule")
+    for statement in BASE_TABLES_SQL:
+        cursor.execute(statement)
+    if new_schedule:
+        cursor.execute(DEFAULT_SCHEDULE_SQL)
+
+
+def create_schedule_tables(conn):
+    """
+    Add the schedule columns and tables missing from older databases.
+    schedule: start_minute and end_minute add minutes to the start and end hours.
+              A NULL day runs every day.  first_date and last_date (YYYY-MM-DD) limit the dates.
+    schedule_zones: minutes for zones past zone4, or to override zone1-zone4
+    schedule_exclusions: dates a schedule entry does not run.  A NULL schedule_id skips every entry.
+    """
+    cursor = conn.cursor()
+    columns = table_columns(cursor, "schedule")
+    for column, column_type in SCHEDULE_COLUMNS:
+        if column not in columns:
+            cursor.execute("ALTER TABLE schedule ADD COLUMN '%s' %s" % (column, column_type))
+    for statement in SCHEDULE_TABLES_SQL:
+        cursor.execute(statement)
+
+
+def outside_humidity(conn):
+    """
+    History was written to outside_humdity, a column only some databases had.
+    Move those values to outside_humidity.
+    """
+    cursor = conn.cursor()
+    columns = table_columns(cursor, "history")
+    if "outside_humidity" not in columns:
+        cursor.execute("ALTER TABLE history ADD COLUMN 'outside_humidity' INTEGER")
+    if "outside_humdity" in columns:
+        # SQLite before 3.35 cannot drop the old column.  It is left empty.
+        cursor.execute("""UPDATE history SET outside_humidity = outside_humdity, outside_humdity = NULL
+                          WHERE outside_humdity IS NOT NULL""")
+
+
+def create_indexes(conn):
+    """
+    Indexes for the schedule and history queries
+    """
+    cursor = conn.cursor()
+    for statement in INDEXES_SQL:
+        cursor.execute(statement)
+
+
+def rollup_tables(conn):
+    """
+    Hourly and daily history rollups, filled from the history already recorded
+    """
+    cursor = conn.cursor()
+    create_rollup_tables(cursor)
+    rebuild_rollups(cursor)
+
+
+def incremental_vacuum(conn):
+    """
+    Ask for incremental auto vacuum.  An existing database only switches when it is rewritten,
+    which takes longer than a connection waits for a lock, so retention.vacuum_mode does it
+    from the daily upkeep instead of here.
+    """
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+
+def query_stats(conn):
+    """
+    Daily query timings kept by the retention job
+    """
+    cursor = conn.cursor()
+    for statement in QUERY_STATS_SQL:
+        cursor.execute(statement)
+
+
+def zone_history(conn):
+    """
+    Irrigation zone states by zone number
+    """
+    cursor = conn.cursor()
+    for statement in ZONE_HISTORY_SQL:
+        cursor.execute(statement)
+
+
+def alarm_zone_history(conn):
+    """
+    Alarm zone states by zone number
+    """
+    cursor = conn.cursor()
+    for statement in ALARM_ZONE_HISTORY_SQL:
+        cursor.execute(statement)
+
+
+# (version, migration).  Append new migrations; never change or reorder released ones.
+# Each is safe to run again, as a failure part way leaves user_version at the last one finished.
+MIGRATIONS = [(1, base_tables),
+              (2, create_schedule_tables),
+              (3, create_journal),
+              (4, outside_humidity),
+              (5, create_indexes),
+              (6, rollup_tables),
+              (7, incremental_vacuum),
+              (8, query_stats),
+              (9, zone_history),
+              (10, alarm_zone_history)]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    """
+    Version of the database's schema.  0 for a new database or one from before migrations.
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """
+    Bring the database up to the newest version.  Returns the versions applied.
+    """
+    version = schema_version(conn)
+    if version > migrations[-1][0]:
+        logging.warning("Database schema version %s is newer than this code (%s)", version, migrations[-1][0])
+    applied = list()
+    for number, migration in migrations:
+        if number <= version:
+            continue
+        logging.info("Migrating database to version %s: %s", number, migration.__name__)
+        migration(conn)
+        conn.execute("PRAGMA user_version = %d" % number)
+        conn.commit()
+        applied.append(number)
+    return applied
@@ -19,52 +19,41 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from datetime import datetime
-from house.environment.external import read_weather, CIMMARON_HILLS, temperature 
+from house.environment.external import read_weather, temperature
 from house.environment.external import wind_speed, humidity, current_rain
 from house.environment.nest import Nest
-from house.irrigation.sprinkler import sprinkler_state
-from house.alarm.zones import get_zone_state
+from house.irrigation.sprinkler import sprinkler_zone_state
+from house.irrigation.zones import configured_zones, zones_history
+from house.alarm.zones import alarm_controllers, controllers_state
 from house.data.service_data import update_history, retrieve_history
 
 
-def record_data(nest_user, nest_password, weather_station):
+def record_data(settings):
     """
-    Collect the data and send it to the database
+    Collect the data and queue it for the database
     """
     
-    weather = read_weather(weather_station)
-    nest = Nest(nest_user, nest_password)
+    weather = read_weather(settings.get("weather", "station"), settings.get("weather", "api_key"))
+    nest = Nest(settings.get("nest", "user"), settings.get("nest", "pwd"))
     nest.login()
     nest.read_status()
     
-    irrigation_state = sprinkler_state()
-    alarm_zones = get_zone_state()
+    alarm_zones = controllers_state(alarm_controllers(settings))
 
     data = {"entryDate": datetime.now(),
-            "irrigation_zone1": irrigation_state["zone1"],
-            "irrigation_zone2": irrigation_state["zone2"],
-            "irrigation_zone3": irrigation_state["zone3"],
-            "irrigation_zone4": irrigation_state["zone4"],
-            "alarm_zone1": alarm_zones["zone1"],
-            "alarm_zone2": alarm_zones["zone2"],
-            "alarm_zone3": alarm_zones["zone3"],
-            "alarm_zone4": alarm_zones["zone4"],
-            "alarm_zone5": alarm_zones["zone5"],
-            "alarm_zone6": alarm_zones["zone6"],
-            "alarm_zone7": alarm_zones["zone7"],
-            "alarm_zone8": alarm_zones["zone8"],
-            "alarm_zone9": alarm_zones["zone9"],
             "outside_temp": temperature(weather),
             "outside_humidity": humidity(weather),
             "rainfall": current_rain(weather),
             "wind_speed": wind_speed(weather)}
 
+    data.update(zones_history(configured_zones(settings), sprinkler_zone_state))
+    data.update(("alarm_%s" % zone, value) for zone, value in alarm_zones.items())
     data.update(nest.history_states())
     update_history(data)
 
 
-def retrieve_data():
+def retrieve_data(columnar=False):
     """
     Return all history
     """
-    return retrieve_history()
\ No newline at end of file
+    return retrieve_history(columnar)
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+retention.py
+Prune or archive old rows and give the pages back to the file system
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.data.migrations import table_columns
+from datetime import datetime, timedelta
+import time
+
+
+# (table, [retention] option, default days, rows older than the cutoff).  0 days keeps every row.
+# The hourly and daily rollups outlive the raw samples.
+RULES = [("history", "history_days", 400, "entryDate < :date"),
+         ("zone_history", "history_days", 400, "entryDate < :date"),
+         ("alarm_zone_history", "history_days", 400, "entryDate < :date"),
+         ("history_hourly", "hourly_days", 0, "period < :date"),
+         ("alarm_events", "events_days", 400, "event_time < :seconds"),
+         ("cycles", "cycles_days", 0, "cycledate < :day")]
+
+# Rows deleted per transaction, so the services are not locked out for long
+BATCH = 5000
+
+
+def cutoff_values(cutoff):
+    """
+    The cutoff as each table stores its time
+    """
+    return {"date": cutoff,
+            "seconds": time.mktime(cutoff.timetuple()),
+            "day": cutoff.strftime("%Y-%m-%d")}
+
+
+def archive_table(cursor, table):
+    """
+    Create the table in the archive database, or add the columns it is missing
+    """
+    cursor.execute("CREATE TABLE IF NOT EXISTS archive.%s AS SELECT * FROM main.%s WHERE 0" % (table, table))
+    cursor.execute("PRAGMA archive.table_info(%s)" % table)
+    archived = set(row[1] for row in cursor.fetchall())
+    cursor.execute("PRAGMA main.table_info(%s)" % table)
+    for row in cursor.fetchall():
+        if row[1] not in archived:
+            cursor.execute('ALTER TABLE archive.%s ADD COLUMN "%s" %s' % (table, row[1], row[2]))
+
+
+def prune_table(conn, table, where, data, archive=False, batch=BATCH):
+    """
+    Delete the rows matching where, batch rows per transaction, copying them to the
+    attached archive database first when archive is set.  Returns the number deleted.
+    """
+    # The same rows, in the same order, for the copy and the delete
+    rows = "SELECT rowid FROM main.%s WHERE %s ORDER BY rowid LIMIT %d" % (table, where, batch)
+    columns = ", ".join('"%s"' % column for column in table_columns(conn.cursor(), table))
+    removed = 0
+    while True:
+        cursor = conn.cursor()
+        try:
+            if archive:
+                cursor.execute("INSERT INTO archive.%s (%s) SELECT %s FROM main.%s WHERE rowid IN (%s)"
+                               % (table, columns, columns, table, rows), data)
+            cursor.execute("DELETE FROM main.%s WHERE rowid IN (%s)" % (table, rows), data)
+            deleted = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        removed += deleted
+        if deleted < batch:
+            return removed
+
+
+def prune(conn, now, days, archive_path=None, vacuum_pages=0, batch=BATCH):
+    """
+    Remove rows older than days[option] days of each of RULES, then free up to vacuum_pages
+    unused pages (0 frees them all).  Returns {table: rows removed}.
+    """
+    tables = set(row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+    rules = [(table, where, days.get(option, default)) for table, option, default, where in RULES
+             if table in tables and days.get(option, default) > 0]
+
+    removed = dict()
+    if archive_path:
+        conn.commit()
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+    try:
+        for table, where, table_days in rules:
+            if archive_path:
+                archive_table(conn.cursor(), table)
+                conn.commit()
+            # Whole days, so no rollup bucket is left with part of its samples
+            cutoff = datetime.combine((now - timedelta(days=table_days)).date(), datetime.min.time())
+            removed[table] = prune_table(conn, table, where, cutoff_values(cutoff), bool(archive_path), batch)
+    finally:
+        if archive_path:
+            conn.commit()
+            conn.execute("DETACH DATABASE archive")
+
+    # Freed pages only go back to the file system in incremental auto vacuum mode.
+    # Each step frees a page, so every row must be fetched.
+    conn.execute("PRAGMA incremental_vacuum(%d)" % vacuum_pages).fetchall()
+    # Keep the WAL file from holding on to the deleted pages
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return removed
+
+
+def vacuum_mode(conn):
+    """
+    Rewrite a database from before incremental auto vacuum once, so prune can free its pages.
+    VACUUM locks the whole file while it runs.  Returns if the file was rewritten.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.commit()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def page_status(conn):
+    """
+    Size of the database file and the pages waiting to be freed
+    """
+    return {"pages": conn.execute("PRAGMA page_count").fetchone()[0],
+            "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+            "free_pages": conn.execute("PRAGMA freelist_count").fetchone()[0]}
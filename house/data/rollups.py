@@ -0,0 +1,167 @@
+"""
+rollups.py
+Hourly and daily summaries of the history table
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.alarm.zones import ZONES, ZONE_STATE_TEXT
+from datetime import datetime, timedelta
+
+
+# min, max and average of each
+MEASURES = ["inside_temp", "inside_humidity", "outside_temp", "outside_humidity", "rainfall", "wind_speed"]
+
+# Fraction of the samples that were on
+STATES = ["fan_state", "cool_state", "heat_state"]
+
+# History value of each alarm zone when it is open
+ALARM_OPEN = [("alarm_%s" % zone, ZONE_STATE_TEXT[zone].index("open")) for zone in ZONES]
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+# name: (table, source, bucket of a source row, length)
+RESOLUTIONS = {"hour": ("history_hourly", "history", "strftime('%Y-%m-%d %H:00:00', entryDate)", HOUR),
+               "day": ("history_daily", "history_hourly", "strftime('%Y-%m-%d 00:00:00', period)", DAY)}
+
+
+def rollup_columns():
+    """
+    Columns of both rollup tables after period and samples
+    """
+    columns = list()
+    for measure in MEASURES:
+        columns.extend(["%s_min" % measure, "%s_max" % measure, "%s_sum" % measure, "%s_count" % measure])
+    columns.extend("%s_on" % state for state in STATES)
+    columns.extend("%s_open" % zone for zone, _unused in ALARM_OPEN)
+    return columns
+
+
+ROLLUP_COLUMNS = rollup_columns()
+
+
+def hourly_values():
+    """
+    SELECT expressions summarizing raw history rows, in ROLLUP_COLUMNS order
+    """
+    values = list()
+    for measure in MEASURES:
+        values.extend(["MIN(%s)" % measure, "MAX(%s)" % measure, "SUM(%s)" % measure, "COUNT(%s)" % measure])
+    values.extend("SUM(IFNULL(%s, 0))" % state for state in STATES)
+    values.extend("SUM(CASE WHEN %s = %s THEN 1 ELSE 0 END)" % (zone, open_value) for zone, open_value in ALARM_OPEN)
+    return ["COUNT(*)"] + values
+
+
+def daily_values():
+    """
+    SELECT expressions combining hourly rows, in ROLLUP_COLUMNS order
+    """
+    values = list()
+    for measure in MEASURES:
+        values.extend(["MIN(%s_min)" % measure, "MAX(%s_max)" % measure,
+                       "SUM(%s_sum)" % measure, "SUM(%s_count)" % measure])
+    values.extend("SUM(%s_on)" % state for state in STATES)
+    values.extend("SUM(%s_open)" % zone for zone, _unused in ALARM_OPEN)
+    return ["SUM(samples)"] + values
+
+
+def summarize_sql(resolution, values):
+    """
+    Replace the rollup rows for the buckets of source rows in [:start, :end)
+    """
+    table, source, bucket, _unused = RESOLUTIONS[resolution]
+    time_column = "entryDate" if source == "history" else "period"
+    return """INSERT OR REPLACE INTO %s (period, samples, %s)
+              SELECT %s AS bucket, %s FROM %s
+              WHERE %s >= :start AND %s < :end GROUP BY bucket""" % (
+        table, ", ".join(ROLLUP_COLUMNS), bucket, ", ".join(values), source, time_column, time_column)
+
+
+SUMMARIZE_SQL = {"hour": summarize_sql("hour", hourly_values()),
+                 "day": summarize_sql("day", daily_values())}
+
+
+def create_rollup_tables(cursor):
+    """
+    Create the rollup tables
+    """
+    columns = ", ".join("'%s' %s" % (column, "INTEGER" if column.endswith(("_count", "_on", "_open")) else "DECIMAL")
+                        for column in ROLLUP_COLUMNS)
+    for table, _unused, _unused, _unused in RESOLUTIONS.values():
+        cursor.execute("CREATE TABLE IF NOT EXISTS %s ('period' DATETIME PRIMARY KEY, 'samples' INTEGER, %s)"
+                       % (table, columns))
+
+
+def bucket_start(moment, resolution):
+    """
+    Start of the hour or day holding moment
+    """
+    if resolution == "day":
+        return datetime(moment.year, moment.month, moment.day)
+    return datetime(moment.year, moment.month, moment.day, moment.hour)
+
+
+def update_rollups(cursor, moments):
+    """
+    Summarize again the hours and days holding moments.  Call after the history rows are written.
+    """
+    hours = set(bucket_start(moment, "hour") for moment in moments if isinstance(moment, datetime))
+    for hour in sorted(hours):
+        cursor.execute(SUMMARIZE_SQL["hour"], {"start": hour, "end": hour + HOUR})
+    for day in sorted(set(bucket_start(hour, "day") for hour in hours)):
+        cursor.execute(SUMMARIZE_SQL["day"], {"start": day, "end": day + DAY})
+
+
+def rebuild_rollups(cursor):
+    """
+    Summarize all of history
+    """
+    everything = {"start": datetime.min, "end": datetime.max}
+    cursor.execute(SUMMARIZE_SQL["hour"], everything)
+    cursor.execute(SUMMARIZE_SQL["day"], everything)
+
+
+def rollup_select(resolution):
+    """
+    Query returning one row per bucket in [:start, :end) with averages, duty cycles
+    and open seconds worked out.  Open seconds assume evenly spaced samples.
+    """
+    table, _unused, _unused, length = RESOLUTIONS[resolution]
+    seconds = length.total_seconds()
+    columns = ["CAST(strftime('%s', period) AS INTEGER) AS dt", "samples"]
+    for measure in MEASURES:
+        columns.extend(["%s_min" % measure, "%s_max" % measure,
+                        "CAST(%s_sum AS REAL) / %s_count AS %s" % (measure, measure, measure)])
+    columns.extend("CAST(%s_on AS REAL) / samples AS %s" % (state, state.replace("_state", "_duty"))
+                   for state in STATES)
+    columns.extend("%s_open * %s / samples AS %s_open_seconds" % (zone, seconds, zone) for zone, _unused in ALARM_OPEN)
+    return "SELECT %s FROM %s WHERE period >= :start AND period < :end ORDER BY period ASC" % (
+        ", ".join(columns), table)
+
+
+ROLLUP_SQL = dict((resolution, rollup_select(resolution)) for resolution in RESOLUTIONS)
+
+
+def choose_resolution(start, end, points, raw_rows):
+    """
+    The finest of raw, hour and day that returns no more than points rows
+    """
+    if raw_rows <= points:
+        return "raw"
+    if (end - start).total_seconds() / HOUR.total_seconds() <= points:
+        return "hour"
+    return "day"
@@ -0,0 +1,416 @@
+"""
+segments.py
+History samples in fixed width records, one memory mapped file per day
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.data.columns import ColumnBuilder
+from calendar import timegm
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from itertools import izip
+from threading import Lock
+import mmap
+import os
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Segment files are named for the day of their samples
+SEGMENT_NAME = "%Y%m%d.seg"
+
+# Field names of the records, one per line.  Kept with the segments so the layout
+# of existing files is known when the field list changes.
+LAYOUT_NAME = "fields"
+
+# Fields renamed since a layout was written: old name: new name
+FIELD_RENAMES = {"outside_humdity": "outside_humidity"}
+
+# On/off and open/closed states are bytes.  NULL is stored as NULL_STATE.
+STATE_PREFIXES = ("fan_", "cool_", "heat_", "irrigation_", "alarm_")
+NULL_STATE = -128
+NULL_STATES = {NULL_STATE: None}
+
+# Significant digits of a float32 value
+FLOAT_FORMAT = "%.7g"
+
+# Decimals of float32 values remembered by a layout
+DECIMALS_KEPT = 65536
+
+# Records unpacked by one struct call when reading a range
+CHUNK_RECORDS = 256
+
+
+def to_epoch(moment):
+    """
+    Seconds of a datetime, counted the way SQLite's strftime('%s') counts them
+    """
+    return timegm(moment.timetuple())
+
+
+def field_format(field):
+    """
+    struct code of a field
+    """
+    return "b" if field.startswith(STATE_PREFIXES) else "f"
+
+
+def decimal_value(decimals, value):
+    """
+    The decimal that was stored as the float32 value, remembered in decimals
+    """
+    if value != value:
+        # NULL.  NaN never equals a key, so it is not kept.
+        return None
+    if len(decimals) >= DECIMALS_KEPT:
+        decimals.clear()
+    result = decimals[value] = float(FLOAT_FORMAT % value)
+    return result
+
+
+def segment_day(name):
+    """
+    Date of a segment file name.  False if it is not one.
+    """
+    if len(name) != 12 or not name.endswith(".seg") or not name[:8].isdigit():
+        return False
+    try:
+        return date(int(name[:4]), int(name[4:6]), int(name[6:8]))
+    except ValueError:
+        return False
+
+
+class Layout(object):
+    """
+    The record of a sample: epoch seconds as an unsigned int then a byte or float32 per field,
+    little endian with no padding
+    """
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.formats = [field_format(field) for field in self.fields]
+        self.record = struct.Struct("<I" + "".join(self.formats))
+        self.size = self.record.size
+        # Positions in an unpacked record, after dt
+        self.states = [index + 1 for index, code in enumerate(self.formats) if code == "b"]
+        self.floats = [index + 1 for index, code in enumerate(self.formats) if code == "f"]
+        # Readings repeat, so their decimals are remembered
+        self.decimals = dict()
+        # Record count: struct of that many records in a row
+        self.chunks = dict()
+        self.dtype = None
+        if numpy is not None:
+            self.dtype = numpy.dtype([("dt", "<u4")] + [(field, "<i1" if code == "b" else "<f4")
+                                                          for field, code in zip(self.fields, self.formats)])
+
+    def pack(self, sample):
+        """
+        Record of a sample dictionary holding entryDate and the fields
+        """
+        values = [to_epoch(sample["entryDate"])]
+        for field, code in zip(self.fields, self.formats):
+            value = sample.get(field)
+            if code == "b":
+                values.append(NULL_STATE if value is None else int(value))
+            else:
+                values.append(float("nan") if value is None else float(value))
+        return self.record.pack(*values)
+
+    def unpack(self, data, offset):
+        """
+        (dt, field values...) with NULLs as None
+        """
+        row = list(self.record.unpack_from(data, offset))
+        for index in self.states:
+            if row[index] == NULL_STATE:
+                row[index] = None
+        decimals = self.decimals
+        for index in self.floats:
+            value = row[index]
+            try:
+                row[index] = decimals[value]
+            except KeyError:
+                row[index] = decimal_value(decimals, value)
+        return tuple(row)
+
+    def chunk(self, count):
+        """
+        struct of count records in a row
+        """
+        chunk = self.chunks.get(count)
+        if chunk is None:
+            chunk = self.chunks[count] = struct.Struct("<" + self.record.format[1:] * count)
+        return chunk
+
+    def unpack_columns(self, data, first, last):
+        """
+        Columns [dt values, field values...] of the records from first to last with NULLs as None,
+        CHUNK_RECORDS records at a time.  Each chunk is unpacked by one struct call and converted
+        a column at a time.
+        """
+        width = len(self.fields) + 1
+        decimals = self.decimals
+        for start in xrange(first, last, CHUNK_RECORDS):
+            count = min(CHUNK_RECORDS, last - start)
+            values = self.chunk(count).unpack_from(data, start * self.size)
+            columns = [values[index::width] for index in xrange(width)]
+            for index in self.states:
+                if NULL_STATE in columns[index]:
+                    columns[index] = map(NULL_STATES.get, columns[index], columns[index])
+            for index in self.floats:
+                column = columns[index]
+                missing = set(column).difference(decimals)
+                if missing:
+                    if len(decimals) + len(missing) > DECIMALS_KEPT:
+                        decimals.clear()
+                    for value in missing:
+                        decimal_value(decimals, value)
+                # NaN is never a key, so NULLs come back None
+                columns[index] = map(decimals.get, column)
+            yield columns
+
+
+class Segment(object):
+    """
+    One day of records in time order.  Mapped read only, and mapped again after it grows.
+    Mappings are never closed by hand: views of an old mapping keep it alive until they go.
+    """
+
+    def __init__(self, path, layout):
+        self.path = path
+        self.layout = layout
+        self.mapped = None
+
+    def view(self):
+        """
+        (mapping, records) of the whole file.  The mapping is None when the file is empty.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        size -= size % self.layout.size
+        mapped = self.mapped
+        if mapped is None or mapped[1] != size:
+            data = None
+            if size:
+                with open(self.path, "rb") as segment_file:
+                    data = mmap.mmap(segment_file.fileno(), size, access=mmap.ACCESS_READ)
+            mapped = self.mapped = (data, size // self.layout.size)
+        return mapped
+
+    def timestamp(self, data, index):
+        return struct.unpack_from("<I", data, index * self.layout.size)[0]
+
+    def bisect(self, data, count, seconds):
+        """
+        Index of the first record at or after seconds.  The time index is the sorted records themselves.
+        """
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp(data, middle) < seconds:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def span(self, start, end):
+        """
+        (mapping, first, last) of the records from start to end seconds.  None start or end is open.
+        """
+        data, count = self.view()
+        if data is None:
+            return None, 0, 0
+        first = 0 if start is None else self.bisect(data, count, start)
+        last = count if end is None else self.bisect(data, count, end)
+        return data, first, max(first, last)
+
+    def append(self, records):
+        """
+        Add (seconds, record) pairs.  Records older than the last one rewrite the file in order.
+        """
+        data, count = self.view()
+        times = [self.timestamp(data, count - 1) if count else 0] + [seconds for seconds, _unused in records]
+        if all(earlier <= later for earlier, later in zip(times, times[1:])):
+            with open(self.path, "ab") as segment_file:
+                # Drop a partial record left by a crash
+                segment_file.truncate(count * self.layout.size)
+                segment_file.write("".join(record for _unused, record in records))
+            return
+
+        existing = [(self.timestamp(data, index), data[index * self.layout.size:(index + 1) * self.layout.size])
+                    for index in range(count)]
+        ordered = sorted(existing + records, key=lambda pair: pair[0])
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as segment_file:
+            segment_file.write("".join(record for _unused, record in ordered))
+        # Readers holding the old mapping keep reading the old file
+        os.rename(temporary, self.path)
+
+
+class SegmentStore(object):
+    """
+    Append only history.  Each day is a file of fixed width records in time order, so a time range
+    is found by binary search and read straight from the mapped file.
+    """
+
+    def __init__(self, directory, fields):
+        self.directory = directory
+        self.lock = Lock()
+        self.write_lock = Lock()
+        self.segments = dict()
+        # File name: date, or False for other files
+        self.names = dict()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        layout_path = os.path.join(directory, LAYOUT_NAME)
+        stored = None
+        if os.path.exists(layout_path):
+            with open(layout_path) as layout_file:
+                stored = [line.strip() for line in layout_file if line.strip()]
+            fields = [FIELD_RENAMES.get(field, field) for field in stored]
+        if fields != stored:
+            with open(layout_path, "w") as layout_file:
+                layout_file.write("".join("%s\n" % field for field in fields))
+        self.layout = Layout(fields)
+
+    @property
+    def fields(self):
+        return self.layout.fields
+
+    def segment(self, day):
+        """
+        Segment of a date
+        """
+        with self.lock:
+            if day not in self.segments:
+                self.segments[day] = Segment(os.path.join(self.directory, day.strftime(SEGMENT_NAME)), self.layout)
+            return self.segments[day]
+
+    def days(self, start=None, end=None):
+        """
+        Dates with a segment from start to end (datetimes), oldest first
+        """
+        days = list()
+        for name in os.listdir(self.directory):
+            day = self.names.get(name)
+            if day is None:
+                day = self.names[name] = segment_day(name)
+            if day and (start is None or day >= start.date()) and (end is None or day <= end.date()):
+                days.append(day)
+        return sorted(days)
+
+    def append(self, samples):
+        """
+        Store sample dictionaries holding entryDate and the fields
+        """
+        by_day = dict()
+        for sample in samples:
+            by_day.setdefault(sample["entryDate"].date(), list()).append(
+                (to_epoch(sample["entryDate"]), self.layout.pack(sample)))
+        with self.write_lock:
+            for day in sorted(by_day):
+                self.segment(day).append(by_day[day])
+
+    def remove_before(self, day):
+        """
+        Delete the segments of days before the date day.  Returns the number deleted.
+        """
+        removed = 0
+        with self.write_lock:
+            for old in self.days(end=datetime.combine(day, datetime.min.time()) - timedelta(days=1)):
+                # Mappings already open keep the data until they go
+                os.remove(os.path.join(self.directory, old.strftime(SEGMENT_NAME)))
+                with self.lock:
+                    self.segments.pop(old, None)
+                removed += 1
+        return removed
+
+    def spans(self, start=None, end=None):
+        """
+        (mapping, first, last) of each day holding records from start to end (datetimes)
+        """
+        start_seconds = None if start is None else to_epoch(start)
+        end_seconds = None if end is None else to_epoch(end)
+        for day in self.days(start, end):
+            data, first, last = self.segment(day).span(start_seconds, end_seconds)
+            if last > first:
+                yield data, first, last
+
+    def slices(self, start=None, end=None):
+        """
+        Zero copy buffers of the raw records from start to end, one per day
+        """
+        size = self.layout.size
+        for data, first, last in self.spans(start, end):
+            yield buffer(data, first * size, (last - first) * size)
+
+    def count(self, start=None, end=None):
+        """
+        Records from start to end
+        """
+        return sum(last - first for _unused, first, last in self.spans(start, end))
+
+    def rows(self, start=None, end=None, step=1):
+        """
+        (dt, field values...) from start to end, every step-th record of each day
+        """
+        size = self.layout.size
+        for data, first, last in self.spans(start, end):
+            if step == 1:
+                for columns in self.layout.unpack_columns(data, first, last):
+                    for row in izip(*columns):
+                        yield row
+                continue
+            for index in xrange(first, last, step):
+                yield self.layout.unpack(data, index * size)
+
+    def columns(self, start=None, end=None):
+        """
+        {column: values} from start to end.  With NumPy the values of a single day are
+        views of the mapped file, with NULL states as NULL_STATE (see with_nulls).
+        Without NumPy they are copies built like fetch_columns builds them.
+        """
+        names = ["dt"] + self.fields
+        if numpy is not None:
+            parts = [numpy.frombuffer(data, dtype=self.layout.dtype, count=last - first,
+                                      offset=first * self.layout.size)
+                     for data, first, last in self.spans(start, end)]
+            records = parts[0] if len(parts) == 1 else numpy.concatenate(parts or [numpy.empty(0, self.layout.dtype)])
+            return OrderedDict((name, records[name]) for name in names)
+
+        builders = [ColumnBuilder() for _unused in names]
+        for data, first, last in self.spans(start, end):
+            for columns in self.layout.unpack_columns(data, first, last):
+                for builder, values in izip(builders, columns):
+                    builder.extend(values)
+        return OrderedDict((name, builder.result()) for name, builder in izip(names, builders))
+
+
+def with_nulls(columns):
+    """
+    NumPy columns from SegmentStore.columns with NULL states as NaN, ready for column_lists
+    """
+    if numpy is None:
+        return columns
+    return OrderedDict((name, numpy.where(values == NULL_STATE, numpy.nan, values) if values.dtype == numpy.int8
+                        else values) for name, values in columns.items())
@@ -18,68 +18,35 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import sqlite3
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from house.data.database import DATABASE
+from house.data.history_writer import HistoryWriter
+from house.data.columns import fetch_columns
+from house.data.segments import SegmentStore, with_nulls
+from house.data.migrations import migrate, schema_version
+from house.data.retention import prune, page_status, vacuum_mode, RULES
+from house.data.rollups import update_rollups, rebuild_rollups, choose_resolution, ROLLUP_SQL
+from house.services.settings import get_setting
+import logging
+import re
 
 
 def create_database():
     """"
-    Create the database tables and add some default data
+    Create the database tables and add some default data, or bring an existing database up to date.
+    Returns the migration versions applied.
     """
-
-    conn = sqlite3.connect("house.db")
- 
-    cursor = conn.cursor()
- 
-    cursor.execute("""CREATE TABLE cycle_status ('status' VARCHAR(128), 'status_date' DATETIME)""")
-    
-    cursor.execute("""CREATE TABLE schedule ( 'id' INTEGER PRIMARY KEY, 'day' INTEGER, 'start' INTEGER, 'end' INTEGER,
-                      'zone1' INTEGER, 'zone2' INTEGER, 'zone3' INTEGER, 'zone4' INTEGER)""")
-
-    cursor.execute("""CREATE TABLE cycles ( 'id' INTEGER PRIMARY KEY, 'schedule_id' INTEGER,
-                      'cycledate' VARCHAR(10), 'cycletime' DATETIME,
-                      'zone1' INTEGER, 'zone2' INTEGER, 'zone3' INTEGER, 'zone4' INTEGER)""")
-
-    cursor.execute("""CREATE TABLE history (
-                      'id' INTEGER PRIMARY KEY, 
-                      'entryDate' DATETIME,
-                      'fan_state' INTEGER, 
-                      'cool_state' INTEGER, 
-                      'heat_state' INTEGER,
-                      'irrigation_zone1' INTEGER, 
-                      'irrigation_zone2' INTEGER,
-                      'irrigation_zone3' INTEGER, 
-                      'irrigation_zone4' INTEGER,
-                      'alarm_zone1' INTEGER, 
-                      'alarm_zone2' INTEGER,
-                      'alarm_zone3' INTEGER, 
-                      'alarm_zone4' INTEGER,
-                      'alarm_zone5' INTEGER, 
-                      'alarm_zone6' INTEGER,
-                      'alarm_zone7' INTEGER, 
-                      'alarm_zone8' INTEGER,
-                      'alarm_zone9' INTEGER, 
-                      'inside_temp' DECIMAL,
-                      'inside_humidity' INTEGER, 
-                      'outside_temp' DECIMAL,
-                      'outside_humidity' INTEGER,
-                      'rainfall' DECIMAL,
-                      'wind_speed' DECIMAL)""")    
-
-    # Day of the week : hour of the day : hour to end the window : zone minutes
-    cursor.execute("INSERT INTO schedule (day, start, end, zone1, zone2, zone3, zone4) VALUES (6,4,6,30,30,0,0)")
-    cursor.execute("INSERT INTO schedule (day, start, end, zone1, zone2, zone3, zone4) VALUES (6,21,23,30,30,0,0)")
-    cursor.execute("INSERT INTO schedule (day, start, end, zone1, zone2, zone3, zone4) VALUES (2,4,6,30,30,0,0)")
-    cursor.execute("INSERT INTO schedule (day, start, end, zone1, zone2, zone3, zone4) VALUES (2,21,23,30,30,0,0)")
-    #cursor.execute("INSERT INTO schedule (day, start, end, zone1, zone2, zone3, zone4) VALUES (2,0,24,1,1,1,1)")
-    
-    conn.commit()
+    return migrate(DATABASE.connection())
 
 
 SCHEDULE_SQL = """
-SELECT id FROM schedule WHERE day = :day_of_week AND start <= :hour_of_day 
-AND end > :hour_of_day AND id NOT IN 
-(SELECT schedule_id FROM cycles WHERE cycledate = :date)
+SELECT schedule.id FROM schedule
+LEFT JOIN cycles ON cycles.cycledate = :date AND cycles.schedule_id = schedule.id
+WHERE (schedule.day = :day_of_week OR schedule.day IS NULL)
+AND schedule.start * 60 + IFNULL(schedule.start_minute, 0) <= :minute_of_day
+AND schedule.end * 60 + IFNULL(schedule.end_minute, 0) > :minute_of_day
+AND cycles.id IS NULL
 """
 
 
@@ -88,13 +55,65 @@ def check_schedule(check_date):
     Return the identifier of the schedule entry if its schedule window is active now
     """
     data = {"day_of_week": check_date.weekday(),
-            "hour_of_day": check_date.hour,
+            "minute_of_day": check_date.hour * 60 + check_date.minute,
             "date": check_date.strftime("%Y-%m-%d")}
     
-    conn = sqlite3.connect("house.db")
-    cursor = conn.cursor()
-    cursor.execute(SCHEDULE_SQL, data)
-    return cursor.fetchone()
+    with DATABASE.timed("check_schedule"):
+        cursor = DATABASE.connection().cursor()
+        cursor.execute(SCHEDULE_SQL, data)
+        return cursor.fetchone()
+
+
+ALL_SCHEDULE_SQL = """SELECT id, day, start * 60 + IFNULL(start_minute, 0), end * 60 + IFNULL(end_minute, 0),
+                      first_date, last_date, zone1, zone2, zone3, zone4 FROM schedule ORDER BY id"""
+SCHEDULE_ZONES_SQL = "SELECT schedule_id, zone, minutes FROM schedule_zones"
+
+
+def get_schedule(zone_count=4):
+    """
+    Read every schedule entry as (id, day, start minute of the day, end minute of the day,
+    first date, last date, zone 1 minutes, ... zone zone_count minutes)
+    """
+    with DATABASE.timed("get_schedule"):
+        cursor = DATABASE.connection().cursor()
+        cursor.execute(ALL_SCHEDULE_SQL)
+        rows = [list(row[0:6]) + (list(row[6:]) + [0] * zone_count)[0:zone_count] for row in cursor.fetchall()]
+        cursor.execute(SCHEDULE_ZONES_SQL)
+        zone_minutes = cursor.fetchall()
+
+    durations = dict((row[0], row) for row in rows)
+    for schedule_id, zone, minutes in zone_minutes:
+        if schedule_id in durations and 0 < zone <= zone_count:
+            durations[schedule_id][5 + zone] = minutes
+
+    return [tuple(row) for row in rows]
+
+
+EXCLUSIONS_SQL = "SELECT schedule_id, exclude_date FROM schedule_exclusions ORDER BY schedule_id, exclude_date"
+
+
+def get_schedule_exclusions():
+    """
+    Read the (schedule_id, date) pairs that do not run
+    """
+    cursor = DATABASE.connection().cursor()
+    cursor.execute(EXCLUSIONS_SQL)
+    return cursor.fetchall()
+
+
+COMPLETED_SQL = "SELECT DISTINCT schedule_id FROM cycles WHERE cycledate = :date"
+
+
+def get_completed_schedules(check_date):
+    """
+    Identifiers of the schedule entries that already ran on the day of check_date
+    """
+    data = {"date": check_date.strftime("%Y-%m-%d")}
+
+    with DATABASE.timed("get_completed_schedules"):
+        cursor = DATABASE.connection().cursor()
+        cursor.execute(COMPLETED_SQL, data)
+        return [row[0] for row in cursor.fetchall()]
 
 
 CYCLE_SQL = "SELECT zone1, zone2, zone3, zone4 FROM schedule WHERE id = :id"
@@ -106,8 +125,7 @@ def get_cycle_durations(cycle_id):
     """
     data = {"id": cycle_id}
     
-    conn = sqlite3.connect("house.db")
-    cursor = conn.cursor()
+    cursor = DATABASE.connection().cursor()
     cursor.execute(CYCLE_SQL, data)
     return cursor.fetchone()
 
@@ -123,10 +141,8 @@ def add_cycle(cycle_id, date, cycle_times):
             "date": date.strftime("%Y-%m-%d"),
             "cycle_times": cycle_times}
     
-    conn = sqlite3.connect("house.db")
-    cursor = conn.cursor()
-    cursor.execute(ADD_CYCLE_SQL, data)
-    conn.commit()
+    with DATABASE.transaction() as cursor:
+        cursor.execute(ADD_CYCLE_SQL, data)
 
 
 CLEAR_STATUS_SQL = "DELETE FROM cycle_status"
@@ -140,11 +156,9 @@ def update_status(status):
     data = {"status": status,
             "date": datetime.now()}
     
-    conn = sqlite3.connect("house.db")
-    cursor = conn.cursor()
-    cursor.execute(CLEAR_STATUS_SQL)
-    cursor.execute(ADD_STATUS_SQL, data)
-    conn.commit()
+    with DATABASE.transaction() as cursor:
+        cursor.execute(CLEAR_STATUS_SQL)
+        cursor.execute(ADD_STATUS_SQL, data)
 
 
 STATUS_SQL = "SELECT status, status_date FROM cycle_status"
@@ -154,8 +168,7 @@ def get_status():
     """
     Get the status row from the cycle_status table
     """
-    conn = sqlite3.connect("house.db")
-    cursor = conn.cursor()
+    cursor = DATABASE.connection().cursor()
     cursor.execute(STATUS_SQL)
     return cursor.fetchone()
 
@@ -169,44 +182,136 @@ HISTORY_UPDATE_SQL = """INSERT INTO history ('entryDate','fan_state','cool_state
                         'alarm_zone7', 'alarm_zone8',
                         'alarm_zone9', 'inside_temp',
                         'inside_humidity', 'outside_temp',
-                        'outside_humdity', 'rainfall',
+                        'outside_humidity', 'rainfall',
                         'wind_speed') VALUES (:entryDate, :fan_state, :cool_state,
                         :heat_state, :irrigation_zone1, :irrigation_zone2,
                         :irrigation_zone3, :irrigation_zone4, :alarm_zone1,
                         :alarm_zone2, :alarm_zone3, :alarm_zone4, :alarm_zone5,
                         :alarm_zone6, :alarm_zone7, :alarm_zone8, :alarm_zone9,
-                        :inside_temp, :inside_humidity, :outside_temp, :outside_humdity,
+                        :inside_temp, :inside_humidity, :outside_temp, :outside_humidity,
                         :rainfall, :wind_speed)"""
-                        
+
+HISTORY_PARAMETERS = re.findall(r":(\w+)", HISTORY_UPDATE_SQL)
+
+
+def rebuild_history_rollups():
+    """
+    Summarize all of history again
+    """
+    with DATABASE.transaction() as cursor:
+        rebuild_rollups(cursor)
+
+
+def write_history(samples):
+    """
+    Insert history samples and update their hourly and daily rollups in one transaction.
+    Values a sample does not have are NULL.  With the segment store they are appended to it too.
+    """
+    with DATABASE.timed("write_history"):
+        write_history_table(samples)
+        if HISTORY_STORE is not None:
+            try:
+                HISTORY_STORE.append(samples)
+            except Exception:
+                # The table has the samples.  Retrying the batch would write them to it twice.
+                logging.exception("History segment append failed, rebuild with convert_history to-segments")
+
+
+ZONE_HISTORY_SQL = "INSERT INTO zone_history (entryDate, zone, state) VALUES (?, ?, ?)"
+ALARM_ZONE_HISTORY_SQL = "INSERT INTO alarm_zone_history (entryDate, zone, state) VALUES (?, ?, ?)"
+
+# Sample keys of the zone states, irrigation_zone1 ... irrigation_zone<n> and alarm_zone1 ... alarm_zone<n>
+IRRIGATION_ZONE = re.compile(r"^irrigation_zone(\d+)$")
+ALARM_ZONE = re.compile(r"^alarm_zone(\d+)$")
+
+
+def zone_history_rows(samples, pattern=IRRIGATION_ZONE):
+    """
+    (entryDate, zone, state) of every zone state in the samples whose key matches the pattern
+    """
+    rows = list()
+    for sample in samples:
+        for key, value in sample.items():
+            match = pattern.match(key)
+            if match and value is not None:
+                rows.append((sample["entryDate"], int(match.group(1)), value))
+    return rows
+
+
+def write_history_table(samples):
+    """
+    Insert history samples into the history table, its rollups, zone_history and alarm_zone_history
+    """
+    rows = [dict((parameter, sample.get(parameter)) for parameter in HISTORY_PARAMETERS) for sample in samples]
+    with DATABASE.transaction() as cursor:
+        cursor.executemany(HISTORY_UPDATE_SQL, rows)
+        cursor.executemany(ZONE_HISTORY_SQL, zone_history_rows(samples))
+        cursor.executemany(ALARM_ZONE_HISTORY_SQL, zone_history_rows(samples, ALARM_ZONE))
+        update_rollups(cursor, [row["entryDate"] for row in rows])
+
+
+# Samples are written in batches: [history] batch_size samples or after flush_interval seconds
+HISTORY_WRITER = HistoryWriter(write_history,
+                               batch_size=get_setting("history", "batch_size", 32),
+                               max_delay=get_setting("history", "flush_interval", 60.0))
+
 
 def update_history(data):
     """
-    Add a history data record to the history table
+    Queue a history data record for the history table
+    """
+    HISTORY_WRITER.add(data)
+
+
+def flush_history():
+    """
+    Write the queued history records now
+    """
+    return HISTORY_WRITER.flush()
+
+
+def flush_before_read():
+    """
+    Write the queued history records before a read.  A batch that fails to write is logged
+    and left queued, so the read returns what was already written.
     """
-    conn = sqlite3.connect("house.db")
-    cursor = conn.cursor()
     try:
-        cursor.execute(HISTORY_UPDATE_SQL, data)
-        conn.commit()
-    except Exception as e:
-        print e
-
-
-HISTORY_SQL = """SELECT CAST(strftime('%s', entryDate) as INTEGER) as dt,
-                        fan_state,cool_state,
-                        heat_state, irrigation_zone1, irrigation_zone2,
-                        irrigation_zone3, irrigation_zone4,
-                        alarm_zone1, alarm_zone2,
-                        alarm_zone3, alarm_zone4,
-                        alarm_zone5, alarm_zone6,
-                        alarm_zone7, alarm_zone8,
-                        alarm_zone9, inside_temp,
-                        inside_humidity, outside_temp,
-                        outside_humdity, rainfall,
-                        wind_speed FROM history 
+        flush_history()
+    except Exception:
+        logging.exception("History flush failed")
+
+
+HISTORY_FIELDS = ["fan_state", "cool_state",
+                  "heat_state", "irrigation_zone1", "irrigation_zone2",
+                  "irrigation_zone3", "irrigation_zone4",
+                  "alarm_zone1", "alarm_zone2",
+                  "alarm_zone3", "alarm_zone4",
+                  "alarm_zone5", "alarm_zone6",
+                  "alarm_zone7", "alarm_zone8",
+                  "alarm_zone9", "inside_temp",
+                  "inside_humidity", "outside_temp",
+                  "outside_humidity", "rainfall",
+                  "wind_speed"]
+
+# [history] store = segments also keeps samples in day files under [history] segments_path, and
+# retrieve_history and retrieve_history_range read them from there.  The history table and its
+# rollups are still written: history_stream and the rollups read the table.
+HISTORY_STORE = None
+if get_setting("history", "store", "sqlite") == "segments":
+    HISTORY_STORE = SegmentStore(get_setting("history", "segments_path", "history"), HISTORY_FIELDS)
+
+HISTORY_DT = "CAST(strftime('%s', entryDate) as INTEGER) as dt"
+
+HISTORY_SELECT = "SELECT %s, %s FROM history" % (HISTORY_DT, ", ".join(HISTORY_FIELDS))
+
+HISTORY_SQL = HISTORY_SELECT + """
                         WHERE entryDate > date('now', '-12 hours')
                         ORDER BY entryDate ASC"""
 
+HISTORY_RANGE_SQL = HISTORY_SELECT + " WHERE entryDate >= :start AND entryDate < :end ORDER BY entryDate ASC"
+
+HISTORY_COUNT_SQL = "SELECT COUNT(*) FROM history WHERE entryDate >= :start AND entryDate < :end"
+
 
 def dict_factory(cursor, row):
     """
@@ -218,15 +323,188 @@ def dict_factory(cursor, row):
     return d
 
 
-def retrieve_history():
+def history_window():
+    """
+    Start of the samples retrieve_history returns: the same window as HISTORY_SQL
+    """
+    return datetime.combine((datetime.utcnow() - timedelta(hours=12)).date(), datetime.min.time())
+
+
+def store_history(store, start, end, columnar):
+    """
+    The samples of a SegmentStore from start to end, as retrieve_history returns them
+    """
+    if columnar:
+        return with_nulls(store.columns(start, end))
+    names = ["dt"] + store.fields
+    return [dict(zip(names, row)) for row in store.rows(start, end)]
+
+
+def retrieve_history(columnar=False):
     """
-    Get all the data from the history table
+    Get all the data from the history table.
+    columnar returns {column: array of values} instead of a list of row dictionaries.
     """
-    conn = sqlite3.connect("house.db")
-    conn.row_factory = dict_factory
+    flush_before_read()
+    with DATABASE.timed("retrieve_history"):
+        if HISTORY_STORE is not None:
+            return store_history(HISTORY_STORE, history_window(), None, columnar)
+        cursor = DATABASE.connection().cursor()
+        if not columnar:
+            cursor.row_factory = dict_factory
+        try:
+            cursor.execute(HISTORY_SQL)
+            return fetch_columns(cursor) if columnar else cursor.fetchall()
+        except Exception:
+            logging.exception("History read failed")
+
+
+def retrieve_history_range(start, end, points, columnar=False):
+    """
+    History from start to end (datetimes) in no more than points rows.  Raw samples if they fit,
+    otherwise hourly or daily rollups.  Returns {"resolution": "raw", "hour" or "day", "rows": [...]}
+    or with columnar {"resolution": ..., "columns": {column: array of values}}
+    With the segment store raw samples are read from it.  Rollups are always read from the table.
+    """
+    flush_before_read()
+    with DATABASE.timed("retrieve_history_range"):
+        conn = DATABASE.connection()
+        data = {"start": start, "end": end}
+        if HISTORY_STORE is not None:
+            raw_rows = HISTORY_STORE.count(start, end)
+        else:
+            raw_rows = conn.execute(HISTORY_COUNT_SQL, data).fetchone()[0]
+        resolution = choose_resolution(start, end, points, raw_rows)
+        if resolution == "raw" and HISTORY_STORE is not None:
+            return {"resolution": resolution,
+                    "columns" if columnar else "rows": store_history(HISTORY_STORE, start, end, columnar)}
+
+        cursor = conn.cursor()
+        if not columnar:
+            cursor.row_factory = dict_factory
+        cursor.execute(HISTORY_RANGE_SQL if resolution == "raw" else ROLLUP_SQL[resolution], data)
+        if columnar:
+            return {"resolution": resolution, "columns": fetch_columns(cursor)}
+        return {"resolution": resolution, "rows": cursor.fetchall()}
+
+
+def history_stream(start=None, end=None, fields=None, since_id=None, rows=256):
+    """
+    Read history without holding it all in memory.  Only rows from start to end (datetimes) and
+    after the id since_id are read.  fields limits the columns.  Every row has its id and dt.
+    Returns (column names, generator of lists of up to rows row tuples).
+    """
+    fields = [field for field in fields if field in HISTORY_FIELDS] if fields else HISTORY_FIELDS
+    conditions = list()
+    data = dict()
+    if start is not None:
+        conditions.append("entryDate >= :start")
+        data["start"] = start
+    if end is not None:
+        conditions.append("entryDate < :end")
+        data["end"] = end
+    if since_id is not None:
+        conditions.append("id > :since_id")
+        data["since_id"] = since_id
+
+    sql = "SELECT id, %s, %s FROM history" % (HISTORY_DT, ", ".join(fields))
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    # Syncing clients follow the ids.  Ranges follow time.
+    sql += " ORDER BY id ASC" if since_id is not None else " ORDER BY entryDate ASC"
+
+    def chunks():
+        flush_before_read()
+        cursor = DATABASE.connection().cursor()
+        try:
+            cursor.execute(sql, data)
+            while True:
+                chunk = cursor.fetchmany(rows)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            cursor.close()
+
+    return ["id", "dt"] + fields, chunks()
+
+
+ZONE_HISTORY_RANGE_SQL = """SELECT CAST(strftime('%%s', entryDate) as INTEGER) as dt, zone, state FROM %s
+                            WHERE entryDate >= :start AND entryDate < :end ORDER BY entryDate ASC, zone ASC"""
+
+ZONE_HISTORY_TABLES = {"irrigation": "zone_history", "alarm": "alarm_zone_history"}
+
+
+def retrieve_zone_history(start, end, system="irrigation"):
+    """
+    Irrigation (or alarm) zone states from start to end (datetimes) as {zone number: [[dt, state], ...]}
+    """
+    flush_before_read()
+    zones = OrderedDict()
+    with DATABASE.timed("retrieve_zone_history"):
+        cursor = DATABASE.connection().cursor()
+        cursor.execute(ZONE_HISTORY_RANGE_SQL % ZONE_HISTORY_TABLES[system], {"start": start, "end": end})
+        for dt, zone, state in cursor.fetchall():
+            zones.setdefault(zone, list()).append([dt, state])
+    return zones
+
+
+QUERY_STATS_SQL = """INSERT INTO query_stats (recorded, name, queries, average_ms, max_ms, history_rows)
+                     VALUES (:recorded, :name, :queries, :average_ms, :max_ms, :history_rows)"""
+
+RECENT_QUERY_STATS_SQL = """SELECT recorded, name, queries, average_ms, max_ms, history_rows FROM query_stats
+                            ORDER BY recorded DESC LIMIT :limit"""
+
+
+def history_rows():
+    """
+    Samples held by the history table
+    """
+    return DATABASE.connection().execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+
+def record_query_stats(now):
+    """
+    Keep the query timings since the last call with the size of history, so slow queries
+    can be matched to the table growing
+    """
+    rows = history_rows()
+    stats = [dict(status, recorded=now, name=name, history_rows=rows)
+             for name, status in sorted(DATABASE.timings.status(reset=True).items())]
+    with DATABASE.transaction() as cursor:
+        cursor.executemany(QUERY_STATS_SQL, stats)
+    return stats
+
+
+def maintain_database(now):
+    """
+    Daily upkeep: prune or archive rows past their [retention] days, free their pages
+    and keep the query timings.  Returns {table: rows removed}.
+    """
+    flush_history()
+    days = dict((option, get_setting("retention", option, default)) for _unused, option, default, _unused in RULES)
+    conn = DATABASE.connection()
+    removed = prune(conn, now, days,
+                    archive_path=get_setting("retention", "archive"),
+                    vacuum_pages=get_setting("retention", "vacuum_pages", 0))
+    # Once, after the rows are gone, for a database from before incremental auto vacuum
+    if vacuum_mode(conn):
+        logging.info("Database switched to incremental auto vacuum")
+    if HISTORY_STORE is not None and days["history_days"] > 0:
+        removed["segments"] = HISTORY_STORE.remove_before((now - timedelta(days=days["history_days"])).date())
+    record_query_stats(now)
+    return removed
+
+
+def database_status(recent=20):
+    """
+    Schema version, file size, live query timings and the most recent recorded ones
+    """
+    conn = DATABASE.connection()
     cursor = conn.cursor()
-    try:
-        cursor.execute(HISTORY_SQL)
-        return cursor.fetchall()
-    except Exception as e:
-        print e
+    cursor.row_factory = dict_factory
+    cursor.execute(RECENT_QUERY_STATS_SQL, {"limit": recent})
+    return dict(page_status(conn),
+                version=schema_version(conn),
+                queries=DATABASE.timings.status(),
+                recorded=cursor.fetchall())
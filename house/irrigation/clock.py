@@ -0,0 +1,185 @@
+"""
+clock.py
+Wall clock and virtual clock for the irrigation service
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from datetime import datetime, timedelta
+from threading import BoundedSemaphore, Condition, Thread
+import time
+
+
+class SystemClock(object):
+    """
+    Real time
+    """
+
+    def now(self):
+        return datetime.now()
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout):
+        """
+        Wait for event or timeout seconds.  Returns if the event is set.
+        """
+        return event.wait(timeout)
+
+    def semaphore(self, value):
+        """
+        Semaphore for threads that use this clock
+        """
+        return BoundedSemaphore(value)
+
+    def thread(self, target, name, args=()):
+        """
+        Start a thread that uses this clock
+        """
+        thread = Thread(group=None, target=target, name=name, args=args)
+        thread.start()
+        return thread
+
+    def join(self, threads):
+        """
+        Wait for threads started with thread()
+        """
+        for thread in threads:
+            thread.join()
+
+
+class VirtualClock(SystemClock):
+    """
+    Simulated time that jumps ahead instead of sleeping.
+    Time only moves when every thread using the clock is asleep or blocked on one of its
+    semaphores.  It then jumps to the earliest wake up, so threads sleeping in parallel stay in step.
+    The thread that creates the clock is its first user.
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.start_time = time.mktime(start.timetuple())
+        self.elapsed = 0.0
+        self.condition = Condition()
+        self.users = 1
+        self.blocked = 0
+        self.wakes = list()
+
+    def now(self):
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def time(self):
+        return self.start_time + self.elapsed
+
+    def sleep(self, seconds):
+        with self.condition:
+            wake = self.elapsed + max(0.0, seconds)
+            self.wakes.append(wake)
+            while self.elapsed < wake:
+                self.idle()
+            self.wakes.remove(wake)
+
+    def idle(self):
+        """
+        Called holding the condition by a thread that cannot go on yet.
+        Moves time if nothing else is running, otherwise waits for a change.
+        """
+        earliest = min(self.wakes) if self.wakes else None
+        if earliest is not None and earliest > self.elapsed and len(self.wakes) + self.blocked >= self.users:
+            self.elapsed = earliest
+            self.condition.notify_all()
+        else:
+            self.condition.wait()
+
+    def wait(self, event, timeout):
+        if not event.is_set() and timeout is not None:
+            self.sleep(timeout)
+        return event.is_set()
+
+    def semaphore(self, value):
+        return VirtualSemaphore(self, value)
+
+    def thread(self, target, name, args=()):
+        def run():
+            try:
+                target(*args)
+            finally:
+                self._leave()
+
+        with self.condition:
+            self.users += 1
+        return SystemClock.thread(self, run, name)
+
+    def join(self, threads):
+        # A joining thread does not hold the clock back
+        self._leave()
+        try:
+            SystemClock.join(self, threads)
+        finally:
+            with self.condition:
+                self.users += 1
+
+    def _leave(self):
+        with self.condition:
+            self.users -= 1
+            self.condition.notify_all()
+
+
+class VirtualSemaphore(object):
+    """
+    Semaphore whose waiting threads let a VirtualClock move on.
+    A release hands the slot straight to a waiting thread so time cannot move in between.
+    """
+
+    def __init__(self, clock, value):
+        self.clock = clock
+        self.value = value
+        self.waiting = 0
+        self.granted = 0
+
+    def acquire(self):
+        clock = self.clock
+        with clock.condition:
+            if self.value > 0:
+                self.value -= 1
+                return True
+            self.waiting += 1
+            clock.blocked += 1
+            while not self.granted:
+                clock.idle()
+            self.granted -= 1
+            return True
+
+    def release(self):
+        clock = self.clock
+        with clock.condition:
+            if self.waiting:
+                self.waiting -= 1
+                clock.blocked -= 1
+                self.granted += 1
+                clock.condition.notify_all()
+            else:
+                self.value += 1
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
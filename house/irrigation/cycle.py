@@ -0,0 +1,61 @@
+"""
+cycle.py
+Follow the irrigation controller's cycle timer
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+# Seconds past the local deadline before the cycle end is verified
+CYCLE_MARGIN = 0.5
+
+# cycle_end - millis() is unsigned on the controller.  Larger values mean the timer just ran out.
+CYCLE_OVERFLOW = 2 ** 31
+
+
+def cycle_milliseconds(state):
+    """
+    Milliseconds left on the controller cycle timer
+    """
+    milliseconds = int(state["cycle_milliseconds"])
+    return 0 if milliseconds >= CYCLE_OVERFLOW else milliseconds
+
+
+def cycle_deadline(state, clock):
+    """
+    Time on clock the controller cycle timer runs out
+    """
+    return clock.time() + cycle_milliseconds(state) / 1000.0
+
+
+def wait_for_cycle(read_state, clock, deadline=None, interval=300.0):
+    """
+    A cycle is running.  Sleep on clock until its deadline, calling read_state() for the
+    controller state every interval seconds, and confirm the cycle ended.
+    """
+    if deadline is None:
+        state = read_state()
+        if cycle_milliseconds(state) <= 0:
+            return
+        deadline = cycle_deadline(state, clock)
+
+    while True:
+        clock.sleep(max(0.0, min(deadline - clock.time() + CYCLE_MARGIN, interval)))
+        state = read_state()
+        if cycle_milliseconds(state) <= 0:
+            return
+        # Follow the controller if its timer drifted or was restarted
+        deadline = cycle_deadline(state, clock)
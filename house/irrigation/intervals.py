@@ -0,0 +1,107 @@
+"""
+intervals.py
+Static interval tree
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from bisect import bisect_right
+
+
+class IntervalTree(object):
+    """
+    Centered interval tree over half open intervals [start, end).
+    stab(point) returns the values of the intervals containing point in O(log n + matches).
+    """
+
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, intervals):
+        """
+        intervals: list of (start, end, value).  Empty intervals are ignored.
+        """
+        intervals = [interval for interval in intervals if interval[0] < interval[1]]
+        self.left = self.right = None
+        self.by_start = self.by_end = ()
+        self.center = None
+        if not intervals:
+            return
+
+        # The median start keeps at least its own interval at this node
+        starts = sorted(start for start, _unused, _unused in intervals)
+        self.center = starts[len(starts) // 2]
+
+        left, right, here = list(), list(), list()
+        for interval in intervals:
+            if interval[1] <= self.center:
+                left.append(interval)
+            elif interval[0] > self.center:
+                right.append(interval)
+            else:
+                here.append(interval)
+
+        self.by_start = sorted(here, key=lambda interval: interval[0])
+        self.by_end = sorted(here, key=lambda interval: interval[1], reverse=True)
+        if left:
+            self.left = IntervalTree(left)
+        if right:
+            self.right = IntervalTree(right)
+
+    def stab(self, point):
+        """
+        Values of the intervals that contain point
+        """
+        found = list()
+        node = self
+        while node is not None and node.center is not None:
+            if point < node.center:
+                # Intervals here end after the center.  Those starting at or before point match.
+                for start, _unused, value in node.by_start:
+                    if start > point:
+                        break
+                    found.append(value)
+                node = node.left
+            else:
+                # Intervals here start at or before the center.  Those ending after point match.
+                for _unused, end, value in node.by_end:
+                    if end <= point:
+                        break
+                    found.append(value)
+                node = node.right
+        return found
+
+
+class StartIndex(object):
+    """
+    Interval starts in order.  after(point) finds the first start past point in O(log n).
+    """
+
+    def __init__(self, starts):
+        """
+        starts: list of (start, value)
+        """
+        ordered = sorted(starts, key=lambda item: item[0])
+        self.points = [start for start, _unused in ordered]
+        self.values = [value for _unused, value in ordered]
+
+    def __len__(self):
+        return len(self.points)
+
+    def after(self, point):
+        """
+        Position of the first start greater than point.  May equal len(self).
+        """
+        return bisect_right(self.points, point)
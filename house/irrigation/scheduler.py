@@ -0,0 +1,327 @@
+"""
+scheduler.py
+Irrigation schedule rules kept in an interval index
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.data.service_data import get_schedule, get_schedule_exclusions, get_completed_schedules
+from house.irrigation.intervals import IntervalTree, StartIndex
+from datetime import datetime, timedelta
+from threading import Event, Lock
+
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+# Weeks searched for the next window of rules limited by date ranges and exclusions
+SEARCH_WEEKS = 53
+
+
+def parse_date(value):
+    """
+    YYYY-MM-DD to a date.  None stays None.
+    """
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def week_start(moment):
+    """
+    Midnight on the Monday of moment's week
+    """
+    return datetime(moment.year, moment.month, moment.day) - timedelta(days=moment.weekday())
+
+
+def minute_of_week(moment):
+    """
+    Minutes since Monday midnight
+    """
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute + moment.second / 60.0
+
+
+class ScheduleRule(object):
+    """
+    A window from start to end minutes past midnight on a weekday (or every day when day is None),
+    optionally limited to first_date through last_date and skipping excluded dates.
+    A window ending before it starts runs past midnight.
+    """
+
+    __slots__ = ("schedule_id", "day", "start", "end", "first_date", "last_date", "durations", "exclusions")
+
+    def __init__(self, schedule_id, day, start, end, first_date=None, last_date=None, durations=(), exclusions=()):
+        self.schedule_id = schedule_id
+        self.day = day
+        self.start = start
+        self.end = end
+        self.first_date = first_date
+        self.last_date = last_date
+        self.durations = tuple(durations)
+        self.exclusions = frozenset(exclusions)
+
+    @classmethod
+    def from_row(cls, row, exclusions=()):
+        """
+        Row from get_schedule: (id, day, start minute, end minute, first date, last date, zone minutes...)
+        """
+        return cls(row[0], row[1], row[2], row[3], parse_date(row[4]), parse_date(row[5]), row[6:], exclusions)
+
+    def length(self):
+        """
+        Minutes the window is open
+        """
+        return (self.end - self.start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+
+    def days(self):
+        return range(7) if self.day is None else [self.day]
+
+    def intervals(self):
+        """
+        (start, end, offset) of each window in minutes of the week.  Windows running past the
+        end of the week are split.  offset is where the whole window starts.
+        """
+        for day in self.days():
+            start = day * MINUTES_PER_DAY + self.start
+            end = start + self.length()
+            yield start, min(end, MINUTES_PER_WEEK), start
+            if end > MINUTES_PER_WEEK:
+                # The part in the next week started in the previous one
+                yield 0, end - MINUTES_PER_WEEK, start - MINUTES_PER_WEEK
+
+    def valid_on(self, date):
+        """
+        Return if a window starting on date may run
+        """
+        if self.first_date is not None and date < self.first_date:
+            return False
+        if self.last_date is not None and date > self.last_date:
+            return False
+        return date not in self.exclusions
+
+
+class Window(object):
+    """
+    One occurrence of a schedule rule.  Due from start until end.
+    """
+
+    __slots__ = ("start", "end", "rule")
+
+    def __init__(self, start, end, rule):
+        self.start = start
+        self.end = end
+        self.rule = rule
+
+    @property
+    def schedule_id(self):
+        return self.rule.schedule_id
+
+    @property
+    def durations(self):
+        return self.rule.durations
+
+    def key(self):
+        """
+        A schedule entry runs once per day.  The day is the one the window started on,
+        the date its cycle is recorded under.
+        """
+        return self.schedule_id, self.start.date()
+
+    def __repr__(self):
+        return "Window(%s, %s - %s)" % (self.schedule_id, self.start, self.end)
+
+
+class ScheduleIndex(object):
+    """
+    Every rule's weekly windows in an interval tree.  active() and next_window() take
+    O(log n) plus the matching windows however many rules there are.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        pieces = list()
+        starts = list()
+        for rule in rules:
+            for start, end, offset in rule.intervals():
+                pieces.append((start, end, (offset, rule)))
+                if start == offset:
+                    starts.append((offset, rule))
+        self.tree = IntervalTree(pieces)
+        self.starts = StartIndex(starts)
+
+    def window(self, monday, offset, rule):
+        start = monday + timedelta(minutes=offset)
+        return Window(start, start + timedelta(minutes=rule.length()), rule)
+
+    def active(self, moment):
+        """
+        Windows open at moment, earliest first
+        """
+        monday = week_start(moment)
+        windows = [self.window(monday, offset, rule) for offset, rule in self.tree.stab(minute_of_week(moment))]
+        windows = [window for window in windows if window.rule.valid_on(window.start.date())]
+        return sorted(windows, key=lambda window: (window.start, window.schedule_id))
+
+    def next_window(self, moment, skip=()):
+        """
+        First window starting after moment whose key is not in skip, or None
+        """
+        if not len(self.starts):
+            return None
+        monday = week_start(moment)
+        position = self.starts.after(minute_of_week(moment))
+        remaining = SEARCH_WEEKS * len(self.starts) + 1
+        while remaining:
+            remaining -= 1
+            if position == len(self.starts):
+                monday += timedelta(days=7)
+                position = 0
+            window = self.window(monday, self.starts.points[position], self.starts.values[position])
+            if window.rule.valid_on(window.start.date()) and window.key() not in skip:
+                return window
+            position += 1
+        return None
+
+
+def event_wait(event, timeout):
+    """
+    Sleep until event is set or timeout seconds pass.  Returns if the event is set.
+    """
+    return event.wait(timeout)
+
+
+def load_rules(rows, exclusions):
+    """
+    Build the rules.  exclusions is a list of (schedule_id, date).  A schedule_id of None excludes every rule.
+    """
+    excluded = dict()
+    for schedule_id, date in exclusions:
+        excluded.setdefault(schedule_id, set()).add(parse_date(date))
+    return [ScheduleRule.from_row(row, excluded.get(row[0], set()) | excluded.get(None, set())) for row in rows]
+
+
+class IrrigationScheduler(object):
+    """
+    Loads the schedule once into an interval index.
+    wait() sleeps until the next window opens instead of polling the database.
+    clock returns the current datetime and sleeper(event, timeout) does the sleeping.
+    """
+
+    def __init__(self, load=get_schedule, exclusions=get_schedule_exclusions, completed=get_completed_schedules,
+                 clock=datetime.now, sleeper=event_wait):
+        self.load = load
+        self.exclusions = exclusions
+        self.completed = completed
+        self.clock = clock
+        self.sleeper = sleeper
+        self.lock = Lock()
+        self.changed = Event()
+        self.rows = None
+        self.index = ScheduleIndex([])
+        self.ran = set()
+
+    def rebuild(self, rows=None, exclusions=None):
+        """
+        Load the schedule and index its windows
+        """
+        rows = [tuple(row) for row in (rows if rows is not None else self.load())]
+        exclusions = exclusions if exclusions is not None else self.exclusions()
+        index = ScheduleIndex(load_rules(rows, exclusions))
+        now = self.clock()
+        # A window open past midnight is recorded under the day it started
+        days = [now - timedelta(days=1), now]
+        ran = set((schedule_id, day.date()) for day in days for schedule_id in self.completed(day))
+
+        with self.lock:
+            self.rows = (rows, list(exclusions))
+            self.index = index
+            self.ran |= ran
+            self.changed.clear()
+
+    def refresh(self):
+        """
+        Rebuild if the schedule no longer matches the loaded rules
+        """
+        rows = [tuple(row) for row in self.load()]
+        exclusions = list(self.exclusions())
+        if (rows, exclusions) != self.rows:
+            self.rebuild(rows, exclusions)
+
+    def invalidate(self):
+        """
+        The schedule changed.  Wake wait() so it rebuilds.
+        """
+        self.changed.set()
+
+    def next_due(self):
+        """
+        The next window that has not run, or None
+        """
+        now = self.clock()
+        with self.lock:
+            for window in self.index.active(now):
+                if window.key() not in self.ran:
+                    return window
+            return self.index.next_window(now, self.ran)
+
+    def due(self):
+        """
+        Return the window that is open now and has not run, or None.
+        It is returned again until mark_run() is called for it.
+        """
+        if self.rows is None or self.changed.is_set():
+            self.rebuild()
+
+        now = self.clock()
+        with self.lock:
+            yesterday = now.date() - timedelta(days=1)
+            self.ran = set(key for key in self.ran if key[1] >= yesterday)
+            for window in self.index.active(now):
+                if window.key() not in self.ran:
+                    return window
+        return None
+
+    def mark_run(self, window):
+        """
+        The window's cycle was recorded.  Called once the cycle is in the database,
+        so a window whose cycle failed to start is tried again.
+        """
+        with self.lock:
+            self.ran.add(window.key())
+
+    def wait(self, until=None):
+        """
+        Sleep until a window opens, the schedule changes or until (a datetime) passes.
+        Returns the open window or None.
+        """
+        while True:
+            window = self.due()
+            if window is not None:
+                return window
+
+            now = self.clock()
+            upcoming = self.next_due()
+            wake = upcoming.start if upcoming is not None else None
+            if until is not None and (wake is None or until < wake):
+                wake = until
+            if wake is not None and wake <= now:
+                return None
+
+            timeout = (wake - now).total_seconds() if wake is not None else None
+            if self.sleeper(self.changed, timeout):
+                continue
+            if until is not None and self.clock() >= until:
+                return self.due()
@@ -18,54 +18,71 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from socket import socket, AF_INET, SOCK_STREAM
-from time import sleep
-import logging
+from house.controllers.transport import get_pool
+from house.controllers.breaker import get_breaker, get_retry_policy, RetryPolicy
+from house.controllers.state import ZoneState
 
 
-ZONE_KEYS = ["zone1", "zone2", "zone3", "zone4"]
-ZONE_NAMES = ["ZONE 1", "ZONE 2", "ZONE 3", "ZONE 4"]
-ZONE_DEFINITIONS = dict(zip(ZONE_KEYS + ["cycle_milliseconds"], ZONE_NAMES + ["cycle_time"]))
-ZONE_STATE_TEXT = dict(zip(ZONE_KEYS, [("off", "on") for _ in range(len(ZONE_KEYS))]))
+# Relays of a controller unless [irrigation] zones_per_controller says otherwise.
+# Commands number a relay with two digits, so a controller serves at most MAX_RELAYS.
+RELAYS = 4
+MAX_RELAYS = 99
+
+
+def zone_keys(count):
+    """
+    State keys of count relays: zone1, zone2...
+    """
+    return ["zone%s" % relay for relay in range(1, count + 1)]
+
+
+def zone_definitions(keys):
+    """
+    Descriptions and state text of the zone keys for ZoneState.status
+    """
+    definitions = dict((key, "ZONE %s" % key[4:]) for key in keys)
+    definitions["cycle_milliseconds"] = "cycle_time"
+    return definitions, dict((key, ("off", "on")) for key in keys)
+
+
+ZONE_KEYS = zone_keys(RELAYS)
+ZONE_NAMES = ["ZONE %s" % relay for relay in range(1, RELAYS + 1)]
+ZONE_DEFINITIONS, ZONE_STATE_TEXT = zone_definitions(ZONE_KEYS)
+
+# Seconds to wait for the controller to accept a connection and to reply
+CONNECT_TIMEOUT = 1.0
+REPLY_TIMEOUT = 2.0
+
+# Retries of a sprinkler controller unless the [retry] settings say otherwise
+RETRY_POLICY = RetryPolicy(attempts=3, base_delay=0.2, max_delay=1.0, budget=3.0)
 
 
 def send_message(message, host, port):
     """
     Send the message to the irrigation controller retry if the message fails
     """
-    # Retry up to 3 times if an error occurs
-    retry_count = 3
-    
-    while retry_count > 0:
-        try:
-            retry_count -= 1
-            return _send_message(message, host, port)
-        except Exception, ex:
-            logging.exception(ex)
-            if retry_count <= 0:
-                raise
-            sleep(2)
+    return send_messages([message], host, port)[0]
             
 
-def _send_message(message, host, port):
+def send_messages(messages, host, port):
     """
-    Send a message to the irrigation controller
+    Send a sequence of messages in one round trip and return every reply.
+    Failures are retried with backoff.  Raises ControllerUnavailable without
+    contacting the controller while its circuit breaker is open.
     """
-    s = socket(AF_INET, SOCK_STREAM)
-    s.connect((host, port))
-    data_buffer = ""
-    try:
-        s.sendall(message)
+    pool = get_pool(host, port, timeout=REPLY_TIMEOUT, connect_timeout=CONNECT_TIMEOUT)
+    policy = get_retry_policy(host, port, RETRY_POLICY)
+    return get_breaker(host, port).call(policy, pool.request_many, messages)
 
-        while True:
-            data = s.recv(2048)
-            if not data:
-                break
-            data_buffer += data
-    finally:
-        s.close()
-    
-    return data_buffer.strip()
+
+def zone_command(zone, state):
+    """
+    Message turning a relay on or off: zone01-on ... zone12-off
+    """
+    zone = int(zone)
+    if not 0 < zone <= MAX_RELAYS:
+        raise ValueError("Sprinkler relay %s is not 1-%s" % (zone, MAX_RELAYS))
+    return "zone%02d-%s" % (zone, state)
 
 
 def sprinkler_state(host, port):
@@ -75,6 +92,14 @@ def sprinkler_state(host, port):
     return state_data(send_message("status", host, port))
 
 
+def sprinkler_zone_state(host, port):
+    """
+    Read the valve states as a ZoneState with a key for every relay the controller sent
+    """
+    state = state_data(send_message("status", host, port))
+    return ZoneState.from_mapping(state_keys(state), state)
+
+
 def sprinkler_status(host, port):
     """
     Return the cycle milliseconds left if the cycle
@@ -86,34 +111,51 @@ def state_data(status_message):
     """
     Format and return the status data from the irrigation controller
     """
-    # Controller data is returned in this format 0:1:0:0:12345
-    return dict(zip(ZONE_KEYS + ["cycle_milliseconds"], status_message.split(":")))
+    # Controller data is returned in this format 0:1:0:0:12345, a field per relay then the milliseconds
+    fields = status_message.strip().split(":")
+    return dict(zip(zone_keys(len(fields) - 1) + ["cycle_milliseconds"], fields))
+
+
+def state_keys(state_data):
+    """
+    Zone keys of the relays in the status data, in relay order
+    """
+    return sorted((key for key in state_data if key.startswith("zone")), key=lambda key: int(key[4:]))
 
 
 def status_data(state_data):
     """
     Return the formatted status data
     """
+    keys = state_keys(state_data)
+    zones = ZoneState.from_mapping(keys, state_data)
     return {"cycle_milliseconds": state_data["cycle_milliseconds"],
-            "zones": [{"zone": zone,
-                       "description": ZONE_DEFINITIONS.get(zone, "unknown"),
-                       "status": ZONE_STATE_TEXT[zone][int(status)]}
-                      for zone, status in state_data.items() if zone in ZONE_KEYS]}
+            "zones": zones.status(*zone_definitions(keys))}
 
 
 def sprinkler_control(zone, state, host, port):
     """
     Turn a zone on or off
     """
-    send_message("zone0%s-%s" % (str(zone), state), host, port)
-    return sprinkler_status(host, port)
+    replies = send_messages([zone_command(zone, state), "status"], host, port)
+    return status_data(state_data(replies[-1]))
 
 
 def sprinkler_start_cycle(milliseconds, host, port):
     """
     Set the irrigation controller shutoff timer
     """
-    return status_data(state_data(send_message("startcycle-%s" % str(milliseconds, host, port))))
+    return status_data(state_data(send_message("startcycle-%s" % str(milliseconds), host, port)))
+
+
+def sprinkler_start_zone(zone, milliseconds, host, port):
+    """
+    End any cycle, start the shutoff timer and open the zone in one round trip.
+    The timer is started before the valve opens to prevent runaway watering.
+    """
+    replies = send_messages(["endcycle", "startcycle-%s" % str(milliseconds), zone_command(zone, "on"), "status"],
+                            host, port)
+    return status_data(state_data(replies[-1]))
 
 
 def sprinkler_end_cycle(host, port):
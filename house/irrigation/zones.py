@@ -0,0 +1,160 @@
+"""
+zones.py
+Irrigation zones spread over one or more sprinkler controllers
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.irrigation.sprinkler import RELAYS, MAX_RELAYS, state_keys, zone_definitions
+from house.controllers.state import ZoneState
+
+
+class IrrigationZone(object):
+    """
+    A zone numbered across the whole property and the controller relay that opens it
+    """
+
+    __slots__ = ("number", "name", "host", "port", "relay")
+
+    def __init__(self, number, name, host, port, relay):
+        self.number = number
+        self.name = name
+        self.host = host
+        self.port = port
+        self.relay = relay
+
+    @property
+    def controller(self):
+        return self.host, self.port
+
+    def __repr__(self):
+        return "IrrigationZone(%s, %s:%s relay %s)" % (self.number, self.host, self.port, self.relay)
+
+
+def irrigation_controllers(settings):
+    """
+    Return the (host, port) of each sprinkler controller.
+    [irrigation] controllers = host:port, host:port  or  irrigation_host and irrigation_port
+    """
+    if settings.has_option("irrigation", "controllers"):
+        return [tuple(controller.strip().split(":"))
+                for controller in settings.get("irrigation", "controllers").split(",")]
+    return [(settings.get("irrigation", "irrigation_host"), settings.get("irrigation", "irrigation_port"))]
+
+
+def zone_layout(controllers, zones_per_controller=RELAYS, names=None):
+    """
+    Number the relays of every controller in order: controller 1 has zones 1-4, controller 2 has 5-8...
+    Raises ValueError for a relay count the controller commands cannot address.
+    """
+    if not 0 < zones_per_controller <= MAX_RELAYS:
+        raise ValueError("zones_per_controller %s is not 1-%s" % (zones_per_controller, MAX_RELAYS))
+    zones = list()
+    for host, port in controllers:
+        for relay in range(1, zones_per_controller + 1):
+            number = len(zones) + 1
+            name = names[number - 1] if names and number <= len(names) else "ZONE %s" % number
+            zones.append(IrrigationZone(number, name, host, port, relay))
+    return zones
+
+
+def configured_zones(settings):
+    """
+    Return the zones from the settings.
+    [irrigation] zones_per_controller = 4
+    [irrigation] zone_names = Front Lawn, Back Lawn, ...
+    """
+    zones_per_controller = RELAYS
+    if settings.has_option("irrigation", "zones_per_controller"):
+        zones_per_controller = settings.getint("irrigation", "zones_per_controller")
+    names = None
+    if settings.has_option("irrigation", "zone_names"):
+        names = [name.strip() for name in settings.get("irrigation", "zone_names").split(",")]
+    return zone_layout(irrigation_controllers(settings), zones_per_controller, names)
+
+
+def find_zone(zones, number):
+    """
+    Return the zone with the number or None
+    """
+    number = int(number)
+    if 0 < number <= len(zones):
+        return zones[number - 1]
+    return None
+
+
+def zones_state(zones, read_state):
+    """
+    State of every zone keyed zone1, zone2... by zone number, in the form sprinkler_state
+    returns for one controller.  read_state(host, port) reads each controller once.
+    cycle_milliseconds is the longest cycle left on any controller.
+    """
+    states = dict()
+    data = dict()
+    for zone in zones:
+        if zone.controller not in states:
+            state = states[zone.controller] = read_state(zone.host, zone.port)
+            if int(state["cycle_milliseconds"]) >= int(data.get("cycle_milliseconds", 0)):
+                data["cycle_milliseconds"] = state["cycle_milliseconds"]
+        # Relays the controller did not report are left out
+        relay = "zone%s" % zone.relay
+        if relay in states[zone.controller]:
+            data["zone%s" % zone.number] = states[zone.controller][relay]
+    return data
+
+
+def zones_history(zones, read_state):
+    """
+    Valve states keyed by history column, irrigation_zone1, irrigation_zone2...
+    read_state(host, port) reads each controller once.  Relays the controller did not report are left out.
+    """
+    states = dict()
+    data = dict()
+    for zone in zones:
+        if zone.controller not in states:
+            states[zone.controller] = read_state(zone.host, zone.port)
+        relay = "zone%s" % zone.relay
+        if relay in states[zone.controller]:
+            data["irrigation_zone%s" % zone.number] = states[zone.controller][relay]
+    return data
+
+
+def zones_status(zones, state):
+    """
+    Formatted status of zones_state, described with the zone names
+    """
+    keys = state_keys(state)
+    definitions, state_text = zone_definitions(keys)
+    definitions.update(("zone%s" % zone.number, zone.name) for zone in zones)
+    return {"cycle_milliseconds": state["cycle_milliseconds"],
+            "zones": ZoneState.from_mapping(keys, state).status(definitions, state_text)}
+
+
+def controller_lanes(zones, durations):
+    """
+    Group the zones with a duration by controller.  Each controller has one cycle timer
+    so its zones run one after another.  Returns a list of [(zone, duration), ...] in zone order.
+    """
+    lanes = dict()
+    order = list()
+    for zone, duration in zip(zones, durations):
+        if not duration:
+            continue
+        if zone.controller not in lanes:
+            lanes[zone.controller] = list()
+            order.append(zone.controller)
+        lanes[zone.controller].append((zone, duration))
+    return [lanes[controller] for controller in order]
@@ -18,60 +18,280 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from house.alarm.zones import get_zone_state, ZONE_DEFINITIONS, ZONE_STATE_TEXT
+from house.alarm.zones import ZONES, ZONE_DEFINITIONS, ZONE_STATE_TEXT
+from house.controllers.reactor import Reactor
+from house.controllers.transport import DEFAULT_TIMEOUT
+from house.controllers.state import ZoneState, ProtocolError, iter_bits
+from house.controllers.workers import WorkerPool
+from house.alarm.polling import AdaptiveInterval, ZoneDebouncer
+from collections import deque
+from threading import Condition, Thread
+import logging
 import time
 
 
+def describe_changes(state, changed, controller=None, detected=None):
+    """
+    Expand the changed zones of the mask into the handler format
+    """
+    zones = list()
+    for index in iter_bits(changed):
+        key = state.keys[index]
+        value = state.value(index)
+        zones.append({"key": key,
+                      "name": ZONE_DEFINITIONS[key],
+                      "state": str(value),
+                      "state_text": ZONE_STATE_TEXT[key][value],
+                      "controller": controller,
+                      "time": detected})
+    return zones
+
+
+class ChangeQueue(object):
+    """
+    Zone changes waiting for the handlers, oldest first.  Every transition is kept.
+    It holds at most size changes: put() waits for room, so handlers that fall behind
+    slow the polling down instead of losing changes.
+    """
+
+    def __init__(self, size=64):
+        self.condition = Condition()
+        self.changes = deque()
+        self.size = size
+        self.closed = False
+        # Times put() had to wait for room
+        self.full = 0
+
+    def put(self, state, changed, controller, detected):
+        """
+        Queue a change.  Waits while the queue is full.
+        """
+        with self.condition:
+            if len(self.changes) >= self.size and not self.closed:
+                self.full += 1
+                while len(self.changes) >= self.size and not self.closed:
+                    self.condition.wait()
+            self.changes.append((state, changed, controller, detected))
+            self.condition.notify_all()
+
+    def get(self):
+        """
+        Wait for the oldest change.  Returns None once closed and empty.
+        """
+        with self.condition:
+            while not self.changes and not self.closed:
+                self.condition.wait()
+            if not self.changes:
+                return None
+            change = self.changes.popleft()
+            self.condition.notify_all()
+            return change
+
+    def close(self):
+        """
+        Let get() return None after the waiting changes
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        with self.condition:
+            return len(self.changes)
+
+
+class AlarmController(object):
+    """
+    Polling state of one alarm controller
+    """
+
+    def __init__(self, host, port, interval, debouncer):
+        self.host = host
+        self.port = port
+        self.name = "%s:%s" % (host, port)
+        self.state = None
+        self.keys = ZONES
+        self.last_bits = None
+        self.interval = interval
+        self.debouncer = debouncer
+        self.poll_started = 0
+        self.changed = False
+        self.failures = 0
+
+
 class Monitor(object):
     """
-    Alarm monitoring class that watches for state changes in the alarm controller.
+    Alarm monitoring class that watches for state changes in the alarm controllers.
     If a change occurs the callback handlers are called.
+
+    The controllers are read from a select() loop so a change is seen as soon as the reply
+    arrives.  Each handler runs on its own worker and gets every change in the order it was seen.
+    Handlers do not delay the next read until queue_size changes are waiting.
+
+    The poll interval backs off from poll_interval to max_interval while the zones are quiet
+    and drops back to poll_interval after any transition.  A zone change is reported once
+    the zone has held its new state for its debounce window.
+
+    controllers: list of (host, port) of the alarm controllers
+    poll_interval: seconds between the start of each read while zones are changing
+    max_interval: seconds between reads when nothing has changed.  This bounds detection latency.
+    backoff: factor the interval grows by on each quiet read
+    debounce: dictionary of zone key to debounce window seconds
+    default_debounce: debounce window of the other zones
+    select_timeout: longest time the loop sleeps when there is nothing to do.
+    request_timeout: seconds to wait for a controller to answer.
+    journal: called with every change before it is queued for the handlers, on the polling thread.
+             Used for EventJournal.record, which must see every transition.
+    queue_size: changes waiting in the ChangeQueue, and calls waiting for each handler
+    handler_timeout: seconds a handler may run before it is abandoned.  The next change
+                     is then handed to it on a new thread.
     """
 
-    def __init__(self):
+    def __init__(self, controllers, poll_interval=.2, max_interval=1.0, backoff=1.5,
+                 debounce=None, default_debounce=0.0, select_timeout=1.0,
+                 request_timeout=DEFAULT_TIMEOUT, journal=None, queue_size=64, handler_timeout=30):
         self.handlers = list()
+        self.journal = journal
         self.enabled = True
-        self.state = None
+        self.controllers = [AlarmController(host, port,
+                                            AdaptiveInterval(poll_interval, max_interval, backoff),
+                                            ZoneDebouncer(ZONES, debounce, default_debounce))
+                            for host, port in controllers]
+        self.request_timeout = request_timeout
+        self.handler_timeout = handler_timeout
+        self.reactor = Reactor(select_timeout=select_timeout)
+        self.events = ChangeQueue(queue_size)
+        self.queue_size = queue_size
+
+    @property
+    def state(self):
+        """
+        Last state of each controller
+        """
+        return dict((controller.name, controller.state) for controller in self.controllers)
         
     def enable(self, enabled=True):
         """
         Turn on/off callback handlers.  begin() must be called again after re-enabling
         """
         self.enabled = enabled
+        if not enabled:
+            self.reactor.stop()
         
-    def add_handler(self, handler):
+    def add_handler(self, handler, timeout=None):
         """
         Add a callback handler
         callback(changed_zone[])
+        timeout overrides the monitor handler_timeout for this handler
         """
-        self.handlers.append(handler)
+        self.handlers.append((handler, timeout or self.handler_timeout))
         
     def begin(self):
         """
         Begin the alarm monitor loop
         """
+        if self.events.closed:
+            self.events = ChangeQueue(self.queue_size)
+        # One worker per handler keeps its calls in order
+        pools = [(WorkerPool(workers=1, queue_size=self.queue_size, name="alarm_handler_%s" % index),
+                  handler, timeout) for index, (handler, timeout) in enumerate(self.handlers)]
+        dispatcher = Thread(group=None, target=self.dispatch, name="alarm_dispatch", args=(pools,))
+        dispatcher.daemon = True
+        dispatcher.start()
 
-        # Read baseline
-        self.state = get_zone_state()
+        try:
+            for controller in self.controllers:
+                self.poll(controller)
+            self.reactor.run()
+        finally:
+            self.events.close()
+            dispatcher.join()
+            for pool, _unused, _unused in pools:
+                pool.close()
 
-        while self.enabled:
-            # Read state
-            new_state = get_zone_state()
+    def poll(self, controller):
+        """
+        Start a read of a controller
+        """
+        if not self.enabled:
+            self.reactor.stop()
+            return
+
+        controller.poll_started = time.time()
+        self.reactor.request(controller.host, controller.port, "status",
+                             lambda reply, error: self.on_status(controller, reply, error),
+                             timeout=self.request_timeout)
+
+    def on_status(self, controller, reply, error):
+        """
+        Controller reply received.  Schedule the next read.
+        """
+        if error is not None:
+            controller.failures += 1
+            logging.warning("Alarm controller %s read failed: %s", controller.name, error)
+        else:
+            try:
+                state = ZoneState.parse(ZONES, reply)
+            except ProtocolError:
+                logging.warning("Alarm controller %s sent: %r", controller.name, reply)
+            else:
+                # Older controllers report 8 zones
+                controller.keys = state.keys
+                self.update(controller, state.bits)
 
-            # Create a list of changed zones since the last call
-            changed = [{"key": key, 
-                        "name": ZONE_DEFINITIONS[key],
-                        "state": value, 
-                        "state_text": ZONE_STATE_TEXT[key][int(value)]}
-                       for key, value in new_state.iteritems()
-                       if value != self.state[key]]
+        self.reactor.call_later(self.next_poll(controller), self.poll, controller)
 
-            # This is now our state
-            self.state = new_state
+    def next_poll(self, controller):
+        """
+        Seconds until the next read.  Short while zones are changing or settling,
+        longer while the house is quiet.
+        """
+        now = time.time()
+        debouncer = controller.debouncer
+        active = controller.changed or debouncer.pending
+        next_time = controller.poll_started + controller.interval.next(active)
+
+        # Read again as soon as a pending zone has settled
+        deadline = debouncer.deadline()
+        if deadline is not None:
+            next_time = min(next_time, deadline)
+
+        return max(0, next_time - now)
+
+    def update(self, controller, bits):
+        """
+        Compare with the last state and queue the changed zones for the handlers
+        """
+        now = time.time()
+        controller.changed = controller.last_bits is not None and bits != controller.last_bits
+        controller.last_bits = bits
+
+        # Nothing is allocated unless a zone changed
+        changed = controller.debouncer.update(bits, now)
+        if not changed:
+            if controller.state is None:
+                controller.state = ZoneState(controller.keys, bits)
+            return
+
+        # This is now our state
+        controller.state = ZoneState(controller.keys, controller.debouncer.reported)
+        if self.journal is not None:
+            try:
+                self.journal(describe_changes(controller.state, changed, controller.name, now))
+            except Exception, ex:
+                logging.exception(ex)
+        self.events.put(controller.state, changed, controller.name, now)
+
+    def dispatch(self, pools):
+        """
+        Hand each change, in order, to every handler's worker.  Runs on its own thread.
+        Waits while a handler's queue is full so changes queue here instead of being dropped.
+        """
+        while True:
+            event = self.events.get()
+            if event is None:
+                break
 
-            # call the handlers
-            if changed:
-                for handler in self.handlers:
-                    handler(changed)
-                    
-            time.sleep(.2)
\ No newline at end of file
+            changed = describe_changes(*event)
+            for pool, handler, timeout in pools:
+                pool.submit(handler, changed, timeout=timeout)
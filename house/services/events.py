@@ -0,0 +1,117 @@
+"""
+events.py
+Fan out of alarm and irrigation changes to push clients
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import deque
+from threading import Condition
+import json
+import time
+
+
+class EventHub(object):
+    """
+    EventHub holds the most recent changes with a sequence number.
+    Any number of clients wait on it.  The controllers are only read by the publishers.
+    """
+
+    def __init__(self, capacity=1000):
+        self.condition = Condition()
+        self.sequence = 0
+        self.events = deque(maxlen=capacity)
+
+    def publish(self, topic, data):
+        """
+        Add a change and wake the waiting clients
+        """
+        with self.condition:
+            self.sequence += 1
+            self.events.append((self.sequence, topic, time.time(), data))
+            self.condition.notify_all()
+            return self.sequence
+
+    def after(self, sequence):
+        """
+        Return the changes after a sequence number.  Must hold the condition.
+        A sequence number ahead of the hub is from before a restart: every change kept is returned.
+        """
+        if sequence > self.sequence:
+            sequence = 0
+        if not self.events or self.events[-1][0] <= sequence:
+            return []
+        # Sequence numbers are contiguous so the position is computed, not searched
+        first = self.events[0][0]
+        start = max(0, sequence - first + 1)
+        return [self.events[index] for index in range(start, len(self.events))]
+
+    def wait(self, sequence, timeout):
+        """
+        Return the changes after a sequence number.  Wait up to timeout seconds for one.
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            events = self.after(sequence)
+            while not events:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+                events = self.after(sequence)
+            return events
+
+    def resume(self, sequence):
+        """
+        The sequence number to continue from.  One ahead of the hub is from before a restart
+        and starts over from 0, so the changes kept are sent again.
+        """
+        with self.condition:
+            return 0 if sequence > self.sequence else sequence
+
+    def latest(self):
+        """
+        Current sequence number
+        """
+        with self.condition:
+            return self.sequence
+
+
+def event_data(event):
+    """
+    Format an event for a JSON response
+    """
+    sequence, topic, when, data = event
+    return {"id": sequence, "topic": topic, "time": when, "data": data}
+
+
+def server_sent_events(hub, sequence, heartbeat=15.0):
+    """
+    Generate a text/event-stream.  A comment is sent every heartbeat seconds
+    so dropped clients are noticed.
+    """
+    # Tell EventSource to reconnect quickly
+    yield "retry: 2000\n\n"
+    while True:
+        events = hub.wait(sequence, heartbeat)
+        if not events:
+            yield ": keep-alive\n\n"
+            continue
+        chunk = list()
+        for event in events:
+            sequence = event[0]
+            chunk.append("id: %s\nevent: %s\ndata: %s\n\n" % (sequence, event[1], json.dumps(event_data(event))))
+        yield "".join(chunk)
@@ -0,0 +1,91 @@
+"""
+irrigation_monitor.py
+irrigation controller monitor
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.irrigation.sprinkler import sprinkler_state, state_keys
+from house.irrigation.zones import zones_state, zones_status
+from house.controllers.state import ZoneState
+from threading import Event
+import logging
+
+
+class IrrigationMonitor(object):
+    """
+    Irrigation monitoring class that watches for valve changes and cycle start/stop.
+    Every controller of the zones is read, and zones are keyed by their number across the property.
+    If a change occurs the callback handlers are called with the irrigation status.
+    """
+
+    def __init__(self, zones, poll_interval=5.0):
+        self.zones = zones
+        self.poll_interval = poll_interval
+        self.handlers = list()
+        self.enabled = True
+        self.state = None
+        self.wake = Event()
+
+    def enable(self, enabled=True):
+        """
+        Turn on/off the monitor.  begin() must be called again after re-enabling
+        """
+        self.enabled = enabled
+        self.wake.set()
+
+    def add_handler(self, handler):
+        """
+        Add a callback handler
+        callback(status)
+        """
+        self.handlers.append(handler)
+
+    def refresh(self):
+        """
+        Read the controller now.  Called after a command changes the valves.
+        """
+        self.wake.set()
+
+    def begin(self):
+        """
+        Begin the irrigation monitor loop
+        """
+        while self.enabled:
+            try:
+                self.check(zones_state(self.zones, sprinkler_state))
+            except Exception, ex:
+                logging.warning("Irrigation controller read failed: %s", ex)
+
+            self.wake.wait(self.poll_interval)
+            self.wake.clear()
+
+    def check(self, state):
+        """
+        Call the handlers if a valve opened/closed or a cycle started/stopped
+        """
+        zones = ZoneState.from_mapping(state_keys(state), state)
+        key = (zones.bits, int(state["cycle_milliseconds"]) > 0)
+        if key == self.state:
+            return
+
+        self.state = key
+        status = zones_status(self.zones, state)
+        for handler in self.handlers:
+            try:
+                handler(status)
+            except Exception, ex:
+                logging.exception(ex)
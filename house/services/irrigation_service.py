@@ -18,13 +18,18 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from time import sleep
-from house.data.service_data import check_schedule, get_cycle_durations, add_cycle, update_status
-from datetime import datetime
+from house.data.service_data import add_cycle, update_status, get_schedule, maintain_database, HISTORY_WRITER
+from house.data.history_writer import flush_on_exit
+from house.irrigation.scheduler import IrrigationScheduler
+from house.irrigation.clock import SystemClock
+from house.irrigation import cycle
+from datetime import timedelta
 from house.irrigation.sprinkler import sprinkler_state, sprinkler_end_cycle
-from house.irrigation.sprinkler import sprinkler_control, sprinkler_start_cycle
+from house.irrigation.sprinkler import sprinkler_start_zone
+from house.irrigation.zones import configured_zones, controller_lanes
 from house.environment.external import read_weather, wind_speed, humidity, current_rain
 from house.data.recorder import record_data
+from house.services.settings import get_setting
 import logging
 import logging.handlers
 from ConfigParser import ConfigParser
@@ -41,26 +46,74 @@ SETTINGS_FILE = os.path.join(os.path.dirname(__file__), "..", "settings.conf")
 SETTINGS = ConfigParser()
 SETTINGS.read(SETTINGS_FILE)
 
+# History is recorded this often between cycles
+RECORD_INTERVAL = timedelta(minutes=15)
+
+# Old rows are pruned once a day at this hour
+MAINTENANCE_HOUR = get_setting("retention", "hour", 3)
+
+
+def record_history():
+    """
+    Queue a history sample
+    """
+    record_data(SETTINGS)
+
+
+def irrigation_zones():
+    """
+    Zones of every sprinkler controller
+    """
+    return configured_zones(SETTINGS)
+
+
+def irrigation_scheduler(clock):
+    """
+    Scheduler for the configured zones running on clock
+    """
+    return IrrigationScheduler(load=lambda: get_schedule(len(irrigation_zones())), clock=clock.now, sleeper=clock.wait)
+
+
+# Every time and sleep in the service goes through CLOCK.  use_clock() swaps in a VirtualClock.
+CLOCK = SystemClock()
+SCHEDULER = irrigation_scheduler(CLOCK)
+
+
+def use_clock(clock):
+    """
+    Run the service on clock
+    """
+    global CLOCK, SCHEDULER
+    CLOCK = clock
+    SCHEDULER = irrigation_scheduler(clock)
+
+
+# Valves open at once across all controllers.  Limited by the water pressure.
+MAX_VALVES = get_setting("irrigation", "max_valves", 1)
+
+# Seconds between checks that the controller is still running the cycle
+WATCHDOG_INTERVAL = get_setting("irrigation", "watchdog_interval", 300.0)
+
+
 def in_schedule():
     """
     Return if there is a cycle in the scheduled window now
     """
-    date = datetime.now()
-    schedule_id = check_schedule(date)
-    if schedule_id is not None:
-        return schedule_id[0], get_cycle_durations(schedule_id[0])
+    window = SCHEDULER.due()
+    if window is not None:
+        return window.schedule_id, window.durations
     
     return None, None
 
 
-def update_from_weather(cycle_id, cycle_durations, station_number, api_key):
+def update_from_weather(cycle_id, cycle_durations, station_number, api_key, weather_source=read_weather):
     """
     Check the current weather conditions.  Update status if a weather event should stop
     the cycle.
     """
 
     # Get current weather
-    weather = read_weather(station_number, api_key)
+    weather = weather_source(station_number, api_key)
     
     # Turn off if too windy
     if wind_speed(weather) > 10:
@@ -83,82 +136,134 @@ def update_from_weather(cycle_id, cycle_durations, station_number, api_key):
     return cycle_durations
 
 
-def start_cycle(cycle_id, cycle_durations):
+def start_cycle(cycle_id, cycle_durations, window=None):
     """
-    Opens a irrigation value for the cycle duration
+    Opens a irrigation value for the cycle duration.
+    The schedule window is marked as run once the cycle is recorded, under the date it started.
     """
     update_status("Running Cycle")
     logging.debug("Starting Cycle: %s", cycle_id)
-    date = datetime.now()
+    date = window.start if window is not None else CLOCK.now()
     add_cycle(cycle_id, date, str(cycle_durations))
-    zone = 1
-    for duration in cycle_durations:
-        run_cycle(zone, duration)
-        zone += 1
+    if window is not None:
+        SCHEDULER.mark_run(window)
+    zones = irrigation_zones()
+    run_zones(zones, cycle_durations, MAX_VALVES)
     
     # Be sure all zones are closed
-    sprinkler_end_cycle()
+    for host, port in set(zone.controller for zone in zones):
+        sprinkler_end_cycle(host, port)
     update_status("Finished Cycle")
     logging.debug("Finished Cycle: %s", cycle_id)
 
 
-def wait_for_cycle():
+def run_zones(zones, durations, max_valves):
+    """
+    Run each controller's zones one after another and the controllers in parallel,
+    with no more than max_valves zones open at once
+    """
+    valves = CLOCK.semaphore(max(1, max_valves))
+
+    def run_lane(lane):
+        for zone, duration in lane:
+            try:
+                with valves:
+                    run_cycle(zone.relay, duration, zone.host, zone.port)
+            except Exception, ex:
+                logging.exception(ex)
+
+    lanes = [CLOCK.thread(run_lane, "irrigation_%s:%s" % lane[0][0].controller, (lane,))
+             for lane in controller_lanes(zones, durations)]
+    CLOCK.join(lanes)
+
+
+def cycle_deadline(state):
     """
-    A cycle is running.  Loop while we are in that cycle.
+    Local time the controller cycle timer runs out
     """
-    # Check cycle_milliseconds
-    while int(sprinkler_state()["cycle_milliseconds"]) > 0:
-        sleep(15)
+    return cycle.cycle_deadline(state, CLOCK)
 
 
-def run_cycle(zone, duration):
+def wait_for_cycle(host, port, deadline=None):
+    """
+    A cycle is running.  Sleep until its deadline, checking the controller every
+    WATCHDOG_INTERVAL seconds, and confirm the cycle ended.
+    """
+    cycle.wait_for_cycle(lambda: sprinkler_state(host, port), CLOCK, deadline, WATCHDOG_INTERVAL)
+
+
+def run_cycle(zone, duration, host, port):
     """
     Calls the start_cycle method and waits for completion
     """
     logging.debug("Starting Zone: %s Duration: %s", zone, duration)
     # Waiting for finish
-    wait_for_cycle()
-    # Shutdown all
-    sprinkler_end_cycle()
+    wait_for_cycle(host, port)
     # Open zone valve
     if duration > 0:
-        # Start cycle counter.  Do this before turning
-        # on the zone.  This will prevent runaway watering.
-        sprinkler_start_cycle(duration*1000*60)
-        # Turn the zone on
-        sprinkler_control(zone, "on")
+        # Shutdown all, start cycle counter and turn the zone on in one round trip.
+        # The counter starts before the zone.  This will prevent runaway watering.
+        deadline = cycle_deadline(sprinkler_start_zone(zone, duration*1000*60, host, port))
         logging.debug("Zone On")        
     
-    # Waiting for finish
-    wait_for_cycle()
+        # Waiting for finish
+        wait_for_cycle(host, port, deadline)
+    else:
+        # Shutdown all
+        sprinkler_end_cycle(host, port)
     logging.debug("Finished Zone: %s", zone)
 
 
-def service():
+def next_maintenance(now):
     """
-    Main loop waiting for a cycle_window to become valid
+    The next MAINTENANCE_HOUR after now
+    """
+    moment = now.replace(hour=MAINTENANCE_HOUR, minute=0, second=0, microsecond=0)
+    return moment if moment > now else moment + timedelta(days=1)
+
+
+def service(until=None, record=record_history, weather_source=read_weather, maintain=maintain_database):
+    """
+    Main loop waiting for a cycle_window to become valid.
+    Runs until the datetime until on CLOCK, or forever.  record is called every RECORD_INTERVAL
+    and maintain(now) once a day.
     """
     logging.debug('Service Started')
-    while True:
+    next_record = CLOCK.now()
+    next_maintain = next_maintenance(CLOCK.now())
+    while until is None or CLOCK.now() < until:
         try:
+            if CLOCK.now() >= next_record:
+                next_record = CLOCK.now() + RECORD_INTERVAL
+                if record is not None:
+                    record()
+                if CLOCK.now() >= next_maintain:
+                    next_maintain = next_maintenance(CLOCK.now())
+                    if maintain is not None:
+                        logging.info("Database maintenance removed %s", maintain(CLOCK.now()))
+                # Pick up schedule edits made outside the service
+                SCHEDULER.refresh()
+
+            # Sleep until a window opens or the next history record is due
+            window = SCHEDULER.wait(until=next_record if until is None else min(next_record, until))
             logging.debug("Service woke up")
-            cycle_id, cycle_durations = in_schedule()
-            if cycle_id:
-                cycle_durations = update_from_weather(cycle_id, cycle_durations,
+            if window is not None:
+                cycle_id = window.schedule_id
+                cycle_durations = update_from_weather(cycle_id, window.durations,
                                                       station_number=SETTINGS.get("weather", "station"),
-                                                      api_key=SETTINGS.get("weather", "api_key"))
+                                                      api_key=SETTINGS.get("weather", "api_key"),
+                                                      weather_source=weather_source)
                 
                 logging.debug("Cycle Id: %s Duration: %s", cycle_id, cycle_durations)
-                start_cycle(cycle_id, cycle_durations)
-            else:
-                record_data()
-                sleep(60*15)  # 15 minutes
+                start_cycle(cycle_id, cycle_durations, window)
                 
         except Exception, ex:
             logging.exception(ex)
+            CLOCK.sleep(60)
                  
     logging.debug('Service Ended')
 
 
 if __name__ == '__main__':
+    flush_on_exit(HISTORY_WRITER)
     service()
\ No newline at end of file
@@ -22,6 +22,10 @@ from serial import Serial, SerialException
 import time
 
 
+# Serial ports tried in order.  Replace to use another device such as the simulator's pty.
+PORTS = ["/dev/ttyACM0", "/dev/ttyACM1"]
+
+
 def open_port(port):
     """
     Open the selected port
@@ -38,13 +42,14 @@ def find_port():
     """
     Find the port the Arduino is connected to
     """
-    try:
-        return open_port("/dev/ttyACM0")
-    except SerialException:
-        pass
-
-    # Try the other port
-    return open_port("/dev/ttyACM1")
+    for port in PORTS[:-1]:
+        try:
+            return open_port(port)
+        except SerialException:
+            pass
+
+    # Try the last port
+    return open_port(PORTS[-1])
 
 
 def light_on():
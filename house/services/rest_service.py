@@ -23,13 +23,27 @@ from house.environment.nest import Nest
 from house.environment import external
 from house.alarm import zones
 from house.irrigation import sprinkler
-from house.data.service_data import get_status
+from house.irrigation.zones import configured_zones, find_zone, irrigation_controllers, zones_state, zones_status
+from house.data.service_data import get_status, retrieve_history_range, history_stream, database_status
+from house.data.service_data import retrieve_zone_history, ZONE_HISTORY_TABLES
+from house.data.service_data import HISTORY_WRITER
+from house.data.database import DATABASE_PATH
+from house.data.history_writer import flush_on_exit
 from house.data.recorder import record_data, retrieve_data
 from house.services.messaging import send_smtp_message
+from house.services import light
 from house.services.light import light_off, light_on, light_toggle, light_color
+from house.services.settings import SETTINGS, get_setting
+from house.controllers.cache import SingleFlightCache
+from house.controllers.breaker import ControllerUnavailable, breaker_status
+from house.services.alarm_monitor import Monitor
+from house.services.irrigation_monitor import IrrigationMonitor
+from house.services.events import EventHub, event_data, server_sent_events
+from house.data.journal import EventJournal
+from house.data.columns import column_lists
+from threading import Thread
+from datetime import datetime, timedelta
 import json
-from ConfigParser import ConfigParser
-import os
 
 urls = (
     '/api/environment/inside', 'EnvironmentInside',
@@ -46,14 +60,22 @@ urls = (
     '/api/environment/outside/wind', 'EnvironmentOutsideWind',
     '/api/environment/outside/rain', 'EnvironmentOutsideRainfall',
     '/api/alarm/status', 'AlarmStatus',
+    '/api/alarm/status/cache', 'AlarmStatusCache',
+    '/api/alarm/events', 'AlarmEvents',
+    '/api/alarm/events/last', 'AlarmEventsLast',
+    '/api/events', 'Events',
+    '/api/events/poll', 'EventsPoll',
     '/api/irrigation/state', 'IrrigationState',
     '/api/irrigation/status', 'IrrigationStatus',
-    '/api/irrigation/zone/([1-4])/(on|off)', 'Irrigation',
+    '/api/irrigation/zone/(\d{1,3})/(on|off)', 'Irrigation',
     '/api/irrigation/cycle/(\d{1,7})', 'IrrigationCycle',
     '/api/irrigation/cycle/status', 'IrrigationCycleStatus',
     '/api/history', 'History',
+    '/api/history/zones', 'HistoryZones',
     '/api/message', 'Message',
     '/api/status', 'Status',
+    '/api/controllers/status', 'ControllersStatus',
+    '/api/database/status', 'DatabaseStatus',
     '/api/light', 'Light',
     '/api/light/color/([A-Fa-f0-9]{2})/([A-Fa-f0-9]{2})/([A-Fa-f0-9]{2})/([A-Fa-f0-9]{2})', 'LightColor'
 )
@@ -61,9 +83,101 @@ urls = (
 web.config.debug = False
 app = web.application(urls, globals())
 
-SETTINGS_FILE = os.path.join(os.path.dirname(__file__), "..", "settings.conf")
-SETTINGS = ConfigParser()
-SETTINGS.read(SETTINGS_FILE)
+
+def controller_errors(handler):
+    """
+    Answer 503 right away when a controller's circuit breaker is open
+    """
+    try:
+        return handler()
+    except ControllerUnavailable, ex:
+        raise web.HTTPError("503 Service Unavailable", {"Content-Type": "application/json"},
+                            json.dumps({"error": str(ex)}))
+
+app.add_processor(controller_errors)
+
+# Dashboards refreshing together share one controller read
+ALARM_STATUS_CACHE = SingleFlightCache(zones.get_zone_status,
+                                       ttl=get_setting("alarm", "status_ttl", 0.5))
+
+# Every zone transition seen by the alarm monitor
+JOURNAL = EventJournal(database=DATABASE_PATH, capacity=get_setting("alarm", "journal_capacity", 10000))
+
+# Alarm and irrigation changes pushed to clients
+EVENTS = EventHub(capacity=get_setting("events", "capacity", 1000))
+
+# History range when ?from= is left out, and rows returned when ?points= is
+HISTORY_RANGE = timedelta(hours=get_setting("history", "range_hours", 12))
+HISTORY_POINTS = get_setting("history", "points", 500)
+
+IRRIGATION_MONITOR = None
+
+
+def debounce_windows():
+    """
+    Return the debounce window of each zone.
+    [alarm] debounce = zone9:0.5, zone1:0.1
+    """
+    windows = dict()
+    for window in get_setting("alarm", "debounce", "").split(","):
+        if window.strip():
+            zone, seconds = window.strip().split(":")
+            windows[zone] = float(seconds)
+    return windows
+
+
+def start_alarm_monitor():
+    """
+    Run the alarm monitor in the background and feed the event journal
+    """
+    monitor = Monitor(zones.alarm_controllers(SETTINGS),
+                      poll_interval=get_setting("alarm", "poll_interval", 0.2),
+                      max_interval=get_setting("alarm", "max_interval", 1.0),
+                      debounce=debounce_windows(),
+                      default_debounce=get_setting("alarm", "default_debounce", 0.0),
+                      journal=JOURNAL.record)
+    monitor.add_handler(lambda changed: EVENTS.publish("alarm", changed))
+    thread = Thread(group=None, target=monitor.begin, name="alarm_monitor")
+    thread.daemon = True
+    thread.start()
+    return monitor
+
+
+def start_irrigation_monitor():
+    """
+    Run the irrigation monitor in the background and push its changes
+    """
+    global IRRIGATION_MONITOR
+    IRRIGATION_MONITOR = IrrigationMonitor(configured_zones(SETTINGS),
+                                           poll_interval=get_setting("irrigation", "poll_interval", 5.0))
+    IRRIGATION_MONITOR.add_handler(lambda status: EVENTS.publish("irrigation", status))
+    thread = Thread(group=None, target=IRRIGATION_MONITOR.begin, name="irrigation_monitor")
+    thread.daemon = True
+    thread.start()
+    return IRRIGATION_MONITOR
+
+
+def irrigation_state(zones=None):
+    """
+    State of every configured zone, read from each sprinkler controller
+    """
+    return zones_state(zones or configured_zones(SETTINGS), sprinkler.sprinkler_state)
+
+
+def irrigation_status():
+    """
+    Formatted status of every configured zone
+    """
+    irrigation_zones = configured_zones(SETTINGS)
+    return zones_status(irrigation_zones, irrigation_state(irrigation_zones))
+
+
+def irrigation_changed():
+    """
+    A command changed the valves.  Push the new state without waiting for the next poll.
+    """
+    if IRRIGATION_MONITOR is not None:
+        IRRIGATION_MONITOR.refresh()
 
 
 class Status:
@@ -75,16 +189,39 @@ class Status:
         return json.dumps({"status": "ONLINE"})
 
 
+class ControllersStatus:
+    """
+    REST Controller to return the circuit breaker state of each controller
+    """
+
+    def GET(self):
+        return json.dumps(breaker_status())
+
+
+class DatabaseStatus:
+    """
+    REST Controller to return the schema version, size and query timings of house.db
+    """
+
+    def GET(self):
+        return json.dumps(database_status())
+
+
 class Irrigation:
     """
     REST Controller to open/close irrigation values
     """
 
     def PUT(self, zone, state):
-        return json.dumps(sprinkler.sprinkler_control(zone=zone,
-                                                      state=state,
-                                                      host=SETTINGS.get("irrigation", "irrigation_host"),
-                                                      port=SETTINGS.get("irrigation", "irrigation_port")))
+        irrigation_zone = find_zone(configured_zones(SETTINGS), zone)
+        if irrigation_zone is None:
+            raise web.notfound()
+        status = sprinkler.sprinkler_control(zone=irrigation_zone.relay,
+                                             state=state,
+                                             host=irrigation_zone.host,
+                                             port=irrigation_zone.port)
+        irrigation_changed()
+        return json.dumps(status)
 
 
 class IrrigationState:
@@ -93,8 +230,7 @@ class IrrigationState:
     """
 
     def GET(self):
-        return json.dumps(sprinkler.sprinkler_state(host=SETTINGS.get("irrigation", "irrigation_host"),
-                                                    port=SETTINGS.get("irrigation", "irrigation_port")))
+        return json.dumps(irrigation_state())
 
 
 class IrrigationStatus:
@@ -103,23 +239,25 @@ class IrrigationStatus:
     """
 
     def GET(self):
-        return json.dumps(sprinkler.sprinkler_status(host=SETTINGS.get("irrigation", "irrigation_host"),
-                                                     port=SETTINGS.get("irrigation", "irrigation_port")))
+        return json.dumps(irrigation_status())
 
 
 class IrrigationCycle:
     """
-    REST Controller to start/stop irrigation cycles
+    REST Controller to start/stop the irrigation cycle of every controller
     """
 
     def PUT(self, milliseconds):
-        return json.dumps(sprinkler.sprinkler_start_cycle(milliseconds=milliseconds,
-                                                          host=SETTINGS.get("irrigation", "irrigation_host"),
-                                                          port=SETTINGS.get("irrigation", "irrigation_port")))
+        for host, port in irrigation_controllers(SETTINGS):
+            sprinkler.sprinkler_start_cycle(milliseconds=milliseconds, host=host, port=port)
+        irrigation_changed()
+        return json.dumps(irrigation_status())
     
     def DELETE(self, milliseconds):
-        return json.dumps(sprinkler.sprinkler_end_cycle(host=SETTINGS.get("irrigation", "irrigation_host"),
-                                                        port=SETTINGS.get("irrigation", "irrigation_port")))
+        for host, port in irrigation_controllers(SETTINGS):
+            sprinkler.sprinkler_end_cycle(host=host, port=port)
+        irrigation_changed()
+        return json.dumps(irrigation_status())
 
 
 class IrrigationCycleStatus:
@@ -137,8 +275,78 @@ class AlarmStatus:
     """
 
     def GET(self):
-        return json.dumps(zones.get_zone_status(alarm_host=SETTINGS.get("alarm", "alarm_host"),
-                                                alarm_port=SETTINGS.get("alarm", "alarm_port")))
+        return json.dumps(zones.controllers_status(zones.alarm_controllers(SETTINGS), ALARM_STATUS_CACHE.get))
+
+
+class AlarmStatusCache:
+    """
+    REST Controller to return the alarm status cache counters
+    """
+
+    def GET(self):
+        return json.dumps(ALARM_STATUS_CACHE.stats())
+
+
+class AlarmEvents:
+    """
+    REST Controller to return the alarm zone transitions after ?since=<epoch seconds>
+    """
+
+    def GET(self):
+        query = web.input(since="0", limit="1000")
+        try:
+            since, limit = float(query.since), int(query.limit)
+        except ValueError:
+            raise web.badrequest()
+        return json.dumps(JOURNAL.since(since, limit))
+
+
+class AlarmEventsLast:
+    """
+    REST Controller to return the last transition of ?zone= to ?state=  (e.g. zone9, open)
+    """
+
+    def GET(self):
+        query = web.input(zone=None, state="open")
+        return json.dumps(JOURNAL.last_event(query.zone, query.state))
+
+
+def event_sequence(since):
+    """
+    Sequence number of a ?since= or Last-Event-ID value.  A missing or malformed
+    one starts from the newest change, as a new client does.  One from before the
+    service restarted starts over from the oldest change kept.
+    """
+    try:
+        return EVENTS.resume(int(since))
+    except (TypeError, ValueError):
+        return EVENTS.latest()
+
+
+class Events:
+    """
+    REST Controller that pushes alarm and irrigation changes as Server-Sent Events
+    """
+
+    def GET(self):
+        query = web.input(since=None)
+        since = event_sequence(query.since or web.ctx.env.get("HTTP_LAST_EVENT_ID"))
+        web.header("Content-Type", "text/event-stream")
+        web.header("Cache-Control", "no-cache")
+        return server_sent_events(EVENTS, since, heartbeat=get_setting("events", "heartbeat", 15.0))
+
+
+class EventsPoll:
+    """
+    REST Controller to long-poll for alarm and irrigation changes after ?since=<id>
+    """
+
+    def GET(self):
+        query = web.input(since=None, timeout="25")
+        since = event_sequence(query.since)
+        events = EVENTS.wait(since, min(float(query.timeout), 60.0))
+        return json.dumps({"latest": events[-1][0] if events else since,
+                           "events": [event_data(event) for event in events]})
 
 
 class EnvironmentInside:
@@ -304,18 +512,74 @@ class EnvironmentOutsideRainfall:
         return json.dumps({"3h": rainfall})
 
 
+def history_time(value, default):
+    """
+    Epoch seconds, in the same clock as the history dt values, to a datetime
+    """
+    if value is None or value == "":
+        return default
+    return datetime.utcfromtimestamp(float(value))
+
+
+def history_lines(names, chunks):
+    """
+    Generate NDJSON, one object per history row, a chunk of rows at a time
+    """
+    for chunk in chunks:
+        yield "".join(json.dumps(dict(zip(names, row))) + "\n" for row in chunk)
+
+
 class History:
     """
-    Add or retrieve history data
+    Add or retrieve history data.
+    ?from=&to=<epoch seconds>&points= returns the range at the finest resolution that fits in points rows.
+    ?format=columns returns {column: [values]} instead of a list of rows.
+    ?format=ndjson, ?fields=<a,b> or ?since_id=<id> streams the raw rows as NDJSON, oldest first.
+    Clients sync by passing the last id they received as since_id.
     """
 
     def PUT(self):
-        record_data(nest_user=SETTINGS.get("nest", "user"),
-                    nest_password=SETTINGS.get("nest", "pwd"),
-                    weather_station=SETTINGS.get("weather", "station"))
+        record_data(SETTINGS)
  
     def GET(self):
-        return json.dumps(retrieve_data())
+        query = web.input(points=None, format="rows", fields=None, since_id=None)
+        columnar = query.format == "columns"
+        if query.format == "ndjson" or query.fields is not None or query.since_id is not None:
+            start = history_time(query.get("from"), None)
+            end = history_time(query.get("to"), None)
+            fields = query.fields.split(",") if query.fields else None
+            since_id = int(query.since_id) if query.since_id else None
+            names, chunks = history_stream(start, end, fields, since_id)
+            web.header("Content-Type", "application/x-ndjson")
+            web.header("Cache-Control", "no-cache")
+            return history_lines(names, chunks)
+
+        if query.get("from") is None and query.get("to") is None and query.points is None:
+            if columnar:
+                return json.dumps(column_lists(retrieve_data(columnar) or {}))
+            return json.dumps(retrieve_data())
+
+        end = history_time(query.get("to"), datetime.now())
+        start = history_time(query.get("from"), end - HISTORY_RANGE)
+        points = int(query.points or HISTORY_POINTS)
+        result = retrieve_history_range(start, end, points, columnar)
+        if columnar:
+            result["columns"] = column_lists(result["columns"])
+        return json.dumps(result)
+
+
+class HistoryZones:
+    """
+    Retrieve the zone states of every zone, ?from=&to=<epoch seconds>&system=irrigation|alarm
+    """
+
+    def GET(self):
+        end = history_time(web.input().get("to"), datetime.now())
+        start = history_time(web.input().get("from"), end - HISTORY_RANGE)
+        system = web.input(system="irrigation").system
+        if system not in ZONE_HISTORY_TABLES:
+            raise web.badrequest()
+        return json.dumps(retrieve_zone_history(start, end, system))
 
 
 class Message:
@@ -358,4 +622,11 @@ class LightColor:
             
 
 if __name__ == "__main__":
+    flush_on_exit(HISTORY_WRITER)
+    if get_setting("light", "port", ""):
+        light.PORTS = [get_setting("light", "port", "")]
+    if get_setting("alarm", "monitor", True):
+        start_alarm_monitor()
+    if get_setting("irrigation", "monitor", True):
+        start_irrigation_monitor()
     app.run()
\ No newline at end of file
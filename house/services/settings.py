@@ -0,0 +1,42 @@
+"""
+settings.py
+Service settings read from settings.conf
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from ConfigParser import ConfigParser
+import os
+
+
+SETTINGS_FILE = os.path.join(os.path.dirname(__file__), "..", "settings.conf")
+SETTINGS = ConfigParser()
+SETTINGS.read(SETTINGS_FILE)
+
+
+def get_setting(section, option, default=None):
+    """
+    Return an optional setting converted to the type of the default
+    """
+    if not SETTINGS.has_option(section, option):
+        return default
+
+    value = SETTINGS.get(section, option)
+    if default is None:
+        return value
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return type(default)(value)
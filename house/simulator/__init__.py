@@ -0,0 +1,3 @@
+"""
+house.simulator
+"""
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""
+__main__.py
+Run the simulated controllers
+
+    python -m house.simulator --alarm-port 8888 --sprinkler-port 8889 --latency 0.02 --flap 9:1.5
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.simulator.network import Faults, CONTROLLER_PORT, SHIELD_SOCKETS
+from house.simulator.alarm import AlarmSimulator
+from house.simulator.sprinkler import SprinklerSimulator
+from house.simulator.light import LightSimulator
+import argparse
+import time
+
+
+def flap_option(value):
+    """
+    zone:seconds
+    """
+    zone, period = value.split(":")
+    return int(zone), float(period)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated house controllers")
+    parser.add_argument("--host", default="localhost", help="Address to listen on")
+    parser.add_argument("--alarm-port", type=int, default=CONTROLLER_PORT)
+    parser.add_argument("--sprinkler-port", type=int, default=CONTROLLER_PORT + 1)
+    parser.add_argument("--no-light", action="store_true", help="Do not create the serial device")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Seconds of random latency variation")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of requests dropped")
+    parser.add_argument("--sockets", type=int, default=SHIELD_SOCKETS, help="Concurrent connections allowed")
+    parser.add_argument("--open", type=int, action="append", default=[], help="Alarm zone to start open")
+    parser.add_argument("--flap", type=flap_option, action="append", default=[],
+                        help="zone:seconds.  Toggle an alarm zone on a period.")
+    parser.add_argument("--seed", type=int, help="Random seed for the faults")
+    args = parser.parse_args()
+
+    def faults():
+        return Faults(args.latency, args.jitter, args.drop_rate, args.seed)
+
+    alarm = AlarmSimulator(args.host, args.alarm_port, faults=faults(), sockets=args.sockets)
+    for zone in args.open:
+        alarm.set_zone(zone, 1)
+    for zone, period in args.flap:
+        alarm.flap(zone, period)
+    sprinkler = SprinklerSimulator(args.host, args.sprinkler_port, faults=faults(), sockets=args.sockets)
+    simulators = [alarm.start(), sprinkler.start()]
+
+    print "alarm      %s:%s" % (alarm.host, alarm.port)
+    print "sprinkler  %s:%s" % (sprinkler.host, sprinkler.port)
+    if not args.no_light:
+        light = LightSimulator(faults()).start()
+        simulators.append(light)
+        print "light      %s  (set [light] port)" % light.path
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for simulator in simulators:
+            simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
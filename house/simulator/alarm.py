@@ -0,0 +1,71 @@
+"""
+alarm.py
+Simulated alarm controller (arduino/alarmsystem)
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.simulator.network import SimulatedController
+
+
+ALARM_ZONES = 9
+
+
+class AlarmSimulator(SimulatedController):
+    """
+    Nine zone inputs.  Zones can be set directly or made to flap open and closed on a period.
+    """
+
+    def __init__(self, host="localhost", port=0, zones=ALARM_ZONES, **kwargs):
+        SimulatedController.__init__(self, host, port, **kwargs)
+        self.zones = [0] * zones
+        self.flapping = dict()
+
+    def set_zone(self, zone, state):
+        """
+        Set zone (1 based) open (1) or closed (0).  Stops the zone flapping.
+        """
+        with self.lock:
+            self.flapping.pop(zone, None)
+            self.zones[zone - 1] = 1 if state else 0
+
+    def flap(self, zone, period):
+        """
+        Toggle zone (1 based) every period seconds of the controller clock
+        """
+        with self.lock:
+            self.flapping[zone] = (float(period), self.clock(), self.zones[zone - 1])
+
+    def read_zone_status(self):
+        """
+        Same format as the firmware: 0:0:1:0:0:0:0:0:1
+        """
+        now = self.clock()
+        with self.lock:
+            zones = list(self.zones)
+            for zone, (period, started, initial) in self.flapping.items():
+                toggles = int((now - started) / period)
+                zones[zone - 1] = initial ^ (toggles & 1)
+        return ":".join(str(state) for state in zones)
+
+    def process(self, message):
+        if message == "status":
+            return self.read_zone_status()
+        elif message == "message2":
+            return "success:2"
+        elif message == "message3":
+            return "success:3"
+        return None
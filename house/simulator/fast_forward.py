@@ -0,0 +1,149 @@
+"""
+fast_forward.py
+Run the irrigation service on a virtual clock against simulated controllers.
+Days of schedules run in seconds.
+
+    python -m house.simulator.fast_forward --days 30 --controllers 2 --max-valves 2
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.irrigation.clock import SystemClock, VirtualClock
+from house.simulator.sprinkler import SprinklerSimulator, SPRINKLER_ZONES
+from house.simulator.weather import WeatherSimulator
+from house.controllers.transport import close_pools
+from house.data import service_data
+from house.services import irrigation_service
+from datetime import datetime, timedelta
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+
+def add_zone_minutes(minutes, zone_count):
+    """
+    Water every zone of every schedule entry for minutes
+    """
+    with service_data.DATABASE.transaction() as cursor:
+        cursor.execute("SELECT id FROM schedule")
+        for (schedule_id,) in cursor.fetchall():
+            cursor.executemany("INSERT OR REPLACE INTO schedule_zones (schedule_id, zone, minutes) VALUES (?, ?, ?)",
+                               [(schedule_id, zone, minutes) for zone in range(1, zone_count + 1)])
+
+
+def count_cycles():
+    """
+    Cycles the service started
+    """
+    return service_data.DATABASE.connection().execute("SELECT COUNT(*) FROM cycles").fetchone()[0]
+
+
+def configure(settings, section, option, value):
+    """
+    Set an option and return how to put it back
+    """
+    if not settings.has_section(section):
+        settings.add_section(section)
+    previous = settings.get(section, option) if settings.has_option(section, option) else None
+    settings.set(section, option, value)
+    return section, option, previous
+
+
+def restore(settings, changes):
+    """
+    Undo configure()
+    """
+    for section, option, previous in reversed(changes):
+        if previous is None:
+            settings.remove_option(section, option)
+        else:
+            settings.set(section, option, previous)
+
+
+def fast_forward(days, start=None, controllers=1, max_valves=1, zone_minutes=None, seed=None):
+    """
+    Run the default schedule for days of simulated time in a scratch database.
+    zone_minutes waters every zone of every controller that long instead of the default durations.
+    Returns a report with the simulated days per second.
+    """
+    start = start or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    clock = VirtualClock(start)
+    weather = WeatherSimulator(clock=clock.time, seed=seed)
+    simulators = [SprinklerSimulator(clock=clock.time).start() for _unused in range(controllers)]
+
+    settings = irrigation_service.SETTINGS
+    changes = [configure(settings, "irrigation", "controllers",
+                         ", ".join("%s:%s" % (simulator.host, simulator.port) for simulator in simulators)),
+               configure(settings, "irrigation", "zones_per_controller", str(SPRINKLER_ZONES)),
+               configure(settings, "weather", "station", "0"),
+               configure(settings, "weather", "api_key", "simulated")]
+    max_valves_setting = irrigation_service.MAX_VALVES
+    irrigation_service.MAX_VALVES = max_valves
+
+    working_directory = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="house_fast_forward_")
+    try:
+        os.chdir(directory)
+        with service_data.DATABASE.using(os.path.join(directory, "house.db")):
+            service_data.create_database()
+            if zone_minutes:
+                add_zone_minutes(zone_minutes, controllers * SPRINKLER_ZONES)
+
+            irrigation_service.use_clock(clock)
+            started = time.time()
+            irrigation_service.service(until=start + timedelta(days=days), record=None,
+                                       weather_source=weather.read_weather)
+            elapsed = time.time() - started
+            cycles = count_cycles()
+    finally:
+        irrigation_service.use_clock(SystemClock())
+        irrigation_service.MAX_VALVES = max_valves_setting
+        restore(settings, changes)
+        os.chdir(working_directory)
+        shutil.rmtree(directory)
+        close_pools()
+        for simulator in simulators:
+            simulator.stop()
+
+    return {"simulated_days": days,
+            "seconds": round(elapsed, 3),
+            "days_per_second": round(days / elapsed, 2) if elapsed > 0 else None,
+            "cycles": cycles,
+            "weather_readings": weather.readings,
+            "controller_requests": sum(simulator.requests for simulator in simulators),
+            "simulated_end": clock.now().strftime("%Y-%m-%d %H:%M")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fast-forward the irrigation service")
+    parser.add_argument("--days", type=float, default=30, help="Simulated days to run")
+    parser.add_argument("--start", help="First simulated day YYYY-MM-DD.  Default: today")
+    parser.add_argument("--controllers", type=int, default=1, help="Simulated sprinkler controllers")
+    parser.add_argument("--max-valves", type=int, default=1, help="Zones open at once")
+    parser.add_argument("--zone-minutes", type=int, help="Water every zone this long")
+    parser.add_argument("--seed", type=int, help="Random seed for the weather")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, "%Y-%m-%d") if args.start else None
+    result = fast_forward(args.days, start, args.controllers, args.max_valves, args.zone_minutes, args.seed)
+    for key in sorted(result):
+        print "%-20s %s" % (key, result[key])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+light.py
+Simulated under cabinet light controller (arduino/lights) on a pseudo terminal
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.simulator.network import Faults
+from threading import Event, Thread, Lock
+import os
+import select
+import time
+import tty
+
+
+LIGHT_ZONES = 4
+
+DEFAULT_COLOR = (255, 255, 150)
+
+
+class LightSimulator(object):
+    """
+    Serial device backed by a pty.  Point house.services.light at the path property.
+    """
+
+    def __init__(self, faults=None):
+        self.faults = faults or Faults()
+        self.lock = Lock()
+        self.colors = [DEFAULT_COLOR] * LIGHT_ZONES
+        self.light_state = False
+        self.commands = list()
+        self.shutdown = Event()
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        self.reader = Thread(group=None, target=self.listen, name="LightSimulator_reader")
+        self.reader.daemon = True
+
+    def start(self):
+        """
+        Start reading commands
+        """
+        self.reader.start()
+        return self
+
+    def stop(self):
+        """
+        Stop reading and close the pty
+        """
+        self.shutdown.set()
+        self.reader.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def listen(self):
+        command_string = ""
+        while not self.shutdown.is_set():
+            readable, _unused, _unused = select.select([self.master], [], [], 0.2)
+            if not readable:
+                continue
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                break
+            command_string += data
+            while "\n" in command_string:
+                command, command_string = command_string.split("\n", 1)
+                delay = self.faults.delay()
+                if delay:
+                    time.sleep(delay)
+                response = self.command(command.strip())
+                if response is not None:
+                    os.write(self.master, response + "\r\n")
+
+    def command(self, command):
+        """
+        Apply one command.  Returns the reply or None.
+        """
+        with self.lock:
+            self.commands.append(command)
+            if command in ("RESET", "ON"):
+                self.light_state = True
+            elif command == "OFF":
+                self.light_state = False
+            elif command.startswith("COLOR "):
+                try:
+                    values = [int(command[index:index + 2], 16) for index in range(6, 14, 2)]
+                except ValueError:
+                    return None
+                zone, red, green, blue = values
+                if zone < LIGHT_ZONES:
+                    self.colors[zone] = (red, green, blue)
+            elif command == "STATUS":
+                return "true" if self.light_state else "false"
+            elif command.startswith("ZONE") and command[4:].isdigit() and int(command[4:]) < LIGHT_ZONES:
+                # print(value, HEX) does not pad
+                return "".join("%X" % value for value in self.colors[int(command[4:])])
+        return None
@@ -0,0 +1,180 @@
+"""
+network.py
+Simulated Ethernet shield for the alarm and sprinkler controllers
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_REUSEADDR
+from threading import Event, Thread, Lock
+import random
+import time
+
+
+# The firmware listens on this port
+CONTROLLER_PORT = 8888
+
+# W5100 Ethernet shield sockets
+SHIELD_SOCKETS = 4
+
+
+class Faults(object):
+    """
+    Network faults applied to every reply.
+    latency: seconds before the reply is sent
+    jitter: up to this many seconds added to or removed from the latency
+    drop_rate: fraction of requests where the connection is closed without a reply
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, drop_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+
+    def delay(self):
+        if not self.latency and not self.jitter:
+            return 0.0
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def drop(self):
+        return self.drop_rate > 0 and self.random.random() < self.drop_rate
+
+
+class SimulatedController(object):
+    """
+    TCP server that answers like the Arduino firmware.
+    A request ending in a newline is framed and the connection stays open.
+    Anything else is the original one-shot protocol: one reply, then the connection is closed.
+    Connections past the shield's socket count are closed immediately.
+    """
+
+    def __init__(self, host="localhost", port=0, faults=None, sockets=SHIELD_SOCKETS, clock=time.time):
+        self.faults = faults or Faults()
+        self.sockets = sockets
+        self.clock = clock
+        self.shutdown = Event()
+        self.lock = Lock()
+        self.connections = 0
+        self.requests = 0
+        self.refused = 0
+        self.dropped = 0
+        self.server = socket(AF_INET, SOCK_STREAM)
+        self.server.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(16)
+        self.server.settimeout(0.2)
+        self.host, self.port = self.server.getsockname()
+        self.listener = Thread(group=None, target=self.listen, name="%s_listener" % self.__class__.__name__)
+        self.listener.daemon = True
+
+    def start(self):
+        """
+        Start listening
+        """
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """
+        Stop listening
+        """
+        self.shutdown.set()
+        self.listener.join()
+        self.server.close()
+
+    def listen(self):
+        while not self.shutdown.is_set():
+            try:
+                (connection, _unused) = self.server.accept()
+            except Exception:
+                continue
+
+            with self.lock:
+                if self.connections >= self.sockets:
+                    self.refused += 1
+                    connection.close()
+                    continue
+                self.connections += 1
+
+            worker = Thread(group=None, target=self.serve, name="simulated_connection", args=(connection,))
+            worker.daemon = True
+            worker.start()
+
+    def serve(self, connection):
+        """
+        Answer requests on one connection
+        """
+        buffer_data = ""
+        connection.settimeout(1.0)
+        try:
+            while not self.shutdown.is_set():
+                try:
+                    data = connection.recv(1024)
+                except Exception:
+                    continue
+                if not data:
+                    break
+                buffer_data += data
+
+                if "\n" not in buffer_data:
+                    # One-shot client
+                    self.reply(connection, buffer_data)
+                    break
+
+                while "\n" in buffer_data:
+                    message, buffer_data = buffer_data.split("\n", 1)
+                    if not self.reply(connection, message, framed=True):
+                        return
+        finally:
+            with self.lock:
+                self.connections -= 1
+            connection.close()
+
+    def reply(self, connection, message, framed=False):
+        """
+        Send the reply to one message.  Returns False if the connection was dropped.
+        """
+        with self.lock:
+            self.requests += 1
+
+        if self.faults.drop():
+            with self.lock:
+                self.dropped += 1
+            return False
+
+        delay = self.faults.delay()
+        if delay:
+            time.sleep(delay)
+
+        response = self.process(message.strip())
+        if response is None and framed:
+            response = "unknown"
+        if response is not None:
+            connection.sendall(response + "\r\n")
+        return True
+
+    def process(self, message):
+        """
+        Return the reply to a message or None
+        """
+        raise NotImplementedError()
+
+    def millis(self):
+        """
+        Milliseconds from the controller clock
+        """
+        return int(self.clock() * 1000)
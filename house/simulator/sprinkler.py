@@ -0,0 +1,92 @@
+"""
+sprinkler.py
+Simulated irrigation controller (arduino/sprinklersystem)
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from house.simulator.network import SimulatedController
+import re
+
+
+SPRINKLER_ZONES = 4
+
+ZONE_COMMAND = re.compile(r"^zone(\d\d)-(on|off)$")
+
+
+class SprinklerSimulator(SimulatedController):
+    """
+    Four relays and the cycle timer.  The cycle counts down on the controller clock and
+    turns every relay off when it runs out, like monitor_running_cycle() in the firmware.
+    """
+
+    def __init__(self, host="localhost", port=0, zones=SPRINKLER_ZONES, **kwargs):
+        SimulatedController.__init__(self, host, port, **kwargs)
+        self.relays = [0] * zones
+        self.running_cycle = False
+        self.cycle_end = 0
+
+    def all_off(self):
+        self.relays = [0] * len(self.relays)
+
+    def end_cycle(self):
+        self.all_off()
+        self.running_cycle = False
+        self.cycle_end = 0
+
+    def start_cycle(self, milliseconds):
+        self.running_cycle = True
+        self.cycle_end = self.millis() + milliseconds
+
+    def monitor_running_cycle(self):
+        """
+        End the cycle once its time has passed
+        """
+        if self.running_cycle and self.millis() > self.cycle_end:
+            self.end_cycle()
+
+    def read_zone_status(self):
+        """
+        Same format as the firmware: 1:0:0:0:<milliseconds left>
+        """
+        milliseconds_left = self.cycle_end - self.millis() if self.running_cycle else 0
+        return ":".join(str(state) for state in self.relays) + ":%s" % milliseconds_left
+
+    def process(self, message):
+        with self.lock:
+            self.monitor_running_cycle()
+
+            match = ZONE_COMMAND.match(message)
+            if match:
+                zone = int(match.group(1))
+                if not 0 < zone <= len(self.relays):
+                    return None
+                self.relays[zone - 1] = 1 if match.group(2) == "on" else 0
+                return "Done"
+            elif message == "endcycle":
+                self.end_cycle()
+                return self.read_zone_status()
+            elif message.startswith("startcycle-"):
+                try:
+                    milliseconds = int(message[11:])
+                except ValueError:
+                    # String.toInt() returns 0 for anything that is not a number
+                    milliseconds = 0
+                self.start_cycle(milliseconds)
+                return self.read_zone_status()
+            elif message == "status":
+                return self.read_zone_status()
+        return None
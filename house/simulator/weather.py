@@ -0,0 +1,54 @@
+"""
+weather.py
+Simulated openweathermap readings
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import random
+import time
+
+
+class WeatherSimulator(object):
+    """
+    Weather in the openweathermap 2.5 format.  Windy, humid and rainy readings
+    come up with the given chances so some cycles are canceled.
+    """
+
+    def __init__(self, clock=time.time, windy=0.05, humid=0.05, rainy=0.1, seed=None):
+        self.clock = clock
+        self.windy = windy
+        self.humid = humid
+        self.rainy = rainy
+        self.random = random.Random(seed)
+        self.readings = 0
+
+    def read_weather(self, station_number, api_key):
+        """
+        Same signature as house.environment.external.read_weather
+        """
+        self.readings += 1
+        chance = self.random.random
+        weather = {"dt": int(self.clock()),
+                   "id": station_number,
+                   "main": {"temp": 273.15 + self.random.uniform(10, 35),
+                            "humidity": self.random.randint(91, 100) if chance() < self.humid
+                            else self.random.randint(20, 80)},
+                   "wind": {"speed": self.random.uniform(11, 25) if chance() < self.windy
+                            else self.random.uniform(0, 9)}}
+        if chance() < self.rainy:
+            weather["rain"] = {"3h": round(self.random.uniform(0.1, 10), 1)}
+        return weather
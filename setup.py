@@ -10,8 +10,10 @@ setup(name='house',
       url='https://github.com/bobhelander/house',
       packages=['house', 
                 'house.alarm',
+                'house.controllers',
                 'house.environment',
                 'house.services',
+                'house.simulator',
                 'house.irrigation',
                 'house.data',
                 'house.utils'],
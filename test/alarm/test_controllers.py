@@ -0,0 +1,61 @@
+"""
+test_controllers.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+
+
+import unittest
+from ConfigParser import ConfigParser
+from house.alarm.zones import alarm_controllers, controllers_state, controllers_status, ZONES
+from house.controllers.state import ZoneState
+
+
+def read_state(host, port):
+    """
+    Zone 1 open on the first controller, zone 2 on the second
+    """
+    return ZoneState.parse(ZONES, "0:1:1" if port == "8081" else "1:0:1")
+
+
+class AlarmControllersTestCase(unittest.TestCase):
+
+    def test_controllers(self):
+        settings = ConfigParser()
+        settings.add_section("alarm")
+        settings.set("alarm", "alarm_host", "alarm")
+        settings.set("alarm", "alarm_port", "8081")
+        self.assertEqual(alarm_controllers(settings), [("alarm", "8081")])
+        settings.remove_option("alarm", "alarm_host")
+        settings.remove_option("alarm", "alarm_port")
+        settings.set("alarm", "controllers", "alarm:8081, garage:8082")
+        self.assertEqual(alarm_controllers(settings), [("alarm", "8081"), ("garage", "8082")])
+
+    def test_state(self):
+        state = controllers_state([("alarm", "8081"), ("garage", "8082")], read_state)
+        self.assertEqual(state, {"zone1": 0, "zone2": 1, "zone3": 1, "zone10": 1, "zone11": 0, "zone12": 1})
+
+    def test_status(self):
+        status = controllers_status([("alarm", "8081"), ("garage", "8082")],
+                                    lambda host, port: [{"zone": "zone1", "status": port}])
+        self.assertEqual(status, [{"zone": "zone1", "status": "8081"}, {"zone": "zone10", "status": "8082"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
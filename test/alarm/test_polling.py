@@ -0,0 +1,92 @@
+"""
+test_polling.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+from house.alarm.polling import AdaptiveInterval, ZoneDebouncer
+from house.alarm.zones import ZONES
+
+
+class AdaptiveIntervalTestCase(unittest.TestCase):
+
+    def test_backoff(self):
+        interval = AdaptiveInterval(min_interval=0.2, max_interval=1.0, backoff=2.0)
+        self.assertEqual([interval.next(False) for _unused in range(4)], [0.4, 0.8, 1.0, 1.0])
+
+    def test_reset(self):
+        interval = AdaptiveInterval(min_interval=0.2, max_interval=1.0, backoff=2.0)
+        for _unused in range(5):
+            interval.next(False)
+        # A transition drops straight back to the minimum, then backs off again
+        self.assertEqual(interval.next(True), 0.2)
+        self.assertEqual(interval.next(False), 0.4)
+
+    def test_max_below_min(self):
+        interval = AdaptiveInterval(min_interval=0.5, max_interval=0.1)
+        self.assertEqual(interval.next(False), 0.5)
+
+
+class ZoneDebouncerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # zone9, the garage door, settles for 2 seconds.  The other zones report at once.
+        self.debouncer = ZoneDebouncer(ZONES, {"zone9": 2.0})
+        self.assertEqual(self.debouncer.update(0, 100.0), 0)
+
+    def test_immediate(self):
+        self.assertEqual(self.debouncer.update(0b1, 100.1), 0b1)
+        self.assertEqual(self.debouncer.reported, 0b1)
+        self.assertEqual(self.debouncer.update(0b1, 100.2), 0)
+
+    def test_held(self):
+        door = 1 << 8
+        self.assertEqual(self.debouncer.update(door, 101.0), 0)
+        self.assertEqual(self.debouncer.deadline(), 103.0)
+        self.assertEqual(self.debouncer.update(door, 102.0), 0)
+        self.assertEqual(self.debouncer.update(door, 103.0), door)
+        self.assertEqual(self.debouncer.reported, door)
+        self.assertIsNone(self.debouncer.deadline())
+
+    def test_chatter(self):
+        # Shorter than the window: never reported
+        door = 1 << 8
+        self.assertEqual(self.debouncer.update(door, 101.0), 0)
+        self.assertEqual(self.debouncer.update(0, 102.0), 0)
+        self.assertEqual(self.debouncer.pending, 0)
+        self.assertEqual(self.debouncer.update(0, 104.0), 0)
+        self.assertEqual(self.debouncer.reported, 0)
+
+    def test_window_restarts(self):
+        door = 1 << 8
+        self.debouncer.update(door, 101.0)
+        self.debouncer.update(0, 102.0)
+        # Changing again starts a new window
+        self.assertEqual(self.debouncer.update(door, 102.5), 0)
+        self.assertEqual(self.debouncer.update(door, 104.0), 0)
+        self.assertEqual(self.debouncer.update(door, 104.5), door)
+
+    def test_mixed(self):
+        door = 1 << 8
+        self.assertEqual(self.debouncer.update(door | 0b10, 101.0), 0b10)
+        self.assertEqual(self.debouncer.update(door | 0b10, 103.0), door)
+
+
+if __name__ == '__main__':
+    unittest.main()
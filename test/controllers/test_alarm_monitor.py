@@ -0,0 +1,196 @@
+"""
+test_alarm_monitor.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import time
+from socket import socket, timeout as socket_timeout, AF_INET, SOCK_STREAM
+from threading import Event, Lock, Thread
+from house.alarm.zones import ZONES
+from house.controllers.state import ZoneState
+from house.services.alarm_monitor import Monitor, ChangeQueue
+
+
+class FakeAlarm(object):
+    """
+    A keep-alive alarm controller on a local port
+    """
+
+    def __init__(self, reply="0:0:0:0:0:0:0:0:0"):
+        self.reply = reply
+        self.shutdown = Event()
+        self.server = socket(AF_INET, SOCK_STREAM)
+        self.server.bind(("localhost", 0))
+        self.server.listen(5)
+        self.server.settimeout(0.1)
+        self.host, self.port = self.server.getsockname()
+        self.name = "%s:%s" % (self.host, self.port)
+        self.listener = Thread(group=None, target=self.listen, name="alarm_test")
+        self.listener.start()
+
+    def listen(self):
+        while not self.shutdown.is_set():
+            try:
+                (connection, _unused) = self.server.accept()
+            except Exception:
+                continue
+            connection.settimeout(0.1)
+            while not self.shutdown.is_set():
+                try:
+                    buffer_data = connection.recv(1024)
+                except socket_timeout:
+                    continue
+                except Exception:
+                    break
+                if not buffer_data:
+                    break
+                for _unused in buffer_data.splitlines():
+                    connection.sendall(self.reply + "\r\n")
+            connection.close()
+
+    def close(self):
+        self.shutdown.set()
+        self.listener.join()
+        self.server.close()
+
+
+class MonitorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.alarms = [FakeAlarm(), FakeAlarm("0:0:0:0:0:0:0:0")]
+        self.monitor = Monitor([(alarm.host, alarm.port) for alarm in self.alarms],
+                               poll_interval=0.02, max_interval=0.05, select_timeout=0.05)
+        self.lock = Lock()
+        self.changes = list()
+        self.changed = Event()
+        self.monitor.add_handler(self.record)
+        self.thread = Thread(group=None, target=self.monitor.begin, name="monitor_test")
+        self.thread.start()
+
+    def tearDown(self):
+        self.monitor.enable(False)
+        self.thread.join()
+        for alarm in self.alarms:
+            alarm.close()
+
+    def record(self, changed):
+        with self.lock:
+            self.changes.append(changed)
+        self.changed.set()
+
+    def wait_for(self, condition):
+        for _unused in range(100):
+            if condition():
+                return True
+            self.changed.wait(0.05)
+            self.changed.clear()
+        return False
+
+    def test_controllers(self):
+        self.assertTrue(self.wait_for(lambda: all(self.monitor.state.values())
+                                      and len(self.monitor.state) == 2))
+        state = self.monitor.state
+        self.assertEqual(len(state[self.alarms[0].name]), 9)
+        # The 8 zone controller does not gain a zone9
+        self.assertEqual(len(state[self.alarms[1].name]), 8)
+
+        self.alarms[1].reply = "0:0:1:0:0:0:0:0"
+        self.assertTrue(self.wait_for(lambda: self.changes))
+        self.assertEqual([(zone["controller"], zone["key"], zone["state"]) for zone in self.changes[0]],
+                         [(self.alarms[1].name, "zone3", "1")])
+
+        self.alarms[0].reply = "0:0:0:0:0:0:0:0:1"
+        self.assertTrue(self.wait_for(lambda: len(self.changes) == 2))
+        self.assertEqual([(zone["controller"], zone["key"]) for zone in self.changes[1]],
+                         [(self.alarms[0].name, "zone9")])
+
+
+class ChangeQueueTestCase(unittest.TestCase):
+
+    def test_order(self):
+        queue = ChangeQueue(size=3)
+        queue.put(ZoneState(ZONES, 0b001), 0b001, "alarm1", 1.0)
+        queue.put(ZoneState(ZONES, 0b000), 0b001, "alarm2", 1.5)
+        queue.put(ZoneState(ZONES, 0b000), 0b001, "alarm1", 2.0)
+        # An open then a close of the same zone are both kept
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(queue.get(), (ZoneState(ZONES, 0b001), 0b001, "alarm1", 1.0))
+        self.assertEqual(queue.get()[2], "alarm2")
+        self.assertEqual(queue.get(), (ZoneState(ZONES, 0b000), 0b001, "alarm1", 2.0))
+        queue.close()
+        self.assertIsNone(queue.get())
+
+    def test_full(self):
+        queue = ChangeQueue(size=1)
+        queue.put(ZoneState(ZONES, 0b001), 0b001, "alarm1", 1.0)
+        putter = Thread(group=None, target=queue.put, name="put_test",
+                        args=(ZoneState(ZONES, 0b000), 0b001, "alarm1", 2.0))
+        putter.start()
+        putter.join(0.1)
+        # Waits for room instead of dropping or merging the change
+        self.assertTrue(putter.is_alive())
+        self.assertEqual(queue.get()[3], 1.0)
+        putter.join(1.0)
+        self.assertFalse(putter.is_alive())
+        self.assertEqual(queue.get()[3], 2.0)
+        self.assertEqual(queue.full, 1)
+
+
+class HandlerOrderTestCase(unittest.TestCase):
+
+    def test_slow_handler(self):
+        # A slow handler still gets every transition in the order it was seen
+        monitor = Monitor([], handler_timeout=5)
+        seen = list()
+        done = Event()
+
+        def slow(changed):
+            time.sleep(0.01)
+            seen.append(changed[0]["state"])
+            if len(seen) == 20:
+                done.set()
+
+        monitor.add_handler(slow)
+        thread = Thread(group=None, target=monitor.begin, name="order_test")
+        thread.start()
+        try:
+            for index in range(20):
+                bits = index % 2
+                monitor.events.put(ZoneState(ZONES, bits), 0b1, "alarm1", float(index))
+            self.assertTrue(done.wait(5))
+        finally:
+            monitor.enable(False)
+            thread.join()
+        self.assertEqual(seen, [str(index % 2) for index in range(20)])
+
+    def test_journal(self):
+        # The journal hears every transition as it is seen, before any handler runs
+        journal = list()
+        monitor = Monitor([("localhost", 1)], journal=journal.append)
+        controller = monitor.controllers[0]
+        for bits in (0b0, 0b1, 0b0, 0b1):
+            monitor.update(controller, bits)
+        self.assertEqual([[(zone["key"], zone["state"]) for zone in changed] for changed in journal],
+                         [[("zone1", "1")], [("zone1", "0")], [("zone1", "1")]])
+        self.assertEqual(len(monitor.events), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
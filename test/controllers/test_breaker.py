@@ -0,0 +1,109 @@
+"""
+test_breaker.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+from socket import error as socket_error
+from house.controllers.breaker import CircuitBreaker, RetryPolicy, ControllerUnavailable, OPEN, CLOSED
+from house.controllers.breaker import get_retry_policy
+from house.services.settings import SETTINGS
+
+
+class BreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.calls = 0
+        self.breaker = CircuitBreaker("sprinkler", failure_threshold=3, reset_timeout=30.0,
+                                      clock=lambda: self.now)
+        self.policy = RetryPolicy(attempts=3, base_delay=0.0, jitter=0.0)
+
+    def fail(self):
+        self.calls += 1
+        raise socket_error("connection refused")
+
+    def succeed(self):
+        self.calls += 1
+        return "0:0:0:0:0"
+
+    def test_retry(self):
+        self.assertRaises(socket_error, self.breaker.call, self.policy, self.fail)
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_fail_fast(self):
+        self.assertRaises(socket_error, self.breaker.call, self.policy, self.fail)
+        self.assertRaises(ControllerUnavailable, self.breaker.call, self.policy, self.succeed)
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.breaker.status()["retry_in"], 30.0)
+
+    def test_half_open(self):
+        self.assertRaises(socket_error, self.breaker.call, self.policy, self.fail)
+        self.now += 31
+        # One trial call.  Failing it opens the breaker again without retrying.
+        self.assertRaises(socket_error, self.breaker.call, self.policy, self.fail)
+        self.assertEqual(self.calls, 4)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.now += 31
+        self.assertEqual(self.breaker.call(self.policy, self.succeed), "0:0:0:0:0")
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_not_counted(self):
+        def broken():
+            self.calls += 1
+            raise ValueError("bad reply")
+
+        # Not a connection error: no retry and the breaker is left closed
+        for _unused in range(4):
+            self.assertRaises(ValueError, self.breaker.call, self.policy, broken)
+        self.assertEqual(self.calls, 4)
+        self.assertEqual((self.breaker.state, self.breaker.failures), (CLOSED, 0))
+
+        # A trial call that fails that way lets the next one try again
+        self.assertRaises(socket_error, self.breaker.call, self.policy, self.fail)
+        self.now += 31
+        self.assertRaises(ValueError, self.breaker.call, self.policy, broken)
+        self.assertEqual(self.breaker.call(self.policy, self.succeed), "0:0:0:0:0")
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_backoff(self):
+        policy = RetryPolicy(base_delay=0.2, max_delay=1.0, jitter=0.0)
+        self.assertEqual([policy.delay(retry) for retry in range(1, 5)], [0.2, 0.4, 0.8, 1.0])
+
+    def test_configured_policy(self):
+        SETTINGS.add_section("retry")
+        SETTINGS.add_section("retry garden:5001")
+        try:
+            SETTINGS.set("retry", "budget", "10")
+            SETTINGS.set("retry garden:5001", "attempts", "5")
+            default = RetryPolicy(attempts=2, base_delay=0.1)
+            garden = get_retry_policy("garden", 5001, default)
+            front = get_retry_policy("front", "5001", default)
+        finally:
+            SETTINGS.remove_section("retry")
+            SETTINGS.remove_section("retry garden:5001")
+        self.assertEqual((garden.attempts, garden.base_delay, garden.budget), (5, 0.1, 10.0))
+        self.assertEqual((front.attempts, front.budget), (2, 10.0))
+        # One shared policy per controller
+        self.assertIs(get_retry_policy("garden", "5001"), garden)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+test_cache.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import time
+from threading import Event, Thread
+from house.controllers.cache import SingleFlightCache
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.loads = 0
+        self.release = Event()
+        self.error = None
+        self.cache = SingleFlightCache(self.load, ttl=0.5, clock=lambda: self.now)
+
+    def load(self, host):
+        self.loads += 1
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return "%s:%s" % (host, self.loads)
+
+    def concurrent(self, callers):
+        """
+        Call get from several threads while the first load is held.  Returns each caller's outcome.
+        """
+        outcomes = [None] * callers
+
+        def call(index):
+            try:
+                outcomes[index] = self.cache.get("alarm")
+            except Exception, ex:
+                outcomes[index] = ex
+
+        threads = [Thread(group=None, target=call, args=(index,)) for index in range(callers)]
+        for thread in threads:
+            thread.start()
+        deadline = time.time() + 5
+        while self.cache.stats()["coalesced"] < callers - 1 and time.time() < deadline:
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_ttl(self):
+        self.release.set()
+        self.assertEqual(self.cache.get("alarm"), "alarm:1")
+        self.now += 0.4
+        self.assertEqual(self.cache.get("alarm"), "alarm:1")
+        self.now += 0.2
+        self.assertEqual(self.cache.get("alarm"), "alarm:2")
+        self.assertEqual(self.cache.get("sprinkler"), "sprinkler:3")
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 3))
+
+    def test_single_flight(self):
+        self.assertEqual(self.concurrent(5), ["alarm:1"] * 5)
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(self.cache.stats()["coalesced"], 4)
+
+    def test_error(self):
+        self.error = IOError("connection refused")
+        outcomes = self.concurrent(4)
+        self.assertEqual(self.loads, 1)
+        self.assertTrue(all(outcome is self.error for outcome in outcomes))
+        # Errors are not cached
+        self.error = None
+        self.assertEqual(self.cache.get("alarm"), "alarm:2")
+
+    def test_clear(self):
+        self.release.set()
+        self.cache.get("alarm")
+        self.cache.clear()
+        self.assertEqual(self.cache.get("alarm"), "alarm:2")
+
+
+if __name__ == '__main__':
+    unittest.main()
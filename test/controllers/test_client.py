@@ -0,0 +1,105 @@
+"""
+test_client.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import time
+from threading import Event
+from house.controllers.client import ControllerClient, Future, CancelledError, then, then_all, gather
+from house.controllers.transport import close_pools
+from house.controllers.workers import TaskTimeout
+from house.simulator.network import Faults
+from house.simulator.sprinkler import SprinklerSimulator
+
+
+class FutureTestCase(unittest.TestCase):
+
+    def test_then(self):
+        source = Future()
+        doubled = then(source, lambda value: value * 2)
+        source.set_result(21)
+        self.assertEqual(doubled.result(0), 42)
+
+    def test_then_all_cancels_siblings(self):
+        futures = [Future() for _unused in range(3)]
+        combined = then_all(futures)
+        futures[0].set_result(1)
+        futures[1].set_error(IOError("no reply"))
+        self.assertRaises(IOError, combined.result, 0)
+        self.assertTrue(futures[2].cancelled)
+        self.assertRaises(CancelledError, futures[2].result, 0)
+
+    def test_gather_timeout(self):
+        slow = Future()
+        self.assertRaises(TaskTimeout, gather, [slow], timeout=0.05)
+        self.assertTrue(slow.cancelled)
+
+
+class ClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Each simulated controller takes 0.3 seconds to answer
+        self.sprinklers = [SprinklerSimulator(faults=Faults(latency=0.3)).start() for _unused in range(2)]
+        self.client = ControllerClient(workers=2)
+        self.release = Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.client.close()
+        close_pools()
+        for sprinkler in self.sprinklers:
+            sprinkler.stop()
+
+    def test_fan_out(self):
+        started = time.time()
+        states = gather([self.client.sprinkler_state(sprinkler.host, sprinkler.port)
+                         for sprinkler in self.sprinklers], timeout=5)
+        # Both controllers were read at once
+        self.assertLess(time.time() - started, 0.55)
+        self.assertEqual([state["cycle_milliseconds"] for state in states], ["0", "0"])
+
+    def test_start_zone(self):
+        sprinkler = self.sprinklers[0]
+        status = self.client.sprinkler_start_zone(2, 60000, sprinkler.host, sprinkler.port).result(5)
+        self.assertEqual([zone["status"] for zone in status["zones"]], ["off", "on", "off", "off"])
+        self.assertTrue(sprinkler.running_cycle)
+        # Four messages in one round trip
+        self.assertEqual(sprinkler.requests, 4)
+
+    def test_timeout(self):
+        future = self.client.submit(self.release.wait, 5, timeout=0.2)
+        self.assertRaises(TaskTimeout, future.result, 5)
+
+    def test_cancel(self):
+        calls = list()
+        busy = [self.client.submit(self.release.wait, 5) for _unused in range(2)]
+        waiting = self.client.submit(calls.append, "ran")
+        self.assertTrue(waiting.cancel())
+        self.assertRaises(CancelledError, waiting.result, 0)
+        self.release.set()
+        gather(busy, timeout=5)
+        # A worker takes the cancelled call off the queue without running it
+        time.sleep(0.1)
+        self.assertEqual(self.client.pool.backlog(), 0)
+        self.assertEqual(calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+test_reactor.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+from socket import socket, timeout as socket_timeout, AF_INET, SOCK_STREAM
+from threading import Event, Thread
+from house.controllers.reactor import Reactor
+
+
+class ReactorTestCase(unittest.TestCase):
+
+    keep_alive = True
+
+    def setUp(self):
+        self.shutdown = Event()
+        self.connections = 0
+        self.silent = False
+        self.server = socket(AF_INET, SOCK_STREAM)
+        self.server.bind(("localhost", 0))
+        self.server.listen(5)
+        self.server.settimeout(0.2)
+        self.host, self.port = self.server.getsockname()
+        self.listener = Thread(group=None, target=self.listen, name="listener_test")
+        self.listener.start()
+        self.reactor = Reactor(select_timeout=0.1)
+        self.thread = Thread(group=None, target=self.reactor.run, name="reactor_test")
+        self.thread.start()
+
+    def tearDown(self):
+        self.reactor.stop()
+        self.thread.join()
+        self.reactor.close()
+        self.shutdown.set()
+        self.listener.join()
+        self.server.close()
+
+    def listen(self):
+        while not self.shutdown.is_set():
+            try:
+                (connection, _unused) = self.server.accept()
+            except Exception:
+                continue
+            self.connections += 1
+            self.serve(connection)
+            connection.close()
+
+    def serve(self, connection):
+        """
+        Behave like the firmware.  A silent controller reads requests and never answers.
+        """
+        connection.settimeout(0.5)
+        while not self.shutdown.is_set():
+            try:
+                buffer_data = connection.recv(1024)
+            except socket_timeout:
+                continue
+            except Exception:
+                return
+            if not buffer_data:
+                return
+            if self.silent:
+                continue
+            if not self.keep_alive:
+                if buffer_data == "status":
+                    connection.sendall("0:0:1:0:0:0:0:1\r\n")
+                return
+            for message in buffer_data.splitlines():
+                if message == "status":
+                    connection.sendall("0:0:1:0:0:0:0:1\r\n")
+                else:
+                    connection.sendall("unknown\r\n")
+
+    def send(self, message, timeout=2.0):
+        """
+        Send a message from the reactor thread and wait for (reply, error)
+        """
+        outcome = list()
+        finished = Event()
+
+        def callback(reply, error):
+            outcome.append((reply, error))
+            finished.set()
+
+        self.reactor.call_soon_threadsafe(self.reactor.request, self.host, self.port, message, callback, timeout)
+        self.assertTrue(finished.wait(5))
+        return outcome[0]
+
+    def test_keep_alive(self):
+        for _unused in range(3):
+            self.assertEqual(self.send("status"), ("0:0:1:0:0:0:0:1", None))
+        self.assertEqual(self.send("zone01-on"), ("unknown", None))
+        self.assertFalse(self.reactor.channel(self.host, self.port).one_shot)
+        self.assertEqual(self.connections, 1)
+
+    def test_timeout(self):
+        self.silent = True
+        reply, error = self.send("status", timeout=0.3)
+        self.assertIsNone(reply)
+        self.assertIsInstance(error, socket_timeout)
+
+    def test_cancel(self):
+        self.silent = True
+        outcome = list()
+        requests = list()
+
+        def send():
+            requests.append(self.reactor.request(self.host, self.port, "status",
+                                                 lambda reply, error: outcome.append(reply), 0.3))
+            requests[0].cancel()
+
+        self.reactor.call_soon_threadsafe(send)
+        finished = Event()
+        self.reactor.call_soon_threadsafe(self.reactor.call_later, 0.6, finished.set)
+        self.assertTrue(finished.wait(5))
+        self.assertEqual(outcome, [])
+        self.assertIsNone(self.reactor.channel(self.host, self.port).current)
+
+
+class OneShotReactorTestCase(ReactorTestCase):
+
+    keep_alive = False
+
+    def test_keep_alive(self):
+        pass
+
+    def test_one_shot_fallback(self):
+        for _unused in range(3):
+            self.assertEqual(self.send("status"), ("0:0:1:0:0:0:0:1", None))
+        self.assertTrue(self.reactor.channel(self.host, self.port).one_shot)
+        self.assertEqual(self.connections, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
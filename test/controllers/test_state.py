@@ -0,0 +1,73 @@
+"""
+test_state.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+from house.controllers.state import ZoneState, ProtocolError, parse_bits, iter_bits
+from house.alarm.zones import ZONES, ZONE_DEFINITIONS, ZONE_STATE_TEXT
+
+
+class ZoneStateTestCase(unittest.TestCase):
+
+    def test_parse(self):
+        state = ZoneState.parse(ZONES, "0:0:1:0:0:0:0:0:1")
+        self.assertEqual(state.bits, 0b100000100)
+        self.assertEqual(state["zone3"], 1)
+        self.assertEqual(state["zone1"], 0)
+
+    def test_parse_extra_fields(self):
+        # Sprinkler status ends with the cycle milliseconds
+        self.assertEqual(parse_bits("0:1:0:0:12345", 4), 0b0010)
+
+    def test_parse_short_reply(self):
+        # The 8 zone firmware.  No zone9 is made up.
+        state = ZoneState.parse(ZONES, "0:0:1:0:0:0:0:1")
+        self.assertEqual(state.keys, ZONES[:8])
+        self.assertEqual(len(state.status(ZONE_DEFINITIONS, ZONE_STATE_TEXT)), 8)
+        self.assertNotIn("zone9", state)
+
+    def test_parse_wide_fields(self):
+        self.assertEqual(parse_bits("0:10:0:1", 4), 0b1010)
+        self.assertEqual(parse_bits("1:0:12345", 2), 0b01)
+
+    def test_parse_errors(self):
+        for reply in ["", "  \r\n", None, "unknown", "0:1::0"]:
+            self.assertRaises(ProtocolError, ZoneState.parse, ZONES, reply)
+
+    def test_changed(self):
+        before = ZoneState.parse(ZONES, "0:0:1:0:0:0:0:0:1")
+        after = ZoneState.parse(ZONES, "1:0:1:0:0:0:0:0:0")
+        self.assertEqual(list(iter_bits(after.changed(before))), [0, 8])
+        self.assertEqual(after.changed_keys(before), ["zone1", "zone9"])
+        self.assertEqual(before.changed(before), 0)
+
+    def test_status(self):
+        state = ZoneState.parse(ZONES, "0:0:1:0:0:0:0:0:1")
+        status = state.status(ZONE_DEFINITIONS, ZONE_STATE_TEXT)
+        self.assertEqual(status[2], {"zone": "zone3", "description": "Garage Internal", "status": "closed"})
+        self.assertEqual(status[8]["status"], "open")
+
+    def test_from_mapping(self):
+        state = ZoneState.from_mapping(ZONES[:4], {"zone1": "0", "zone2": "1", "zone3": "0", "zone4": "1"})
+        self.assertEqual(state.bits, 0b1010)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+"""
+test_transport.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import time
+from socket import socket, AF_INET, SOCK_STREAM
+from threading import Event, Thread
+from house.controllers.transport import ControllerPool, get_pool, send_request
+
+
+class TransportTestCase(unittest.TestCase):
+
+    keep_alive = True
+
+    def setUp(self):
+        self.shutdown = Event()
+        self.connections = 0
+        self.server = socket(AF_INET, SOCK_STREAM)
+        self.server.bind(("localhost", 0))
+        self.server.listen(5)
+        self.server.settimeout(0.2)
+        self.host, self.port = self.server.getsockname()
+        self.listener = Thread(group=None, target=self.listen, name="listener_test")
+        self.listener.start()
+
+    def tearDown(self):
+        self.shutdown.set()
+        self.listener.join()
+        self.server.close()
+
+    def listen(self):
+        while not self.shutdown.is_set():
+            try:
+                (connection, _unused) = self.server.accept()
+            except Exception:
+                continue
+            self.connections += 1
+            self.serve(connection)
+            connection.close()
+
+    def serve(self, connection):
+        """
+        Behave like the firmware.  Framed requests keep the connection open
+        unless this is the original one-shot firmware.
+        """
+        connection.settimeout(0.5)
+        while not self.shutdown.is_set():
+            try:
+                buffer_data = connection.recv(1024)
+            except Exception:
+                return
+            if not self.keep_alive:
+                if buffer_data == "status":
+                    connection.sendall("0:0:1:0:0:0:0:1\r\n")
+                return
+            if not buffer_data:
+                return
+            for message in buffer_data.splitlines():
+                if message == "status":
+                    connection.sendall("0:0:1:0:0:0:0:1\r\n")
+                else:
+                    connection.sendall("unknown\r\n")
+
+    def test_keep_alive(self):
+        pool = ControllerPool(self.host, self.port)
+        try:
+            for _unused in range(5):
+                self.assertEqual(pool.request("status"), "0:0:1:0:0:0:0:1")
+            self.assertFalse(pool.one_shot)
+            self.assertEqual(self.connections, 1)
+        finally:
+            pool.close()
+
+    def test_pipelined(self):
+        pool = ControllerPool(self.host, self.port)
+        try:
+            self.assertEqual(pool.request_many(["status", "zone01-on", "status"]),
+                             ["0:0:1:0:0:0:0:1", "unknown", "0:0:1:0:0:0:0:1"])
+            self.assertEqual(self.connections, 1)
+        finally:
+            pool.close()
+
+    def test_reap(self):
+        pool = ControllerPool(self.host, self.port, idle_timeout=30.0)
+        try:
+            pool.request("status")
+            self.assertEqual(pool.reap(), 0)
+            self.assertEqual(len(pool.idle), 1)
+            # Closed without waiting for the next request
+            self.assertEqual(pool.reap(time.time() + 31), 1)
+            self.assertEqual(pool.idle, [])
+            self.assertEqual(pool.request("status"), "0:0:1:0:0:0:0:1")
+        finally:
+            pool.close()
+
+    def test_shared_pool_options(self):
+        # A lookup without options, such as send_request, may create the pool first
+        pool = get_pool(self.host, self.port)
+        try:
+            self.assertIs(get_pool(self.host, self.port, timeout=2.0, connect_timeout=1.0), pool)
+            self.assertEqual((pool.timeout, pool.connect_timeout), (2.0, 1.0))
+            self.assertIs(get_pool(self.host, str(self.port)), pool)
+            self.assertIs(get_pool(self.host, self.port, timeout=2.0), pool)
+            self.assertRaises(ValueError, get_pool, self.host, self.port, timeout=5.0)
+            self.assertEqual(send_request("status", self.host, self.port), "0:0:1:0:0:0:0:1")
+        finally:
+            pool.close()
+
+
+class OneShotTransportTestCase(TransportTestCase):
+
+    keep_alive = False
+
+    def test_keep_alive(self):
+        pass
+
+    def test_reap(self):
+        pass
+
+    def test_pipelined(self):
+        pool = ControllerPool(self.host, self.port)
+        self.assertEqual(pool.request_many(["status", "status"]), ["0:0:1:0:0:0:0:1", "0:0:1:0:0:0:0:1"])
+        self.assertTrue(pool.one_shot)
+
+    def test_one_shot_fallback(self):
+        pool = ControllerPool(self.host, self.port)
+        for _unused in range(3):
+            self.assertEqual(pool.request("status"), "0:0:1:0:0:0:0:1")
+        self.assertTrue(pool.one_shot)
+
+
+if __name__ == '__main__':
+    unittest.main()
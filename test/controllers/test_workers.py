@@ -0,0 +1,85 @@
+"""
+test_workers.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import time
+from threading import Event
+from Queue import Full
+from house.controllers.workers import WorkerPool, TaskTimeout
+
+
+class WorkerPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.release = Event()
+        self.pool = WorkerPool(workers=2, queue_size=2, name="test", check_interval=0.05, log_errors=False)
+
+    def tearDown(self):
+        self.release.set()
+        self.pool.close()
+
+    def hold(self, value):
+        self.release.wait(5)
+        return value
+
+    def test_result(self):
+        task = self.pool.submit(lambda a, b: a + b, 1, 2)
+        self.assertEqual(task.result(5), 3)
+        failed = self.pool.submit(int, "x")
+        self.assertRaises(ValueError, failed.result, 5)
+
+    def test_timeout(self):
+        task = self.pool.submit(self.hold, 1, timeout=0.1)
+        self.assertRaises(TaskTimeout, task.result, 5)
+        self.assertEqual(self.pool.timeouts, 1)
+        # The abandoned worker was replaced
+        self.assertEqual(self.pool.submit(abs, -4).result(5), 4)
+        self.assertEqual(self.pool.count, 3)
+
+    def test_cancel(self):
+        running = [self.pool.submit(self.hold, index) for index in range(2)]
+        waiting = self.pool.submit(self.hold, 2)
+        self.assertTrue(waiting.cancel())
+        self.release.set()
+        self.assertEqual([task.result(5) for task in running], [0, 1])
+        waiting.result(5)
+        self.assertIsNone(waiting.started)
+
+    def test_full(self):
+        tasks = [self.pool.submit(self.hold, index) for index in range(4)]
+        self.assertIsNone(self.pool.try_submit(self.hold, 4))
+        self.assertRaises(Full, self.pool.submit, self.hold, 4, wait=0.05)
+        self.release.set()
+        self.assertEqual([task.result(5) for task in tasks], [0, 1, 2, 3])
+
+    def test_close_full(self):
+        tasks = [self.pool.submit(self.hold, index) for index in range(4)]
+        started = time.time()
+        # The queue has no room for the stop markers.  close() must not wait for it.
+        self.pool.close()
+        self.assertLess(time.time() - started, 1)
+        self.release.set()
+        # Queued tasks still run
+        self.assertEqual([task.result(5) for task in tasks], [0, 1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+test_columns.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import sqlite3
+from house.data.columns import fetch_columns, column_lists
+
+
+class ColumnsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE samples (dt INTEGER, state INTEGER, temp DECIMAL)")
+        self.conn.executemany("INSERT INTO samples VALUES (?, ?, ?)",
+                              [(1000 + index, index % 2, 70 + index if index != 3 else None) for index in range(5)])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_fetch_columns(self):
+        cursor = self.conn.execute("SELECT dt, state, temp FROM samples ORDER BY dt")
+        columns = fetch_columns(cursor, rows=2)
+        self.assertEqual(list(columns), ["dt", "state", "temp"])
+        self.assertEqual(list(columns["dt"]), [1000, 1001, 1002, 1003, 1004])
+        self.assertEqual(len(columns["temp"]), 5)
+
+        lists = column_lists(columns)
+        self.assertEqual(lists["state"], [0, 1, 0, 1, 0])
+        # The NULL made the column floating point
+        self.assertEqual(lists["temp"], [70.0, 71.0, 72.0, None, 74.0])
+
+    def test_empty(self):
+        cursor = self.conn.execute("SELECT dt, temp FROM samples WHERE dt < 0")
+        self.assertEqual(column_lists(fetch_columns(cursor)), {"dt": [], "temp": []})
+
+
+if __name__ == '__main__':
+    unittest.main()
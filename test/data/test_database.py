@@ -0,0 +1,75 @@
+"""
+test_database.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import shutil
+import tempfile
+import os
+from threading import Thread
+from house.data.database import Database
+from house.data import service_data
+
+
+class DatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = Database(os.path.join(self.directory, "house.db"))
+
+    def tearDown(self):
+        self.database.close()
+        shutil.rmtree(self.directory)
+
+    def test_connections(self):
+        conn = self.database.connection()
+        self.assertIs(self.database.connection(), conn)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+        others = list()
+        thread = Thread(target=lambda: others.append(self.database.connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(others[0], conn)
+        self.assertEqual(len(self.database.connections), 2)
+
+    def test_transaction(self):
+        with self.database.transaction() as cursor:
+            cursor.execute("CREATE TABLE samples (value INTEGER)")
+            cursor.execute("INSERT INTO samples VALUES (1)")
+        try:
+            with self.database.transaction() as cursor:
+                cursor.execute("INSERT INTO samples VALUES (2)")
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(self.database.connection().execute("SELECT value FROM samples").fetchall(), [(1,)])
+
+    def test_service_data(self):
+        with service_data.DATABASE.using(os.path.join(self.directory, "service.db")):
+            service_data.create_database()
+            service_data.update_status("Running Cycle")
+            self.assertEqual(service_data.get_status()[0], "Running Cycle")
+            self.assertEqual(len(service_data.get_schedule()), 4)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "service.db")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+test_history_stream.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import shutil
+import tempfile
+import os
+from datetime import datetime, timedelta
+from house.data import service_data
+
+
+START = datetime(2016, 5, 1)
+
+
+class HistoryStreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = service_data.DATABASE.using(os.path.join(self.directory, "house.db"))
+        self.database.__enter__()
+        service_data.create_database()
+        service_data.write_history([{"entryDate": START + timedelta(minutes=index), "inside_temp": index}
+                                    for index in range(100)])
+
+    def tearDown(self):
+        self.database.__exit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+    def test_range(self):
+        names, chunks = service_data.history_stream(START + timedelta(minutes=10), START + timedelta(minutes=30),
+                                                    ["inside_temp", "unknown"], rows=8)
+        self.assertEqual(names, ["id", "dt", "inside_temp"])
+        chunks = list(chunks)
+        self.assertEqual([len(chunk) for chunk in chunks], [8, 8, 4])
+        self.assertEqual([row[2] for chunk in chunks for row in chunk], range(10, 30))
+
+    def test_since_id(self):
+        names, chunks = service_data.history_stream()
+        rows = [row for chunk in chunks for row in chunk]
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(len(names), len(rows[0]))
+
+        service_data.write_history([{"entryDate": START + timedelta(hours=2), "inside_temp": 200}])
+        _unused, chunks = service_data.history_stream(since_id=rows[-1][0])
+        newer = [row for chunk in chunks for row in chunk]
+        self.assertEqual(len(newer), 1)
+        self.assertEqual(newer[0][names.index("inside_temp")], 200)
+
+    def test_zone_history(self):
+        service_data.write_history([{"entryDate": START + timedelta(hours=3), "irrigation_zone1": 0,
+                                     "irrigation_zone6": 1, "irrigation_zone12": None}])
+        zones = service_data.retrieve_zone_history(START + timedelta(hours=2), START + timedelta(hours=4))
+        self.assertEqual(zones.keys(), [1, 6])
+        self.assertEqual(zones[6][0][1], 1)
+        # The columns of the first four zones are still written
+        names, chunks = service_data.history_stream(START + timedelta(hours=2), fields=["irrigation_zone1"])
+        self.assertEqual([row[2] for chunk in chunks for row in chunk], [0])
+
+    def test_alarm_zone_history(self):
+        service_data.write_history([{"entryDate": START + timedelta(hours=3), "alarm_zone9": 1, "alarm_zone14": 0}])
+        zones = service_data.retrieve_zone_history(START + timedelta(hours=2), START + timedelta(hours=4), "alarm")
+        self.assertEqual(zones.keys(), [9, 14])
+        self.assertEqual(service_data.retrieve_zone_history(START, START + timedelta(hours=4)), {})
+
+    def test_failed_flush(self):
+        def broken():
+            raise IOError("disk full")
+
+        flush_history = service_data.flush_history
+        service_data.flush_history = broken
+        try:
+            # The samples already written are still returned
+            _unused, chunks = service_data.history_stream()
+            self.assertEqual(sum(len(chunk) for chunk in chunks), 100)
+            result = service_data.retrieve_history_range(START, START + timedelta(hours=1), 500)
+            self.assertEqual(len(result["rows"]), 60)
+        finally:
+            service_data.flush_history = flush_history
+
+
+if __name__ == '__main__':
+    unittest.main()
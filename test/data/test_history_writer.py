@@ -0,0 +1,77 @@
+"""
+test_history_writer.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import time
+from house.data.history_writer import HistoryWriter
+
+
+class HistoryWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = list()
+        self.broken = False
+
+    def write(self, samples):
+        if self.broken:
+            raise IOError("disk full")
+        self.batches.append(list(samples))
+
+    def wait_for(self, count):
+        deadline = time.time() + 2
+        while len(self.batches) < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_batch_size(self):
+        writer = HistoryWriter(self.write, batch_size=3, max_delay=60)
+        for sample in range(7):
+            writer.add(sample)
+        self.wait_for(1)
+        # A full batch is written without waiting for max_delay
+        self.assertGreaterEqual(len(self.batches[0]), 3)
+        writer.close()
+        self.assertEqual(sum(self.batches, []), range(7))
+        self.assertRaises(ValueError, writer.add, 8)
+
+    def test_max_delay(self):
+        writer = HistoryWriter(self.write, batch_size=100, max_delay=0.05)
+        writer.add("a")
+        writer.add("b")
+        self.wait_for(1)
+        self.assertEqual(self.batches, [["a", "b"]])
+        writer.close()
+
+    def test_failed_batch_is_retried(self):
+        writer = HistoryWriter(self.write, batch_size=100, max_delay=60, max_pending=3)
+        writer.add(1)
+        writer.add(2)
+        self.broken = True
+        self.assertRaises(IOError, writer.flush)
+        writer.add(3)
+        writer.add(4)
+        self.broken = False
+        self.assertEqual(writer.close(), 3)
+        self.assertEqual(self.batches, [[2, 3, 4]])
+        self.assertEqual(writer.status()["discarded"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+test_journal.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import os
+import tempfile
+from house.data.journal import EventJournal
+
+
+def change(key, state, state_text, when):
+    return [{"key": key, "name": key, "state": state, "state_text": state_text,
+             "controller": "alarm", "time": when}]
+
+
+class EventJournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.database = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.journal = EventJournal(database=self.database, capacity=2)
+        self.journal.record(change("zone9", "1", "open", 100.0))
+        self.journal.record(change("zone9", "0", "closed", 200.0))
+        self.journal.record(change("zone1", "1", "closed", 300.0))
+
+    def tearDown(self):
+        os.remove(self.database)
+
+    def test_since_memory(self):
+        events = self.journal.since(150.0)
+        self.assertEqual([event["time"] for event in events], [200.0, 300.0])
+
+    def test_since_database(self):
+        # A new journal has nothing in memory
+        journal = EventJournal(database=self.database)
+        events = journal.since(50.0)
+        self.assertEqual([event["zone"] for event in events], ["zone9", "zone9", "zone1"])
+
+    def test_last_event(self):
+        self.assertEqual(self.journal.last_event("zone9", "open")["time"], 100.0)
+        journal = EventJournal(database=self.database)
+        self.assertEqual(journal.last_event("zone9", "closed")["time"], 200.0)
+        self.assertIsNone(journal.last_event("zone2", "open"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+test_migrations.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import shutil
+import sqlite3
+import tempfile
+import os
+from datetime import datetime, timedelta
+from house.data.migrations import migrate, schema_version, BASE_TABLES_SQL, DEFAULT_SCHEDULE_SQL, SCHEMA_VERSION
+from house.data.retention import prune, vacuum_mode
+
+
+NOW = datetime(2016, 5, 1, 3)
+
+
+class MigrationsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.conn = sqlite3.connect(os.path.join(self.directory, "house.db"))
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.directory)
+
+    def old_database(self):
+        """
+        A database from before migrations, with history written to outside_humdity
+        """
+        for statement in BASE_TABLES_SQL:
+            self.conn.execute(statement)
+        self.conn.execute("ALTER TABLE history ADD COLUMN outside_humdity INTEGER")
+        self.conn.executemany("INSERT INTO history (entryDate, inside_temp, outside_humdity) VALUES (?, ?, ?)",
+                              [(NOW - timedelta(hours=6 * index), 70, 40) for index in range(40)])
+        self.conn.commit()
+
+    def test_upgrade(self):
+        self.old_database()
+        self.assertEqual(schema_version(self.conn), 0)
+        self.assertEqual(migrate(self.conn), range(1, SCHEMA_VERSION + 1))
+        self.assertEqual(migrate(self.conn), [])
+        self.assertEqual(schema_version(self.conn), SCHEMA_VERSION)
+
+        moved = self.conn.execute("SELECT COUNT(*) FROM history WHERE outside_humidity = 40").fetchone()[0]
+        self.assertEqual(moved, 40)
+        # The file is not rewritten while migrating, only by the daily upkeep
+        self.assertEqual(self.conn.execute("PRAGMA auto_vacuum").fetchone()[0], 0)
+        self.assertTrue(vacuum_mode(self.conn))
+        self.assertEqual(self.conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        self.assertFalse(vacuum_mode(self.conn))
+        indexes = set(row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'"))
+        self.assertTrue(set(["history_entry_date", "cycles_date_schedule"]) <= indexes)
+        self.assertTrue(self.conn.execute("SELECT COUNT(*) FROM history_daily").fetchone()[0] > 0)
+        # An old database keeps its schedule
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM schedule").fetchone()[0], 0)
+
+    def test_new_database(self):
+        migrate(self.conn)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM schedule").fetchone()[0], 4)
+        self.assertEqual(self.conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        self.assertFalse(vacuum_mode(self.conn))
+
+    def test_default_schedule_once(self):
+        # A second service that also found no schedule table adds nothing
+        migrate(self.conn)
+        other = sqlite3.connect(os.path.join(self.directory, "house.db"))
+        other.execute(DEFAULT_SCHEDULE_SQL)
+        other.commit()
+        other.close()
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM schedule").fetchone()[0], 4)
+
+    def test_retention(self):
+        self.old_database()
+        migrate(self.conn)
+        vacuum_mode(self.conn)
+        archive = os.path.join(self.directory, "archive.db")
+        removed = prune(self.conn, NOW, {"history_days": 5}, archive_path=archive, batch=7)
+        # Samples 6 hours apart back from 3 AM.  The 21 since midnight five days ago are kept.
+        self.assertEqual(removed, {"history": 19, "zone_history": 0, "alarm_zone_history": 0, "alarm_events": 0})
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM history").fetchone()[0], 21)
+        self.assertEqual(self.conn.execute("PRAGMA freelist_count").fetchone()[0], 0)
+        archived = sqlite3.connect(archive)
+        self.assertEqual(archived.execute("SELECT COUNT(*) FROM history WHERE outside_humidity = 40").fetchone()[0], 19)
+        archived.close()
+        # The daily rollups outlive the samples
+        self.assertEqual(self.conn.execute("SELECT SUM(samples) FROM history_daily").fetchone()[0], 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+test_rollups.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import shutil
+import tempfile
+import os
+from datetime import datetime, timedelta
+from house.data import service_data
+from house.data.rollups import choose_resolution
+
+
+START = datetime(2016, 5, 1)
+
+
+class RollupsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database = service_data.DATABASE.using(os.path.join(self.directory, "house.db"))
+        self.database.__enter__()
+        service_data.create_database()
+        # Two days of samples every 15 minutes.  Zone 1 is open one sample in four.
+        service_data.write_history([{"entryDate": START + timedelta(minutes=15 * index),
+                                     "inside_temp": 70 + index % 4, "fan_state": index % 2,
+                                     "alarm_zone1": 0 if index % 4 == 0 else 1}
+                                    for index in range(2 * 96)])
+
+    def tearDown(self):
+        self.database.__exit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+    def test_resolution(self):
+        self.assertEqual(choose_resolution(START, START + timedelta(hours=6), 100, 24), "raw")
+        self.assertEqual(choose_resolution(START, START + timedelta(days=3), 100, 288), "hour")
+        self.assertEqual(choose_resolution(START, START + timedelta(days=30), 100, 2880), "day")
+
+    def test_rollups(self):
+        hourly = service_data.retrieve_history_range(START, START + timedelta(days=2), 60)
+        self.assertEqual(hourly["resolution"], "hour")
+        self.assertEqual(len(hourly["rows"]), 48)
+        hour = hourly["rows"][0]
+        self.assertEqual((hour["samples"], hour["inside_temp_min"], hour["inside_temp_max"]), (4, 70, 73))
+        self.assertEqual(hour["inside_temp"], 71.5)
+        self.assertEqual(hour["fan_duty"], 0.5)
+        self.assertEqual(hour["alarm_zone1_open_seconds"], 900)
+
+        daily = service_data.retrieve_history_range(START, START + timedelta(days=2), 10)
+        self.assertEqual(daily["resolution"], "day")
+        self.assertEqual([day["samples"] for day in daily["rows"]], [96, 96])
+        self.assertEqual(daily["rows"][1]["alarm_zone1_open_seconds"], 6 * 3600)
+
+        raw = service_data.retrieve_history_range(START, START + timedelta(hours=1), 10)
+        self.assertEqual((raw["resolution"], len(raw["rows"])), ("raw", 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+test_segments.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import shutil
+import tempfile
+import os
+from datetime import datetime, timedelta
+from house.data import service_data
+from house.data.convert_history import to_segments, to_table
+from house.data.segments import SegmentStore, to_epoch
+
+
+START = datetime(2016, 5, 1, 22)
+
+FIELDS = ["fan_state", "alarm_zone1", "inside_temp"]
+
+
+class SegmentStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = SegmentStore(os.path.join(self.directory, "history"), FIELDS)
+        # Four hours of samples every minute, across midnight
+        self.store.append([{"entryDate": START + timedelta(minutes=index), "fan_state": index % 2,
+                            "inside_temp": 70.1 + index % 3} for index in range(240)])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_range(self):
+        self.assertEqual(len(self.store.days()), 2)
+        start = START + timedelta(minutes=100)
+        rows = list(self.store.rows(start, start + timedelta(minutes=50)))
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(rows[0], (to_epoch(start), 0, None, 71.1))
+        self.assertEqual(self.store.count(START + timedelta(hours=1, minutes=30)), 150)
+        self.assertEqual(sum(len(part) for part in self.store.slices()), 240 * self.store.layout.size)
+
+    def test_out_of_order(self):
+        late = START + timedelta(minutes=30, seconds=30)
+        self.store.append([{"entryDate": late, "inside_temp": 1.5}])
+        rows = list(self.store.rows(START + timedelta(minutes=30), START + timedelta(minutes=32)))
+        self.assertEqual([row[3] for row in rows], [70.1, 1.5, 71.1])
+
+    def test_layout_kept(self):
+        store = SegmentStore(self.store.directory, ["something", "else"])
+        self.assertEqual(store.fields, FIELDS)
+        self.assertEqual(store.count(), 240)
+
+    def test_convert(self):
+        with service_data.DATABASE.using(os.path.join(self.directory, "house.db")):
+            service_data.create_database()
+            self.assertEqual(to_table(self.store, batch=100), 240)
+            copy = SegmentStore(os.path.join(self.directory, "copy"), FIELDS)
+            self.assertEqual(to_segments(copy, batch=100), 240)
+        self.assertEqual(list(copy.rows()), list(self.store.rows()))
+
+    def test_chunks(self):
+        # More records than one unpack, with NULL states and floats
+        store = SegmentStore(os.path.join(self.directory, "chunks"), FIELDS)
+        samples = [{"entryDate": START + timedelta(seconds=index), "fan_state": index % 2 or None,
+                    "inside_temp": None if index % 5 == 0 else 70.1 + index % 7} for index in range(600)]
+        store.append(samples)
+        rows = list(store.rows())
+        self.assertEqual(len(rows), 600)
+        self.assertEqual(rows, [store.layout.unpack(data, index * store.layout.size)
+                                for data, first, last in store.spans() for index in range(first, last)])
+        self.assertEqual([row[1] for row in rows[:3]], [None, 1, None])
+        self.assertEqual([row[3] for row in rows[:3]], [None, 71.1, 72.1])
+        self.assertEqual(len(store.columns()["inside_temp"]), 600)
+
+    def test_store_and_table(self):
+        with service_data.DATABASE.using(os.path.join(self.directory, "house.db")):
+            service_data.create_database()
+            service_data.HISTORY_STORE = SegmentStore(os.path.join(self.directory, "written"),
+                                                      service_data.HISTORY_FIELDS)
+            try:
+                service_data.write_history([{"entryDate": START + timedelta(minutes=index), "inside_temp": 70.5,
+                                             "irrigation_zone1": 1} for index in range(120)])
+                self.assertEqual(service_data.HISTORY_STORE.count(), 120)
+                # The table, its rollups and the stream have the samples too
+                _unused, chunks = service_data.history_stream()
+                self.assertEqual(sum(len(chunk) for chunk in chunks), 120)
+                hourly = service_data.DATABASE.connection().execute("SELECT SUM(samples) FROM history_hourly")
+                self.assertEqual(hourly.fetchone()[0], 120)
+
+                raw = service_data.retrieve_history_range(START, START + timedelta(hours=2), 500)
+                self.assertEqual((raw["resolution"], len(raw["rows"])), ("raw", 120))
+                self.assertEqual(raw["rows"][0]["inside_temp"], 70.5)
+                hours = service_data.retrieve_history_range(START, START + timedelta(hours=2), 100)
+                self.assertEqual(hours["resolution"], "hour")
+            finally:
+                service_data.HISTORY_STORE = None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+test_clock.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import time
+from datetime import datetime, timedelta
+from threading import Event
+from house.irrigation.clock import VirtualClock
+from house.irrigation.scheduler import IrrigationScheduler
+
+
+START = datetime(2016, 5, 2)
+
+
+class VirtualClockTestCase(unittest.TestCase):
+
+    def test_sleep(self):
+        clock = VirtualClock(START)
+        started = time.time()
+        clock.sleep(30 * 24 * 3600)
+        self.assertEqual(clock.now(), START + timedelta(days=30))
+        self.assertEqual(clock.time() - time.mktime(START.timetuple()), 30 * 24 * 3600)
+        self.assertLess(time.time() - started, 1)
+        self.assertFalse(clock.wait(Event(), 60))
+        self.assertEqual(clock.now(), START + timedelta(days=30, minutes=1))
+
+    def test_parallel_threads(self):
+        clock = VirtualClock(START)
+        valves = clock.semaphore(2)
+        finished = dict()
+
+        def lane(name, minutes):
+            with valves:
+                clock.sleep(minutes * 60)
+            finished[name] = clock.now()
+
+        threads = [clock.thread(lane, name, (name, minutes)) for name, minutes in (("a", 30), ("b", 10), ("c", 10))]
+        clock.join(threads)
+        # c waits for b's valve
+        self.assertEqual(finished, {"a": START + timedelta(minutes=30),
+                                    "b": START + timedelta(minutes=10),
+                                    "c": START + timedelta(minutes=20)})
+
+    def test_scheduler(self):
+        clock = VirtualClock(START)
+        rows = [(1, 0, 4 * 60, 6 * 60, None, None, 30, 30)]
+        scheduler = IrrigationScheduler(load=lambda: rows, exclusions=lambda: [], completed=lambda now: [],
+                                        clock=clock.now, sleeper=clock.wait)
+        window = scheduler.wait()
+        self.assertEqual(window.schedule_id, 1)
+        self.assertEqual(clock.now(), START + timedelta(hours=4))
+        scheduler.mark_run(window)
+        self.assertEqual(scheduler.wait(until=START + timedelta(days=1)), None)
+        self.assertEqual(scheduler.wait().start, START + timedelta(days=7, hours=4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+test_cycle.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+from datetime import datetime
+from house.irrigation.clock import VirtualClock
+from house.irrigation.cycle import cycle_milliseconds, cycle_deadline, wait_for_cycle, CYCLE_MARGIN
+
+
+START = datetime(2016, 5, 1)
+
+
+class CycleTimer(object):
+    """
+    The controller's cycle timer.  It runs rate times as fast as the clock.
+    """
+
+    def __init__(self, clock, milliseconds, rate=1.0):
+        self.clock = clock
+        self.rate = rate
+        self.started = clock.time()
+        self.milliseconds = milliseconds
+        self.reads = list()
+        self.restart_at = None
+
+    def remaining(self):
+        if self.restart_at is not None and self.clock.time() >= self.restart_at:
+            # A restarted controller has no cycle
+            return 0
+        elapsed = (self.clock.time() - self.started) * 1000 * self.rate
+        # cycle_end - millis() on the controller is an unsigned long
+        return int(round(self.milliseconds - elapsed)) % 2 ** 32
+
+    def state(self):
+        self.reads.append(self.clock.time() - self.started)
+        return {"zone1": "1", "zone2": "0", "zone3": "0", "zone4": "0",
+                "cycle_milliseconds": str(self.remaining())}
+
+
+class CycleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock(START)
+
+    def test_milliseconds(self):
+        self.assertEqual(cycle_milliseconds({"cycle_milliseconds": "0"}), 0)
+        self.assertEqual(cycle_milliseconds({"cycle_milliseconds": "60000"}), 60000)
+        self.assertEqual(cycle_milliseconds({"cycle_milliseconds": str(2 ** 31 - 1)}), 2 ** 31 - 1)
+        # The timer ran out 250ms ago
+        self.assertEqual(cycle_milliseconds({"cycle_milliseconds": str(2 ** 32 - 250)}), 0)
+
+    def test_deadline(self):
+        self.assertEqual(cycle_deadline({"cycle_milliseconds": "90500"}, self.clock) - self.clock.time(), 90.5)
+        self.assertEqual(cycle_deadline({"cycle_milliseconds": str(2 ** 32 - 1)}, self.clock), self.clock.time())
+
+    def test_on_time(self):
+        timer = CycleTimer(self.clock, 600 * 1000)
+        wait_for_cycle(timer.state, self.clock, cycle_deadline(timer.state(), self.clock), interval=300)
+        # Checked every interval until the timer runs out
+        self.assertEqual(timer.reads, [0, 300, 600])
+
+    def test_no_cycle(self):
+        timer = CycleTimer(self.clock, 0)
+        wait_for_cycle(timer.state, self.clock, interval=300)
+        self.assertEqual(timer.reads, [0])
+
+    def test_read_first(self):
+        timer = CycleTimer(self.clock, 100 * 1000)
+        wait_for_cycle(timer.state, self.clock, interval=300)
+        self.assertEqual(timer.reads, [0, 100 + CYCLE_MARGIN])
+
+    def test_drift(self):
+        # The controller's clock runs 5% slow, so its cycle ends 30 seconds after the local deadline
+        timer = CycleTimer(self.clock, 570 * 1000, rate=0.95)
+        wait_for_cycle(timer.state, self.clock, self.clock.time() + 570, interval=300)
+        # At the first check the controller has 285 seconds left, not 270
+        self.assertEqual(timer.reads[:2], [300, 585 + CYCLE_MARGIN])
+        # Not before the controller's timer ran out
+        self.assertGreaterEqual(timer.reads[-1] * 0.95, 570)
+        self.assertAlmostEqual(timer.reads[-1], 600 + CYCLE_MARGIN, delta=CYCLE_MARGIN)
+
+    def test_restart(self):
+        # The controller restarted 100 seconds in and lost the cycle
+        timer = CycleTimer(self.clock, 3600 * 1000)
+        timer.restart_at = timer.started + 100
+        wait_for_cycle(timer.state, self.clock, self.clock.time() + 3600, interval=300)
+        self.assertEqual(timer.reads, [300])
+
+    def test_unsigned_wrap(self):
+        # The controller timer runs 1% fast and has just run out when it is checked
+        timer = CycleTimer(self.clock, 60 * 1000, rate=1.01)
+        wait_for_cycle(timer.state, self.clock, self.clock.time() + 60, interval=300)
+        self.assertEqual(timer.reads, [60 + CYCLE_MARGIN])
+        self.assertGreaterEqual(timer.remaining(), 2 ** 31)
+
+
+if __name__ == '__main__':
+    unittest.main()
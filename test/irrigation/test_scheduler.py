@@ -0,0 +1,114 @@
+"""
+test_scheduler.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+from datetime import datetime, timedelta
+from house.irrigation.scheduler import IrrigationScheduler, ScheduleIndex, load_rules
+
+
+# Sunday 4:00-6:00, Wednesday 21:15-23:00 and every day 23:30-00:30 in June
+SCHEDULE = [(1, 6, 240, 360, None, None, 30, 30, 0, 0),
+            (2, 2, 1275, 1380, None, None, 10, 0, 0, 0),
+            (3, None, 1410, 30, "2016-06-01", "2016-06-30", 0, 0, 5, 5)]
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Wednesday
+        self.now = datetime(2016, 6, 1, 12, 0)
+        self.completed = []
+        self.exclusions = [(3, "2016-06-02")]
+        self.schedule = list(SCHEDULE)
+        self.scheduler = IrrigationScheduler(load=lambda: self.schedule,
+                                             exclusions=lambda: self.exclusions,
+                                             completed=lambda date: self.completed,
+                                             clock=lambda: self.now)
+
+    def test_index(self):
+        index = ScheduleIndex(load_rules(SCHEDULE, self.exclusions))
+        self.assertEqual([window.schedule_id for window in index.active(datetime(2016, 6, 5, 4, 59))], [1])
+        # Past midnight: the window opened on Saturday
+        window = index.active(datetime(2016, 6, 5, 0, 10))[0]
+        self.assertEqual((window.schedule_id, window.start), (3, datetime(2016, 6, 4, 23, 30)))
+        # The Monday window crosses from the end of the week
+        self.assertEqual([window.start for window in index.active(datetime(2016, 6, 6, 0, 15))],
+                         [datetime(2016, 6, 5, 23, 30)])
+        window = index.next_window(self.now)
+        self.assertEqual((window.schedule_id, window.start), (2, datetime(2016, 6, 1, 21, 15)))
+
+    def test_dates(self):
+        index = ScheduleIndex(load_rules(SCHEDULE, self.exclusions))
+        # Excluded on June 2nd
+        window = index.next_window(datetime(2016, 6, 2, 0, 40))
+        self.assertEqual((window.schedule_id, window.start), (3, datetime(2016, 6, 3, 23, 30)))
+        # Ends with June
+        self.assertEqual(index.active(datetime(2016, 6, 30, 23, 45))[0].schedule_id, 3)
+        self.assertEqual(index.active(datetime(2016, 7, 1, 23, 45)), [])
+
+    def test_due(self):
+        self.assertEqual(self.scheduler.due(), None)
+        self.assertEqual(self.scheduler.next_due().schedule_id, 2)
+        self.now = datetime(2016, 6, 1, 21, 30)
+        window = self.scheduler.due()
+        self.assertEqual(window.schedule_id, 2)
+        self.assertEqual(window.durations, (10, 0, 0, 0))
+        # Due until its cycle is recorded, then runs once per window
+        self.assertEqual(self.scheduler.due().key(), window.key())
+        self.scheduler.mark_run(window)
+        self.assertEqual(self.scheduler.due(), None)
+        self.assertEqual(self.scheduler.next_due().schedule_id, 3)
+
+    def test_failed_start(self):
+        # The weather read failed before the cycle was recorded.  The window is tried again.
+        self.now = datetime(2016, 6, 1, 21, 30)
+        self.assertEqual(self.scheduler.wait().schedule_id, 2)
+        self.scheduler.refresh()
+        self.now = datetime(2016, 6, 1, 21, 31)
+        self.assertEqual(self.scheduler.wait().schedule_id, 2)
+
+    def test_completed_today(self):
+        self.now = datetime(2016, 6, 1, 22, 0)
+        self.completed = [2]
+        self.assertEqual(self.scheduler.due(), None)
+
+    def test_completed_before_midnight(self):
+        # Restarted past midnight.  Schedule 3 opened at 23:30 and its cycle was recorded under that day.
+        self.now = datetime(2016, 6, 4, 0, 10)
+        scheduler = IrrigationScheduler(load=lambda: self.schedule, exclusions=lambda: self.exclusions,
+                                        completed=lambda date: [3] if date.day == 3 else [],
+                                        clock=lambda: self.now)
+        self.assertEqual(scheduler.due(), None)
+        self.assertEqual(self.scheduler.due().start, datetime(2016, 6, 3, 23, 30))
+
+    def test_wait_until(self):
+        self.scheduler.rebuild()
+        self.assertEqual(self.scheduler.wait(until=self.now - timedelta(seconds=1)), None)
+
+    def test_refresh(self):
+        self.scheduler.rebuild()
+        self.schedule.append((4, 2, 720, 780, None, None, 5, 5, 5, 5))
+        self.scheduler.refresh()
+        self.assertEqual(self.scheduler.wait().schedule_id, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+test_zones.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+from ConfigParser import ConfigParser
+from house.irrigation.zones import configured_zones, controller_lanes, find_zone, zones_history, zones_state
+from house.irrigation.zones import zones_status
+from house.irrigation.sprinkler import state_data, status_data, zone_command
+
+
+def read_state(host, port):
+    """
+    sprinkler_state() of a front controller with 4 relays and a back controller with 10
+    """
+    if host == "front":
+        return state_data("0:1:0:0:0\r\n")
+    return state_data("0:0:0:0:0:0:0:0:0:1:60000")
+
+
+class IrrigationZonesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = ConfigParser()
+        self.settings.add_section("irrigation")
+        self.settings.set("irrigation", "controllers", "front:8888, back:8888")
+        self.settings.set("irrigation", "zone_names", "Lawn, Beds")
+
+    def test_layout(self):
+        zones = configured_zones(self.settings)
+        self.assertEqual(len(zones), 8)
+        self.assertEqual(zones[0].name, "Lawn")
+        self.assertEqual(zones[2].name, "ZONE 3")
+        self.assertEqual(find_zone(zones, 6).controller, ("back", "8888"))
+        self.assertEqual(find_zone(zones, 6).relay, 2)
+        self.assertEqual(find_zone(zones, 9), None)
+
+    def test_single_controller(self):
+        settings = ConfigParser()
+        settings.add_section("irrigation")
+        settings.set("irrigation", "irrigation_host", "sprinkler")
+        settings.set("irrigation", "irrigation_port", "8888")
+        self.assertEqual([zone.relay for zone in configured_zones(settings)], [1, 2, 3, 4])
+
+    def test_lanes(self):
+        zones = configured_zones(self.settings)
+        lanes = controller_lanes(zones, [30, 0, 10, 0, 0, 20, 0, None])
+        self.assertEqual([[(zone.number, duration) for zone, duration in lane] for lane in lanes],
+                         [[(1, 30), (3, 10)], [(6, 20)]])
+
+    def test_relay_count(self):
+        self.settings.set("irrigation", "zones_per_controller", "10")
+        zones = configured_zones(self.settings)
+        self.assertEqual(len(zones), 20)
+        self.assertEqual(zone_command(find_zone(zones, 20).relay, "on"), "zone10-on")
+        self.assertEqual(zone_command(3, "off"), "zone03-off")
+        self.assertRaises(ValueError, zone_command, 100, "on")
+
+        for count in ("0", "100"):
+            self.settings.set("irrigation", "zones_per_controller", count)
+            self.assertRaises(ValueError, configured_zones, self.settings)
+
+    def test_wide_status(self):
+        state = read_state("back", "8888")
+        self.assertEqual(state["zone10"], "1")
+        self.assertEqual(state["cycle_milliseconds"], "60000")
+        status = status_data(state)
+        self.assertEqual([zone["zone"] for zone in status["zones"]][8:], ["zone9", "zone10"])
+        self.assertEqual(status["zones"][9]["status"], "on")
+
+    def test_property_state(self):
+        self.settings.set("irrigation", "zones_per_controller", "10")
+        zones = configured_zones(self.settings)
+        state = zones_state(zones, read_state)
+        self.assertEqual(state["cycle_milliseconds"], "60000")
+        self.assertEqual(state["zone2"], "1")
+        self.assertEqual(state["zone20"], "1")
+        # The front controller only has 4 relays
+        self.assertFalse("zone5" in state)
+        self.assertEqual(len(state), 15)
+
+        status = zones_status(zones, state)
+        self.assertEqual([zone["zone"] for zone in status["zones"]][:5], ["zone1", "zone2", "zone3", "zone4", "zone11"])
+        self.assertEqual(status["zones"][0]["description"], "Lawn")
+        self.assertEqual([zone["zone"] for zone in status["zones"] if zone["status"] == "on"], ["zone2", "zone20"])
+
+    def test_history(self):
+        self.settings.set("irrigation", "zones_per_controller", "10")
+        history = zones_history(configured_zones(self.settings), read_state)
+        self.assertEqual(history["irrigation_zone2"], "1")
+        self.assertEqual(history["irrigation_zone20"], "1")
+        # The relays the front controller does not have are not recorded
+        self.assertEqual(sorted(int(key[15:]) for key in history), [1, 2, 3, 4] + range(11, 21))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+test_events.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+import json
+import time
+from threading import Thread
+from house.services.events import EventHub, event_data, server_sent_events
+
+
+class EventHubTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.hub = EventHub(capacity=3)
+
+    def test_after(self):
+        for number in range(5):
+            self.assertEqual(self.hub.publish("alarm", number), number + 1)
+        self.assertEqual(self.hub.latest(), 5)
+        with self.hub.condition:
+            # Only the last 3 are kept
+            self.assertEqual([event[0] for event in self.hub.after(0)], [3, 4, 5])
+            self.assertEqual([event[3] for event in self.hub.after(3)], [3, 4])
+            self.assertEqual(self.hub.after(5), [])
+
+    def test_wait_timeout(self):
+        started = time.time()
+        self.assertEqual(self.hub.wait(0, 0.1), [])
+        self.assertGreaterEqual(time.time() - started, 0.09)
+
+    def test_wait_wakes(self):
+        publisher = Thread(group=None, target=lambda: (time.sleep(0.05), self.hub.publish("irrigation", "on")))
+        publisher.start()
+        events = self.hub.wait(self.hub.latest(), 5)
+        publisher.join()
+        self.assertEqual([(event[0], event[1], event[3]) for event in events], [(1, "irrigation", "on")])
+
+    def test_restart(self):
+        # A client still holding an id from before the service restarted
+        for number in range(3):
+            self.hub.publish("alarm", number)
+        self.assertEqual(self.hub.resume(500), 0)
+        self.assertEqual(self.hub.resume(2), 2)
+        self.assertEqual([event[0] for event in self.hub.wait(500, 0.2)], [1, 2, 3])
+
+    def test_event_data(self):
+        self.assertEqual(event_data((7, "alarm", 100.0, [])), {"id": 7, "topic": "alarm", "time": 100.0, "data": []})
+
+
+class ServerSentEventsTestCase(unittest.TestCase):
+
+    def test_stream(self):
+        hub = EventHub()
+        stream = server_sent_events(hub, 0, heartbeat=0.05)
+        self.assertEqual(next(stream), "retry: 2000\n\n")
+        self.assertEqual(next(stream), ": keep-alive\n\n")
+
+        hub.publish("alarm", {"key": "zone1"})
+        hub.publish("irrigation", {"zone1": "on"})
+        chunk = next(stream)
+        messages = chunk.split("\n\n")[:-1]
+        self.assertEqual(len(messages), 2)
+        lines = messages[1].split("\n")
+        self.assertEqual(lines[:2], ["id: 2", "event: irrigation"])
+        self.assertEqual(json.loads(lines[2][len("data: "):])["data"], {"zone1": "on"})
+
+        # The stream carries on after the last id it sent
+        self.assertEqual(next(stream), ": keep-alive\n\n")
+        hub.publish("alarm", {"key": "zone2"})
+        self.assertTrue(next(stream).startswith("id: 3\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+test_irrigation_monitor.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+from house.services.irrigation_monitor import IrrigationMonitor
+from house.irrigation.zones import zone_layout
+
+
+def controller_state(zones, milliseconds=0):
+    """
+    sprinkler_state() of the valves in zones
+    """
+    state = dict(("zone%s" % zone, "1" if zone in zones else "0") for zone in range(1, 5))
+    state["cycle_milliseconds"] = str(milliseconds)
+    return state
+
+
+class IrrigationMonitorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.monitor = IrrigationMonitor(zone_layout([("localhost", 80)], names=["Lawn"]))
+        self.statuses = list()
+        self.monitor.add_handler(self.statuses.append)
+
+    def test_changes(self):
+        self.monitor.check(controller_state([]))
+        self.monitor.check(controller_state([]))
+        self.assertEqual(len(self.statuses), 1)
+
+        self.monitor.check(controller_state([2], 60000))
+        self.assertEqual(len(self.statuses), 2)
+        zones = dict((zone["zone"], zone["status"]) for zone in self.statuses[-1]["zones"])
+        self.assertEqual(zones, {"zone1": "off", "zone2": "on", "zone3": "off", "zone4": "off"})
+        self.assertEqual(self.statuses[-1]["zones"][0]["description"], "Lawn")
+        self.assertEqual(self.statuses[-1]["cycle_milliseconds"], "60000")
+
+        # Only the cycle time counting down is not a change
+        self.monitor.check(controller_state([2], 55000))
+        self.assertEqual(len(self.statuses), 2)
+
+        # The cycle ended
+        self.monitor.check(controller_state([2]))
+        self.assertEqual(len(self.statuses), 3)
+
+    def test_handler_error(self):
+        def broken(status):
+            raise ValueError("handler failed")
+
+        self.monitor.handlers.insert(0, broken)
+        self.monitor.check(controller_state([1]))
+        self.assertEqual(len(self.statuses), 1)
+
+    def test_disabled(self):
+        self.monitor.enable(False)
+        self.monitor.begin()
+        self.assertEqual(self.statuses, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+test_simulator.py
+Unit test
+
+Copyright (C) 2013-2016  Bob Helander
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import unittest
+from house.simulator.alarm import AlarmSimulator
+from house.simulator.sprinkler import SprinklerSimulator
+from house.controllers.transport import one_shot_request, send_request, close_pools
+
+
+class SimulatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        clock = lambda: self.now
+        self.alarm = AlarmSimulator(clock=clock).start()
+        self.sprinkler = SprinklerSimulator(clock=clock).start()
+
+    def tearDown(self):
+        close_pools()
+        self.alarm.stop()
+        self.sprinkler.stop()
+
+    def test_alarm_flapping(self):
+        self.alarm.set_zone(9, 1)
+        self.alarm.flap(2, 1.0)
+        self.assertEqual(one_shot_request("status", self.alarm.host, self.alarm.port), "0:0:0:0:0:0:0:0:1")
+        self.now += 1.5
+        self.assertEqual(send_request("status", self.alarm.host, self.alarm.port), "0:1:0:0:0:0:0:0:1")
+        self.now += 1.0
+        self.assertEqual(send_request("status", self.alarm.host, self.alarm.port), "0:0:0:0:0:0:0:0:1")
+
+    def test_cycle_countdown(self):
+        host, port = self.sprinkler.host, self.sprinkler.port
+        self.assertEqual(send_request("zone02-on", host, port), "Done")
+        self.assertEqual(send_request("startcycle-5000", host, port), "0:1:0:0:5000")
+        self.now += 2
+        self.assertEqual(send_request("status", host, port), "0:1:0:0:3000")
+        self.now += 4
+        # The cycle ran out and turned the relays off
+        self.assertEqual(send_request("status", host, port), "0:0:0:0:0")
+
+    def test_unknown(self):
+        self.assertEqual(send_request("zone09-on", self.sprinkler.host, self.sprinkler.port), "unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()